@@ -0,0 +1,112 @@
+"""
+Root-node load of flat versus hierarchical (tree) federated aggregation.
+"""
+
+import asyncio
+import timeit
+import numpy as np
+from src.ai_nodes import AINode, ModelUpdate
+from src.ai_nodes.hierarchy import build_aggregation_tree, collect_partial
+from benchmarks.models import BenchModel
+
+class AggregationTopologyBenchmark:
+    """Compare what the root node receives and computes in each topology."""
+
+    def __init__(self, num_nodes=256, fanout=8, tensor_shape=(256, 256)):
+        self.num_nodes = num_nodes
+        self.fanout = fanout
+        self.tensor_shape = tensor_shape
+        self.nodes = {}
+        self.updates = {}
+        # One loop for every sample, so loop setup is not timed
+        self.loop = asyncio.new_event_loop()
+
+    def setup(self):
+        """Create nodes with one local update each and a full peer mesh."""
+        print(f"Setting up {self.num_nodes} nodes with {self.tensor_shape} tensors...")
+        rng = np.random.default_rng(0)
+        ids = [f"node_{i}" for i in range(self.num_nodes)]
+        for node_id in ids:
+            weights = {"dense/kernel": rng.random(self.tensor_shape, dtype=np.float32)}
+            node = AINode(node_id, BenchModel(weights))
+            update = ModelUpdate(node_id, weights, int(rng.integers(10, 1000)), 0.0)
+            node.updates[node_id] = update
+            self.updates[node_id] = update
+            self.nodes[node_id] = node
+        for node in self.nodes.values():
+            for peer_id in ids:
+                if peer_id != node.node_id:
+                    node.add_peer(peer_id)
+
+    def benchmark_flat(self, num_runs=20):
+        """The root receives every peer's full update and averages them."""
+        root = self.nodes["node_0"]
+        root.updates = dict(self.updates)
+        inbound = [u for k, u in self.updates.items() if k != root.node_id]
+
+        def _aggregate():
+            self.loop.run_until_complete(root.aggregate_updates())
+
+        times = timeit.repeat(_aggregate, number=1, repeat=num_runs)
+        return self._report("Flat", times, len(inbound),
+                            sum(u.weights["dense/kernel"].nbytes for u in inbound))
+
+    def benchmark_tree(self, num_runs=20):
+        """The root receives one pre-aggregated partial per child."""
+        root = self.nodes["node_0"]
+        root.updates = {root.node_id: self.updates[root.node_id]}
+        tree = build_aggregation_tree(self.nodes, root.node_id, self.fanout)
+        partials = [root.partial_aggregate()]
+        partials.extend(
+            self.loop.run_until_complete(collect_partial(self.nodes, tree, child))
+            for child in tree[root.node_id]
+        )
+
+        def _aggregate():
+            self.loop.run_until_complete(root.aggregate_partials(partials))
+
+        times = timeit.repeat(_aggregate, number=1, repeat=num_runs)
+        return self._report("Tree", times, len(partials) - 1,
+                            sum(p.nbytes for p in partials[1:]))
+
+    def close(self):
+        """Close the event loop."""
+        self.loop.close()
+
+    def _report(self, topology, times, messages, inbound_bytes):
+        """Print and return root-node load figures."""
+        times_ms = [t * 1000 for t in times]
+        stats = {
+            "topology": topology,
+            "root_messages": messages,
+            "root_inbound_mb": inbound_bytes / 2**20,
+            "root_compute_median_ms": float(np.median(times_ms)),
+            "root_compute_p90_ms": float(np.percentile(times_ms, 90)),
+        }
+
+        print("\n" + "=" * 80)
+        print(f"{topology} Aggregation: Root Node Load")
+        print("=" * 80)
+        print(f"Messages received: {stats['root_messages']}")
+        print(f"Inbound payload: {stats['root_inbound_mb']:.2f} MiB")
+        print(f"Compute median: {stats['root_compute_median_ms']:.3f} ms")
+        print(f"Compute p90: {stats['root_compute_p90_ms']:.3f} ms")
+        print("=" * 80 + "\n")
+
+        return stats
+
+def run_all_benchmarks():
+    """Run the topology comparison and print results."""
+    benchmark = AggregationTopologyBenchmark()
+    benchmark.setup()
+
+    try:
+        return {
+            "flat": benchmark.benchmark_flat(),
+            "tree": benchmark.benchmark_tree(),
+        }
+    finally:
+        benchmark.close()
+
+if __name__ == "__main__":
+    run_all_benchmarks()
@@ -0,0 +1,40 @@
+"""
+Scaling of federated averaging in AINode.aggregate_updates.
+
+Cases vary the number of peer updates and the tensor size. Updates are
+generated once per case, outside the timed region.
+"""
+
+import asyncio
+import sys
+import numpy as np
+from src.ai_nodes import AINode, ModelUpdate
+from benchmarks.harness import Case, benchmark, main
+from benchmarks.models import BenchModel
+
+@benchmark("ai_nodes", params={"updates": [8, 32, 128], "tensor_kb": [64, 1024]}, repeat=20)
+def aggregate_updates(updates, tensor_kb):
+    """FedAvg over `updates` peer updates of two float32 tensors."""
+    rng = np.random.default_rng(0)
+    elements = tensor_kb * 1024 // 4
+    node = AINode("aggregator", BenchModel({}))
+    for i in range(updates):
+        weights = {
+            "dense/kernel": rng.random(elements, dtype=np.float32),
+            "dense/bias": rng.random(elements // 64, dtype=np.float32),
+        }
+        node.updates[f"node_{i}"] = ModelUpdate(f"node_{i}", weights, int(rng.integers(10, 1000)), 0.0)
+
+    loop = asyncio.new_event_loop()
+    return Case(
+        lambda: loop.run_until_complete(node.aggregate_updates()),
+        items=updates,
+        teardown=loop.close
+    )
+
+def run_all_benchmarks():
+    """Run the AI node suite and print results."""
+    return main(sys.argv[1:], suites=["ai_nodes"])
+
+if __name__ == "__main__":
+    sys.exit(run_all_benchmarks())
@@ -0,0 +1,81 @@
+"""
+CI/CD checksum and artifact I/O.
+
+Fixture files are written to a temporary directory before timing starts
+and removed afterwards. Cold checksum cases hash every byte; warm cases
+measure the stat-only cache path; artifact cases store and link files
+through the content-addressed store.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from src.self_contained_cicd.artifacts import ArtifactStore, clone_file
+from src.self_contained_cicd.checksum import ChecksumCache, file_sha256
+from benchmarks.harness import Case, benchmark, main
+
+def _fixture_dir(files: int, size_kb: int):
+    """Create a directory of random files and return it with its paths."""
+    root = Path(tempfile.mkdtemp(prefix="cicd-bench-"))
+    paths = []
+    for i in range(files):
+        path = root / "src" / f"file_{i:05d}.bin"
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(os.urandom(size_kb * 1024))
+        paths.append(path)
+    return root, paths
+
+@benchmark("cicd", params={"size_kb": [1024, 65536]}, repeat=10)
+def file_sha256_cold(size_kb):
+    """Hash one file from scratch."""
+    root, paths = _fixture_dir(1, size_kb)
+    return Case(lambda: file_sha256(paths[0]), items=size_kb * 1024,
+                teardown=lambda: shutil.rmtree(root))
+
+@benchmark("cicd", params={"files": [100, 1000], "size_kb": [16]}, repeat=10)
+def digest_many_cold(files, size_kb):
+    """Hash many files in parallel with an empty cache."""
+    root, paths = _fixture_dir(files, size_kb)
+    return Case(lambda: ChecksumCache().digest_many(paths), items=files,
+                teardown=lambda: shutil.rmtree(root))
+
+@benchmark("cicd", params={"files": [100, 1000], "size_kb": [16]}, repeat=20)
+def digest_many_cached(files, size_kb):
+    """Look up unchanged files in a populated cache."""
+    root, paths = _fixture_dir(files, size_kb)
+    cache = ChecksumCache()
+    cache.digest_many(paths)
+    return Case(lambda: cache.digest_many(paths), items=files,
+                teardown=lambda: shutil.rmtree(root))
+
+@benchmark("cicd", params={"size_kb": [1024, 65536]}, repeat=10)
+def clone_file_copy(size_kb):
+    """Place a copy of a file with the cheapest available mechanism."""
+    root, paths = _fixture_dir(1, size_kb)
+    target = root / "copy.bin"
+    return Case(lambda: clone_file(paths[0], target, allow_hardlink=False),
+                items=size_kb * 1024, teardown=lambda: shutil.rmtree(root))
+
+@benchmark("cicd", params={"files": [20], "size_kb": [1024]}, repeat=10)
+def artifact_store_put_link(files, size_kb):
+    """Store files as artifacts and link them under new names."""
+    root, paths = _fixture_dir(files, size_kb)
+    runs = iter(range(10 ** 6))
+
+    def put_and_link():
+        # A fresh store each run, so every file is really stored
+        store = ArtifactStore(root / f"store-{next(runs)}", ChecksumCache())
+        for path in paths:
+            digest, _ = store.put(path)
+            store.link(digest, root / "artifacts" / path.name)
+
+    return Case(put_and_link, items=files, teardown=lambda: shutil.rmtree(root))
+
+def run_all_benchmarks():
+    """Run the CI/CD suite and print results."""
+    return main(sys.argv[1:], suites=["cicd"])
+
+if __name__ == "__main__":
+    sys.exit(run_all_benchmarks())
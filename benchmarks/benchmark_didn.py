@@ -7,6 +7,9 @@ import random
 import string
 import numpy as np
 from src.didn import DIDN, Identity
+from benchmarks.harness import Case, benchmark
+
+BATCH = 100
 
 class DIDNBenchmark:
     """Benchmark suite for DIDN operations."""
@@ -45,13 +48,23 @@ class DIDNBenchmark:
             data_id = self.didn.store_data(identity_id, data, self._random_string(64))
             self.data_ids.append(data_id)
     
+    def _identity_args(self, count):
+        """Pre-generate registration arguments outside the timed region."""
+        return iter([
+            (self._random_string(), self._random_string(64), {"name": self._random_string(10)})
+            for _ in range(count)
+        ])
+    
     def benchmark_register_identity(self, num_runs=1000):
         """Benchmark identity registration."""
+        args = self._identity_args(num_runs + 10)
+        
         def _register():
+            public_key, signature, metadata = next(args)
             self.didn.register_identity(
-                public_key=self._random_string(),
-                signature=self._random_string(64),
-                metadata={"name": self._random_string(10)}
+                public_key=public_key,
+                signature=signature,
+                metadata=metadata
             )
         
         # Warm-up
@@ -67,9 +80,10 @@ class DIDNBenchmark:
         if not self.identity_ids:
             self.setup()
         
+        ids = iter(random.choices(self.identity_ids, k=num_runs + 10))
+        
         def _resolve():
-            identity_id = random.choice(self.identity_ids)
-            self.didn.resolve_identity(identity_id)
+            self.didn.resolve_identity(next(ids))
         
         # Warm-up
         for _ in range(10):
@@ -84,13 +98,18 @@ class DIDNBenchmark:
         if not self.identity_ids:
             self.setup()
         
+        args = iter([
+            (
+                random.choice(self.identity_ids),
+                {"type": "benchmark_data", "content": self._random_string(1000)},  # 1KB of random data
+                self._random_string(64)
+            )
+            for _ in range(num_runs + 10)
+        ])
+        
         def _store():
-            identity_id = random.choice(self.identity_ids)
-            data = {
-                "type": "benchmark_data",
-                "content": self._random_string(1000)  # 1KB of random data
-            }
-            self.didn.store_data(identity_id, data, self._random_string(64))
+            identity_id, data, signature = next(args)
+            self.didn.store_data(identity_id, data, signature)
         
         # Warm-up
         for _ in range(10):
@@ -105,9 +124,10 @@ class DIDNBenchmark:
         if not self.data_ids:
             self.setup()
         
+        ids = iter(random.choices(self.data_ids, k=num_runs + 10))
+        
         def _resolve():
-            data_id = random.choice(self.data_ids)
-            self.didn.resolve_data(data_id)
+            self.didn.resolve_data(next(ids))
         
         # Warm-up
         for _ in range(10):
@@ -165,5 +185,61 @@ def run_all_benchmarks():
     
     return results
 
+def _populated(identities, data_items=1000):
+    """A DIDN populated with random identities and data, plus the benchmark."""
+    random.seed(0)
+    bench = DIDNBenchmark()
+    bench.setup(identities, data_items)
+    return bench
+
+@benchmark("didn", params={"identities": [1000, 10000]}, repeat=50, warmup=2)
+def register_identity(identities):
+    """Register BATCH new identities with pre-generated keys."""
+    bench = _populated(identities)
+    batch = []
+
+    def setup():
+        batch[:] = bench._identity_args(BATCH)
+
+    def run():
+        for public_key, signature, metadata in batch:
+            bench.didn.register_identity(public_key, signature, metadata)
+
+    return Case(run, items=BATCH, setup=setup)
+
+@benchmark("didn", params={"identities": [1000, 10000]}, repeat=50, warmup=2)
+def resolve_identity(identities):
+    """Resolve BATCH random known identities."""
+    bench = _populated(identities)
+    ids = random.choices(bench.identity_ids, k=BATCH)
+    return Case(lambda: [bench.didn.resolve_identity(i) for i in ids], items=BATCH)
+
+@benchmark("didn", params={"identities": [1000]}, repeat=50, warmup=2)
+def store_data(identities):
+    """Store BATCH pre-generated 1 KB records."""
+    bench = _populated(identities)
+    batch = []
+
+    def setup():
+        batch[:] = [
+            (random.choice(bench.identity_ids),
+             {"type": "benchmark_data", "content": bench._random_string(1000)},
+             bench._random_string(64))
+            for _ in range(BATCH)
+        ]
+
+    def run():
+        for record in batch:
+            bench.didn.store_data(*record)
+
+    return Case(run, items=BATCH, setup=setup)
+
+@benchmark("didn", params={"data_items": [1000, 10000]}, repeat=50, warmup=2)
+def resolve_data(data_items):
+    """Resolve BATCH random stored records."""
+    bench = _populated(100, data_items)
+    ids = random.choices(bench.data_ids, k=BATCH)
+    return Case(lambda: [bench.didn.resolve_data(i) for i in ids], items=BATCH)
+
 if __name__ == "__main__":
     run_all_benchmarks()
@@ -0,0 +1,67 @@
+"""
+Bloom filter false-positive rate versus memory, and lookup cost.
+
+The report measures the false-positive rate of filters sized for a range
+of targets against keys that were never added, next to their size in
+bytes per key. The harness cases time adds and lookups.
+
+Usage:
+    python -m benchmarks.benchmark_filters            # report, then timings
+    python -m benchmarks.harness --suite filters      # timings only
+"""
+
+import sys
+from src.didn.filters import BloomFilter
+from benchmarks.harness import Case, benchmark, main
+
+BATCH = 1000
+PROBES = 100000
+
+def _keys(prefix, count):
+    return [f"{prefix}-{i:08d}" for i in range(count)]
+
+def fp_vs_memory(capacities=(10000, 100000), fp_rates=(0.1, 0.01, 0.001, 0.0001)):
+    """Measured false-positive rate and memory for each filter size."""
+    rows = []
+    probes = _keys("absent", PROBES)
+    for capacity in capacities:
+        keys = _keys("present", capacity)
+        for fp_rate in fp_rates:
+            bloom = BloomFilter(capacity, fp_rate)
+            bloom.update(keys)
+            measured = sum(key in bloom for key in probes) / PROBES
+            rows.append({
+                "capacity": capacity, "target": fp_rate, "measured": measured,
+                "hashes": bloom.hashes, "bytes": bloom.nbytes,
+                "bits_per_key": bloom.bits / capacity,
+            })
+    return rows
+
+def print_report(rows):
+    print(f"{'capacity':>9} {'target':>8} {'measured':>9} {'hashes':>6} {'bytes':>9} {'bits/key':>9}")
+    for row in rows:
+        print(f"{row['capacity']:>9} {row['target']:>8} {row['measured']:>9.5f} "
+              f"{row['hashes']:>6} {row['bytes']:>9} {row['bits_per_key']:>9.2f}")
+
+@benchmark("filters", params={"fp_rate": [0.01, 0.0001]}, repeat=20)
+def bloom_add(fp_rate):
+    """Add BATCH keys to a filter sized for them."""
+    keys = _keys("present", BATCH)
+    return Case(lambda: BloomFilter(BATCH, fp_rate).update(keys), items=BATCH)
+
+@benchmark("filters", params={"fp_rate": [0.01, 0.0001], "hit": [True, False]}, repeat=20)
+def bloom_contains(fp_rate, hit):
+    """Look up BATCH keys that are, or are not, in a 100k-key filter."""
+    bloom = BloomFilter(100000, fp_rate)
+    bloom.update(_keys("present", 100000))
+    probes = _keys("present" if hit else "absent", BATCH)
+    return Case(lambda: [key in bloom for key in probes], items=BATCH)
+
+def run_all_benchmarks():
+    """Print the false-positive report, then run the timing suite."""
+    print_report(fp_vs_memory())
+    print()
+    return main(sys.argv[1:], suites=["filters"])
+
+if __name__ == "__main__":
+    sys.exit(run_all_benchmarks())
@@ -0,0 +1,121 @@
+"""
+QMP loopback latency and throughput.
+
+A QMPService echoes every message back to a client over a loopback TCP
+connection. Latency cases time one request/response round trip; throughput
+cases pipeline a batch of messages and wait for all replies. Transport
+cases repeat the throughput run over TCP and Unix sockets, with uvloop
+as well when it is installed.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+from src.qmp import QMPMessage, QMPService
+from src.qmp.transports import new_event_loop, uvloop_available
+from benchmarks.harness import Case, benchmark, main
+
+BATCH = 200
+LOOPS = ["asyncio", "uvloop"] if uvloop_available() else ["asyncio"]
+
+def _frame(message: QMPMessage) -> bytes:
+    data = json.dumps(message.to_dict()).encode()
+    return len(data).to_bytes(4, "big") + data
+
+async def _read_frame(reader) -> bytes:
+    length = int.from_bytes(await reader.readexactly(4), "big")
+    return await reader.readexactly(length)
+
+def _loopback(payload_bytes: int, transport: str = "tcp", loop_kind: str = "asyncio"):
+    """Start an echo service and a connected client on a private loop."""
+    loop = new_event_loop(loop_kind)
+    service = QMPService("bench-server")
+    socket_dir = tempfile.mkdtemp(prefix="qmp-bench-") if transport == "unix" else None
+
+    async def echo(message, writer):
+        writer.write(_frame(message))
+        await writer.drain()
+
+    service.register_handler("echo", echo)
+
+    async def connect():
+        if socket_dir is not None:
+            path = await service.start(path=os.path.join(socket_dir, "qmp.sock"))
+            return await asyncio.open_unix_connection(path)
+        host, port = (await service.start("127.0.0.1", 0))[:2]
+        return await asyncio.open_connection(host, port)
+
+    reader, writer = loop.run_until_complete(connect())
+    # The payload is generated once, outside the timed region
+    message = QMPMessage(
+        content={"payload": os.urandom(payload_bytes // 2).hex()},
+        sender_id="bench-client", message_type="echo", timestamp=0.0
+    )
+    frame = _frame(message)
+
+    async def close():
+        writer.close()
+        await writer.wait_closed()
+        await service.stop()
+        # Let the server side notice the closed connection and finish
+        handlers = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+    def teardown():
+        loop.run_until_complete(close())
+        loop.close()
+        if socket_dir is not None:
+            shutil.rmtree(socket_dir)
+
+    return loop, reader, writer, frame, teardown
+
+@benchmark("qmp", params={"payload_bytes": [64, 4096, 65536]}, repeat=200, warmup=20)
+def loopback_latency(payload_bytes):
+    """One request/response round trip."""
+    loop, reader, writer, frame, teardown = _loopback(payload_bytes)
+
+    async def roundtrip():
+        writer.write(frame)
+        await writer.drain()
+        await _read_frame(reader)
+
+    return Case(lambda: loop.run_until_complete(roundtrip()), teardown=teardown)
+
+@benchmark("qmp", params={"payload_bytes": [64, 4096, 65536]}, repeat=20, warmup=2)
+def loopback_throughput(payload_bytes):
+    """A pipelined batch of messages and their replies."""
+    loop, reader, writer, frame, teardown = _loopback(payload_bytes)
+    batch = frame * BATCH
+
+    async def burst():
+        writer.write(batch)
+        await writer.drain()
+        for _ in range(BATCH):
+            await _read_frame(reader)
+
+    return Case(lambda: loop.run_until_complete(burst()), items=BATCH, teardown=teardown)
+
+@benchmark("qmp", params={"transport": ["tcp", "unix"], "loop": LOOPS, "payload_bytes": [4096]},
+           repeat=20, warmup=2)
+def transport_throughput(transport, loop, payload_bytes):
+    """A pipelined batch over each transport and event loop."""
+    event_loop, reader, writer, frame, teardown = _loopback(payload_bytes, transport, loop)
+    batch = frame * BATCH
+
+    async def burst():
+        writer.write(batch)
+        await writer.drain()
+        for _ in range(BATCH):
+            await _read_frame(reader)
+
+    return Case(lambda: event_loop.run_until_complete(burst()), items=BATCH, teardown=teardown)
+
+def run_all_benchmarks():
+    """Run the QMP suite and print results."""
+    return main(sys.argv[1:], suites=["qmp"])
+
+if __name__ == "__main__":
+    sys.exit(run_all_benchmarks())
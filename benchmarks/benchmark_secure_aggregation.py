@@ -0,0 +1,132 @@
+"""
+Overhead of pairwise-masked secure aggregation compared with plain FedAvg.
+"""
+
+import asyncio
+import timeit
+import numpy as np
+from src.ai_nodes import AINode, ModelUpdate
+from src.ai_nodes.secure_aggregation import dropped_participants
+from benchmarks.models import BenchModel
+
+class SecureAggregationBenchmark:
+    """Time masking and unmasking against plain aggregation."""
+
+    def __init__(self, num_nodes=32, tensor_shape=(256, 256), dropouts=4):
+        self.num_nodes = num_nodes
+        self.tensor_shape = tensor_shape
+        self.dropouts = dropouts
+        self.nodes = {}
+        self.aggregator = AINode("aggregator", BenchModel({}))
+        # One loop for every sample, so loop setup is not timed
+        self.loop = asyncio.new_event_loop()
+
+    def setup(self):
+        """Create nodes, exchange keys and derive pair seeds."""
+        print(f"Setting up {self.num_nodes} nodes with {self.tensor_shape} tensors...")
+        rng = np.random.default_rng(0)
+        for i in range(self.num_nodes):
+            node_id = f"node_{i:03d}"
+            weights = {"dense/kernel": rng.normal(size=self.tensor_shape).astype(np.float32)}
+            node = AINode(node_id, BenchModel(weights))
+            node.updates[node_id] = ModelUpdate(node_id, weights, int(rng.integers(10, 1000)), 0.0)
+            self.nodes[node_id] = node
+
+        public_keys = {k: n.enable_secure_aggregation() for k, n in self.nodes.items()}
+        for node in self.nodes.values():
+            node.secure_aggregation.establish(public_keys)
+
+    def benchmark_plain(self, num_runs=10):
+        """Plain FedAvg over raw updates."""
+        self.aggregator.updates = {k: n.updates[k] for k, n in self.nodes.items()}
+
+        def _aggregate():
+            self.loop.run_until_complete(self.aggregator.aggregate_updates())
+
+        times = timeit.repeat(_aggregate, number=1, repeat=num_runs)
+        return self._analyze_times(times, "Plain FedAvg (aggregator)")
+
+    def benchmark_mask(self, num_runs=10):
+        """Masking cost on a single client (n - 1 PRG masks)."""
+        node = next(iter(self.nodes.values()))
+        update = node.updates[node.node_id]
+
+        def _mask():
+            node.mask_update(update)
+
+        times = timeit.repeat(_mask, number=1, repeat=num_runs)
+        return self._analyze_times(times, "Secure: mask (per client)")
+
+    def benchmark_unmask(self, num_runs=10):
+        """Aggregator cost with every client present."""
+        masked = {k: n.mask_update(n.updates[k]) for k, n in self.nodes.items()}
+
+        def _aggregate():
+            self.loop.run_until_complete(self.aggregator.aggregate_masked(masked))
+
+        times = timeit.repeat(_aggregate, number=1, repeat=num_runs)
+        return self._analyze_times(times, "Secure: unmask (aggregator)")
+
+    def benchmark_unmask_with_dropouts(self, num_runs=10):
+        """Aggregator cost when some clients dropped after key exchange."""
+        survivors = list(self.nodes)[self.dropouts:]
+        masked = {k: self.nodes[k].mask_update(self.nodes[k].updates[k]) for k in survivors}
+        dropped = dropped_participants(masked)
+        revealed = {k: self.nodes[k].secure_aggregation.reveal_seeds(dropped) for k in survivors}
+
+        def _aggregate():
+            self.loop.run_until_complete(self.aggregator.aggregate_masked(masked, revealed))
+
+        times = timeit.repeat(_aggregate, number=1, repeat=num_runs)
+        return self._analyze_times(
+            times, f"Secure: unmask with {self.dropouts} dropouts (aggregator)"
+        )
+
+    def close(self):
+        """Close the event loop."""
+        self.loop.close()
+
+    def _analyze_times(self, times, operation_name):
+        """Analyze and print benchmark results."""
+        times_ms = [t * 1000 for t in times]
+
+        stats = {
+            "operation": operation_name,
+            "runs": len(times),
+            "min": min(times_ms),
+            "median": float(np.median(times_ms)),
+            "p90": float(np.percentile(times_ms, 90)),
+        }
+
+        print("\n" + "=" * 80)
+        print(f"{operation_name} Benchmark Results")
+        print("=" * 80)
+        print(f"Runs: {stats['runs']}")
+        print(f"Min: {stats['min']:.3f} ms")
+        print(f"Median: {stats['median']:.3f} ms")
+        print(f"90th %-tile: {stats['p90']:.3f} ms")
+        print("=" * 80 + "\n")
+
+        return stats
+
+def run_all_benchmarks():
+    """Run all benchmarks and print results."""
+    benchmark = SecureAggregationBenchmark()
+    benchmark.setup()
+
+    try:
+        results = {
+            "plain": benchmark.benchmark_plain(),
+            "mask": benchmark.benchmark_mask(),
+            "unmask": benchmark.benchmark_unmask(),
+            "unmask_dropouts": benchmark.benchmark_unmask_with_dropouts(),
+        }
+    finally:
+        benchmark.close()
+
+    overhead = results["unmask"]["median"] / results["plain"]["median"]
+    print(f"Aggregator overhead vs plain FedAvg: {overhead:.2f}x")
+    return results
+
+if __name__ == "__main__":
+    run_all_benchmarks()
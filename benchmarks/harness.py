@@ -0,0 +1,207 @@
+"""
+Unified benchmark harness with JSON results and regression gating.
+
+Benchmarks register themselves with the ``benchmark`` decorator. The
+decorated function is a factory: it receives one combination of the
+declared parameters, builds every fixture it needs and returns a ``Case``
+whose ``run`` callable is the only thing that is timed. A case that consumes
+its inputs prepares fresh ones in ``setup``, which runs untimed before every
+call of ``run``.
+
+Usage:
+    python -m benchmarks.harness                       # all suites
+    python -m benchmarks.harness --suite qmp --quick   # one suite, smallest sizes
+    python -m benchmarks.harness --output results.json
+    python -m benchmarks.harness --baseline baseline.json --threshold 0.15
+
+With ``--baseline`` the harness exits with status 1 when the median of any
+case is slower than the baseline by more than the threshold.
+"""
+
+import argparse
+import gc
+import importlib
+import itertools
+import json
+import platform
+import sys
+import time
+import timeit
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+SUITES = {
+    "didn": "benchmarks.benchmark_didn",
+    "qmp": "benchmarks.benchmark_qmp",
+    "ai_nodes": "benchmarks.benchmark_ai_nodes",
+    "cicd": "benchmarks.benchmark_cicd",
+    "filters": "benchmarks.benchmark_filters",
+}
+
+@dataclass
+class Case:
+    """A prepared benchmark: run() is timed, everything else is not."""
+    run: Callable[[], Any]
+    items: int = 1
+    teardown: Optional[Callable[[], None]] = None
+    setup: Optional[Callable[[], None]] = None
+
+@dataclass
+class Benchmark:
+    """A registered benchmark factory and its parameter grid."""
+    suite: str
+    name: str
+    factory: Callable[..., Case]
+    params: Dict[str, List[Any]] = field(default_factory=dict)
+    repeat: int = 20
+    warmup: int = 2
+
+    def combinations(self, quick: bool = False):
+        """Every parameter combination, or only the first one when quick."""
+        names = list(self.params)
+        values = [self.params[n][:1] if quick else self.params[n] for n in names]
+        for combo in itertools.product(*values):
+            yield dict(zip(names, combo))
+
+REGISTRY: List[Benchmark] = []
+
+def benchmark(suite: str, name: Optional[str] = None, params: Dict[str, List[Any]] = None,
+              repeat: int = 20, warmup: int = 2):
+    """Register a benchmark factory."""
+    def register(factory):
+        REGISTRY.append(Benchmark(suite, name or factory.__name__, factory,
+                                  params or {}, repeat, warmup))
+        return factory
+    return register
+
+def case_key(bench: Benchmark, params: Dict[str, Any]) -> str:
+    """Stable identifier of one benchmark case, used to match baselines."""
+    args = ",".join(f"{k}={v}" for k, v in params.items())
+    return f"{bench.suite}/{bench.name}[{args}]"
+
+def measure(bench: Benchmark, params: Dict[str, Any], quick: bool = False) -> Dict[str, Any]:
+    """Build a case, time it and summarise the timings."""
+    case = bench.factory(**params)
+    try:
+        for _ in range(bench.warmup):
+            if case.setup is not None:
+                case.setup()
+            case.run()
+        gc.collect()
+        repeat = min(bench.repeat, 5) if quick else bench.repeat
+        # With number=1, timeit runs setup untimed before every run
+        times = timeit.repeat(case.run, setup=case.setup or "pass", number=1, repeat=repeat)
+    finally:
+        if case.teardown is not None:
+            case.teardown()
+
+    times_ms = np.array(times) * 1000
+    median = float(np.median(times_ms))
+    return {
+        "params": params,
+        "runs": len(times),
+        "items": case.items,
+        "min": float(times_ms.min()),
+        "max": float(times_ms.max()),
+        "mean": float(times_ms.mean()),
+        "median": median,
+        "stddev": float(times_ms.std()),
+        "p90": float(np.percentile(times_ms, 90)),
+        "p99": float(np.percentile(times_ms, 99)),
+        "throughput": case.items / (median / 1000) if median else float("inf"),
+    }
+
+def load_suites(names: Optional[List[str]] = None) -> List[Benchmark]:
+    """Import suite modules so their benchmarks register."""
+    for name in names or SUITES:
+        if name not in SUITES:
+            raise SystemExit(f"Unknown suite {name!r}; choose from {', '.join(SUITES)}")
+        importlib.import_module(SUITES[name])
+    # Suites register with the importable module, even when this one is __main__
+    registry = importlib.import_module("benchmarks.harness").REGISTRY
+    wanted = set(names or SUITES)
+    benchmarks = {}
+    for bench in registry:
+        # A suite run as __main__ registers a second time when imported
+        if bench.suite in wanted:
+            benchmarks.setdefault((bench.suite, bench.name), bench)
+    return list(benchmarks.values())
+
+def run_benchmarks(benchmarks: List[Benchmark], quick: bool = False,
+                   name_filter: Optional[str] = None) -> Dict[str, Any]:
+    """Run every case and return the results document."""
+    results = {}
+    for bench in benchmarks:
+        for params in bench.combinations(quick):
+            key = case_key(bench, params)
+            if name_filter and name_filter not in key:
+                continue
+            stats = measure(bench, params, quick)
+            results[key] = stats
+            print(f"{key:<60} median {stats['median']:10.4f} ms  "
+                  f"p90 {stats['p90']:10.4f} ms  {stats['throughput']:12.1f} items/s")
+    return {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any],
+            threshold: float) -> List[Dict[str, Any]]:
+    """Cases whose median got slower than the baseline by more than threshold."""
+    regressions = []
+    for key, stats in current["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if base is None or not base["median"]:
+            continue
+        change = stats["median"] / base["median"] - 1
+        if change > threshold:
+            regressions.append({"case": key, "baseline": base["median"],
+                                "current": stats["median"], "change": change})
+    return regressions
+
+def main(argv: Optional[List[str]] = None, suites: Optional[List[str]] = None) -> int:
+    """Command-line entry point; returns the process exit status."""
+    parser = argparse.ArgumentParser(description="Run OSIRIS-OS benchmarks")
+    parser.add_argument("--suite", action="append", choices=sorted(SUITES),
+                        help="suite to run (repeatable, default: all)")
+    parser.add_argument("--filter", help="only run cases whose key contains this text")
+    parser.add_argument("--quick", action="store_true",
+                        help="smallest parameter values and at most 5 repeats")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed median slowdown before failing (default 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(load_suites(args.suite or suites), args.quick, args.filter)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        print("\n" + "=" * 80)
+        print(f"Comparison against {args.baseline} (threshold {args.threshold:.0%})")
+        print("=" * 80)
+        for r in regressions:
+            print(f"REGRESSION {r['case']}: {r['baseline']:.4f} ms -> "
+                  f"{r['current']:.4f} ms (+{r['change']:.0%})")
+        if not regressions:
+            print("No regressions")
+        print("=" * 80 + "\n")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
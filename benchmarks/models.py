@@ -0,0 +1,15 @@
+"""
+Models shared by the AI node benchmarks.
+"""
+
+class BenchModel:
+    """Minimal model holding a dict of weights."""
+
+    def __init__(self, weights):
+        self.weights = weights
+
+    def get_weights(self):
+        return self.weights
+
+    def set_weights(self, weights):
+        self.weights = weights
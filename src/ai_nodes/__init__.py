@@ -6,11 +6,19 @@ without centralized servers.
 """
 
 import asyncio
+import time
 from typing import Dict, Any, List, Optional
 import numpy as np
 from dataclasses import dataclass
-import json
-from pathlib import Path
+
+from .. import metrics
+from .checkpoint import load_checkpoint, save_checkpoint, tensor_digest
+from .secure_aggregation import MaskedUpdate, SecureAggregationClient, unmask_sum
+from .shared_weights import SharedWeights, attach_weights
+
+_AGGREGATIONS = metrics.counter("ai_aggregations_total", "Federated averaging rounds")
+_AGGREGATED_UPDATES = metrics.counter("ai_aggregated_updates_total", "Peer updates averaged")
+_AGGREGATION_SECONDS = metrics.histogram("ai_aggregation_seconds", "Time per aggregation round")
 
 @dataclass
 class ModelUpdate:
@@ -20,6 +28,52 @@ class ModelUpdate:
     samples_count: int
     timestamp: float
     signature: Optional[str] = None
+    round_id: Optional[int] = None
+    digests: Optional[Dict[str, str]] = None
+    
+    def tensor_digests(self) -> Dict[str, str]:
+        """Content digest of every tensor, computed once and cached."""
+        if self.digests is None:
+            self.digests = {
+                name: tensor_digest(np.asarray(value)) for name, value in self.weights.items()
+            }
+        return self.digests
+
+@dataclass
+class PartialAggregate:
+    """A pre-aggregated sum of updates, as sent up an aggregation tree.
+    
+    Holds the sample-weighted sum of weights rather than their average, so
+    partials from different subtrees can be merged exactly and divided by
+    the total sample count only once at the root.
+    """
+    weighted_sum: Dict[str, Any]
+    samples_count: float
+    contributors: int = 0
+    
+    def merge(self, other: 'PartialAggregate') -> 'PartialAggregate':
+        """Add another partial into this one in place."""
+        if other.samples_count == 0:
+            return self
+        if not self.weighted_sum:
+            self.weighted_sum = {k: v.copy() for k, v in other.weighted_sum.items()}
+        else:
+            for k, v in other.weighted_sum.items():
+                self.weighted_sum[k] += v
+        self.samples_count += other.samples_count
+        self.contributors += other.contributors
+        return self
+    
+    def finalize(self) -> Dict[str, Any]:
+        """Turn the weighted sum into averaged weights."""
+        if self.samples_count == 0:
+            return {}
+        return {k: v / self.samples_count for k, v in self.weighted_sum.items()}
+    
+    @property
+    def nbytes(self) -> int:
+        """Payload size of the weighted sum."""
+        return sum(np.asarray(v).nbytes for v in self.weighted_sum.values())
 
 class AINode:
     """Represents an AI node in the federated learning network."""
@@ -29,6 +83,8 @@ class AINode:
         self.model = model
         self.updates: Dict[str, ModelUpdate] = {}
         self.peers = set()
+        self.secure_aggregation: Optional[SecureAggregationClient] = None
+        self.shared_weights: Optional[SharedWeights] = None
         
     async def train(self, data: Dict[str, Any], epochs: int = 1) -> Dict[str, Any]:
         """Train the model on local data."""
@@ -62,6 +118,7 @@ class AINode:
         if total_samples == 0:
             return {}
         
+        start = time.perf_counter() if metrics.ENABLED else None
         # Initialize aggregated weights
         aggregated_weights = None
         
@@ -80,22 +137,100 @@ class AINode:
         # Apply the aggregated weights to the model
         if aggregated_weights:
             self.model.set_weights(aggregated_weights)
-            
+
+        if start is not None:
+            _AGGREGATIONS.inc()
+            _AGGREGATED_UPDATES.inc(len(self.updates))
+            _AGGREGATION_SECONDS.observe(time.perf_counter() - start)
+        return aggregated_weights
+    
+    def partial_aggregate(self) -> PartialAggregate:
+        """Sum the locally held updates, weighted by their sample counts."""
+        partial = PartialAggregate(weighted_sum={}, samples_count=0)
+        for update in self.updates.values():
+            if update.samples_count == 0:
+                continue
+            partial.merge(PartialAggregate(
+                weighted_sum={
+                    k: np.asarray(v) * update.samples_count
+                    for k, v in update.weights.items()
+                },
+                samples_count=update.samples_count,
+                contributors=1
+            ))
+        return partial
+    
+    async def aggregate_partials(self, partials: List[PartialAggregate]) -> Dict[str, Any]:
+        """Aggregate pre-aggregated partials and apply the result."""
+        total = PartialAggregate(weighted_sum={}, samples_count=0)
+        for partial in partials:
+            total.merge(partial)
+        
+        aggregated_weights = total.finalize()
+        if aggregated_weights:
+            self.model.set_weights(aggregated_weights)
+        
         return aggregated_weights
     
+    def enable_secure_aggregation(self) -> int:
+        """Switch to masked updates and return this node's public key.
+        
+        Peers exchange public keys and pass them to
+        ``self.secure_aggregation.establish`` before masking updates.
+        """
+        self.secure_aggregation = SecureAggregationClient(self.node_id)
+        return self.secure_aggregation.public_key
+    
+    def mask_update(self, update: ModelUpdate, round_id: int = 0) -> MaskedUpdate:
+        """Mask an update so only the sum over all peers can be recovered."""
+        if self.secure_aggregation is None:
+            raise RuntimeError("Secure aggregation is not enabled")
+        return self.secure_aggregation.mask(update.weights, update.samples_count, round_id)
+    
+    async def aggregate_masked(self, masked_updates: Dict[str, MaskedUpdate],
+                               revealed: Optional[Dict[str, Dict[str, bytes]]] = None) -> Dict[str, Any]:
+        """Aggregate masked updates without seeing any individual update.
+        
+        ``revealed`` holds, per surviving peer, the seeds it shared with
+        peers that dropped out before sending.
+        """
+        weighted_sum, samples_count = unmask_sum(masked_updates, revealed)
+        return await self.aggregate_partials([
+            PartialAggregate(weighted_sum, samples_count, len(masked_updates))
+        ])
+    
     def add_peer(self, peer_id: str):
         """Add a peer to the node's known peers."""
         self.peers.add(peer_id)
     
+    def attach_shared_weights(self, name: str) -> SharedWeights:
+        """Use global weights published in a shared memory block.
+        
+        The model sees read-only views into the block; tensors it replaces
+        or requests via ``writable`` become private copies. Any previously
+        attached block is released.
+        """
+        weights = attach_weights(name)
+        self.model.set_weights(weights)
+        previous, self.shared_weights = self.shared_weights, weights
+        if previous is not None:
+            previous.close()
+        return weights
+    
     def save_model(self, path: str):
-        """Save the model to disk."""
-        # In a real implementation, this would save the model
-        Path(path).parent.mkdir(parents=True, exist_ok=True)
-        with open(path, 'w') as f:
-            json.dump({"model": "saved_model_weights"}, f)
+        """Save the model weights to a binary checkpoint.
+        
+        The write is atomic, and only tensors that changed since the
+        checkpoint at ``path`` was last written are rewritten.
+        """
+        return save_checkpoint(path, self.model.get_weights())
     
     @classmethod
     def load_model(cls, node_id: str, path: str, model: Any) -> 'AINode':
-        """Load a model from disk."""
-        # In a real implementation, this would load the model
+        """Load model weights from a binary checkpoint.
+        
+        Tensors are memory-mapped lazily, so loading is independent of the
+        checkpoint size until the weights are actually used.
+        """
+        model.set_weights(load_checkpoint(path))
         return cls(node_id=node_id, model=model)
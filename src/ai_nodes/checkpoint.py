@@ -0,0 +1,320 @@
+"""
+Binary model checkpoints
+
+A checkpoint is a single file made of a fixed preamble, a JSON header and a
+contiguous data region holding every tensor at a 64-byte aligned offset::
+
+    MAGIC (8 bytes) | header length (uint64, little endian) | header JSON | data
+
+The header records dtype, shape, offset, size and a content digest for each
+tensor. Loading only parses the header and memory-maps the file, so tensors
+are paged in when they are first touched. Saving is atomic (write to a
+temporary file, then rename) and incremental: when the layout of the existing
+checkpoint matches, the old file is cloned and only tensors whose digest
+changed are rewritten.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import struct
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"QIZCKPT1"
+ALIGNMENT = 64
+FORMAT_VERSION = 1
+
+# Extra room reserved after the header so it can be rewritten in place
+HEADER_SLACK = 256
+
+_PREAMBLE = struct.Struct("<8sQ")
+_FICLONE = 0x40049409
+
+
+def _align(value: int, alignment: int = ALIGNMENT) -> int:
+    """Round value up to the next multiple of alignment."""
+    return (value + alignment - 1) // alignment * alignment
+
+
+def tensor_digest(array: np.ndarray) -> str:
+    """Return a short content digest of an array's raw bytes."""
+    return hashlib.blake2b(
+        np.asarray(array, order="C").data, digest_size=16
+    ).hexdigest()
+
+
+def _as_array(name: str, value: Any) -> np.ndarray:
+    """Convert a weight value to a contiguous NumPy array."""
+    array = np.asarray(value, order="C")
+    if array.dtype.hasobject:
+        raise TypeError(f"Tensor {name!r} has unsupported dtype {array.dtype}")
+    return array
+
+
+def read_header(path: str) -> Optional[Dict[str, Any]]:
+    """Read a checkpoint header, or return None if path is not a checkpoint."""
+    try:
+        with open(path, "rb") as f:
+            preamble = f.read(_PREAMBLE.size)
+            if len(preamble) != _PREAMBLE.size:
+                return None
+            magic, header_len = _PREAMBLE.unpack(preamble)
+            if magic != MAGIC:
+                return None
+            return json.loads(f.read(header_len).decode())
+    except (OSError, ValueError):
+        return None
+
+
+def parse_header(buffer: Any) -> Optional[Dict[str, Any]]:
+    """Parse the header of a checkpoint image held in memory."""
+    view = memoryview(buffer)
+    if len(view) < _PREAMBLE.size:
+        return None
+    magic, header_len = _PREAMBLE.unpack_from(view)
+    if magic != MAGIC:
+        return None
+    try:
+        return json.loads(bytes(view[_PREAMBLE.size:_PREAMBLE.size + header_len]))
+    except ValueError:
+        return None
+
+
+def _build_header(arrays: Dict[str, np.ndarray],
+                  digests: Dict[str, str]) -> Dict[str, Any]:
+    """Lay out tensors contiguously and describe them in a header."""
+    tensors = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        tensors[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+            "nbytes": array.nbytes,
+            "digest": digests[name],
+        }
+        offset += array.nbytes
+
+    header = {"version": FORMAT_VERSION, "data_offset": 0, "tensors": tensors}
+    # The data offset depends on the header size, which in turn contains the
+    # data offset; reserve slack so the header can later be patched in place.
+    encoded_len = len(json.dumps(header).encode()) + 32
+    header["data_offset"] = _align(_PREAMBLE.size + encoded_len + HEADER_SLACK)
+    return header
+
+
+def _encode_header(header: Dict[str, Any]) -> bytes:
+    """Encode a header and check it fits before the data region."""
+    encoded = json.dumps(header).encode()
+    if _PREAMBLE.size + len(encoded) > header["data_offset"]:
+        raise ValueError("Checkpoint header does not fit its reserved region")
+    return _PREAMBLE.pack(MAGIC, len(encoded)) + encoded
+
+
+def prepare_image(weights: Dict[str, Any]) -> Tuple[Dict[str, np.ndarray], Dict[str, Any], int]:
+    """
+    Lay out weights as a checkpoint image.
+
+    Returns the arrays, their header and the total image size in bytes, for
+    callers that write the image somewhere other than a file.
+    """
+    arrays = {name: _as_array(name, value) for name, value in weights.items()}
+    header = _build_header(
+        arrays, {name: tensor_digest(array) for name, array in arrays.items()}
+    )
+    size = header["data_offset"]
+    for meta in header["tensors"].values():
+        size = max(size, header["data_offset"] + meta["offset"] + meta["nbytes"])
+    return arrays, header, size
+
+
+def write_image(buffer: Any, arrays: Dict[str, np.ndarray], header: Dict[str, Any]):
+    """Write a checkpoint image prepared by prepare_image into a buffer."""
+    view = memoryview(buffer).cast("B")
+    encoded = _encode_header(header)
+    view[:len(encoded)] = encoded
+    for name, array in arrays.items():
+        if array.nbytes == 0:
+            continue  # memoryview cannot cast shapes containing zeros
+        start = header["data_offset"] + header["tensors"][name]["offset"]
+        view[start:start + array.nbytes] = memoryview(array).cast("B")
+
+
+def tensor_view(buffer: Any, header: Dict[str, Any], name: str) -> np.ndarray:
+    """Return an array viewing one tensor of a checkpoint image."""
+    meta = header["tensors"][name]
+    start = header["data_offset"] + meta["offset"]
+    raw = np.frombuffer(buffer, dtype=np.uint8, count=meta["nbytes"], offset=start)
+    return raw.view(np.dtype(meta["dtype"])).reshape(meta["shape"])
+
+
+def _same_layout(old: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> bool:
+    """Check whether arrays can be written into an existing layout."""
+    tensors = old.get("tensors", {})
+    if old.get("version") != FORMAT_VERSION or list(tensors) != list(arrays):
+        return False
+    for name, array in arrays.items():
+        meta = tensors[name]
+        if meta["dtype"] != array.dtype.str or tuple(meta["shape"]) != array.shape:
+            return False
+    return True
+
+
+def _clone_file(src: str, dst: str):
+    """Copy src to dst, sharing extents or copying in-kernel when possible."""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            import fcntl
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            return
+        except (ImportError, OSError):
+            pass
+
+        if hasattr(os, "copy_file_range"):
+            remaining = os.fstat(fsrc.fileno()).st_size
+            try:
+                while remaining > 0:
+                    copied = os.copy_file_range(
+                        fsrc.fileno(), fdst.fileno(), remaining
+                    )
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining == 0:
+                    return
+            except OSError:
+                pass
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+
+        shutil.copyfileobj(fsrc, fdst, length=1 << 20)
+
+
+def _fsync_dir(path: Path):
+    """Flush a directory entry so a rename survives a crash."""
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def save_checkpoint(path: str, weights: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    Atomically save weights to a checkpoint file.
+
+    Returns a ``(written, total)`` tuple with the number of tensors that
+    were actually written and the number of tensors in the checkpoint.
+    """
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+
+    arrays = {name: _as_array(name, value) for name, value in weights.items()}
+    digests = {name: tensor_digest(array) for name, array in arrays.items()}
+
+    old_header = read_header(str(target))
+    tmp_path = target.with_name(f".{target.name}.tmp")
+
+    try:
+        if old_header is not None and _same_layout(old_header, arrays):
+            header = old_header
+            changed = [
+                name for name in arrays
+                if header["tensors"][name]["digest"] != digests[name]
+            ]
+            if not changed:
+                return 0, len(arrays)
+
+            _clone_file(str(target), str(tmp_path))
+            with open(tmp_path, "r+b") as f:
+                for name in changed:
+                    meta = header["tensors"][name]
+                    meta["digest"] = digests[name]
+                    f.seek(header["data_offset"] + meta["offset"])
+                    f.write(arrays[name].data)
+                f.seek(0)
+                f.write(_encode_header(header))
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            header = _build_header(arrays, digests)
+            changed = list(arrays)
+            with open(tmp_path, "wb") as f:
+                f.write(_encode_header(header))
+                for name, array in arrays.items():
+                    f.seek(header["data_offset"] + header["tensors"][name]["offset"])
+                    f.write(array.data)
+                f.truncate(max(f.tell(), header["data_offset"]))
+                f.flush()
+                os.fsync(f.fileno())
+
+        os.replace(tmp_path, target)
+        _fsync_dir(target.parent)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    return len(changed), len(arrays)
+
+
+class LazyCheckpoint(Mapping):
+    """Read-only mapping of tensor names to memory-mapped arrays."""
+
+    def __init__(self, path: str, mode: str = "c"):
+        header = read_header(path)
+        if header is None:
+            raise ValueError(f"Not a checkpoint file: {path}")
+        self.path = path
+        self.mode = mode
+        self.header = header
+        self._buffer: Optional[np.memmap] = None
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    def _data(self) -> np.memmap:
+        """Map the file on first use."""
+        if self._buffer is None:
+            self._buffer = np.memmap(self.path, dtype=np.uint8, mode=self.mode)
+        return self._buffer
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        array = self._arrays.get(name)
+        if array is None:
+            meta = self.header["tensors"][name]
+            start = self.header["data_offset"] + meta["offset"]
+            raw = self._data()[start:start + meta["nbytes"]]
+            array = raw.view(np.dtype(meta["dtype"])).reshape(meta["shape"])
+            self._arrays[name] = array
+        return array
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.header["tensors"])
+
+    def __len__(self) -> int:
+        return len(self.header["tensors"])
+
+    def digest(self, name: str) -> str:
+        """Return the stored digest of a tensor without reading it."""
+        return self.header["tensors"][name]["digest"]
+
+
+def load_checkpoint(path: str, mode: str = "c") -> LazyCheckpoint:
+    """
+    Open a checkpoint lazily.
+
+    Only the header is read; tensors are memory-mapped on access. The default
+    ``"c"`` mode gives copy-on-write arrays that can be modified without
+    touching the file; use ``"r"`` for strictly read-only arrays.
+    """
+    return LazyCheckpoint(path, mode=mode)
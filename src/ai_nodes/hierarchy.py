@@ -0,0 +1,99 @@
+"""
+Hierarchical aggregation
+
+Instead of every peer sending its full update to one aggregator, nodes are
+arranged in a tree built from their ``peers``. Each node sums its own
+updates with the partials of its children and sends a single
+``PartialAggregate`` (weighted sum plus sample count) to its parent. The
+root divides by the total sample count once, which gives exactly the
+flat FedAvg result while the root only hears from its direct children.
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, Dict, List
+
+from . import AINode, PartialAggregate
+
+# Parent id -> ids of its children
+AggregationTree = Dict[str, List[str]]
+
+
+def build_aggregation_tree(nodes: Dict[str, AINode], root_id: str,
+                           fanout: int = 8) -> AggregationTree:
+    """
+    Build a spanning tree over the peer graph, breadth first from root_id.
+
+    Each node adopts at most ``fanout`` children. Raises ValueError if some
+    node cannot be reached through the peer links.
+    """
+    if fanout < 1:
+        raise ValueError("fanout must be at least 1")
+    if root_id not in nodes:
+        raise ValueError(f"Unknown root node: {root_id}")
+
+    tree: AggregationTree = {root_id: []}
+    queue = deque([root_id])
+    while queue:
+        parent = queue.popleft()
+        for peer_id in sorted(nodes[parent].peers):
+            if len(tree[parent]) >= fanout:
+                break
+            if peer_id in tree or peer_id not in nodes:
+                continue
+            tree[parent].append(peer_id)
+            tree[peer_id] = []
+            queue.append(peer_id)
+
+    unreachable = set(nodes) - set(tree)
+    if unreachable:
+        raise ValueError(
+            f"Nodes not reachable from {root_id}: {sorted(unreachable)}"
+        )
+    return tree
+
+
+def build_clustered_tree(nodes: Dict[str, AINode], root_id: str,
+                         cluster_size: int = 8) -> AggregationTree:
+    """
+    Group nodes into flat clusters whose heads report to the root.
+
+    Peer links are added so that the tree is also valid for
+    ``build_aggregation_tree``.
+    """
+    members = sorted(n for n in nodes if n != root_id)
+    tree: AggregationTree = {root_id: []}
+    for start in range(0, len(members), cluster_size):
+        head, *rest = members[start:start + cluster_size]
+        tree[root_id].append(head)
+        tree[head] = rest
+        nodes[root_id].add_peer(head)
+        nodes[head].add_peer(root_id)
+        for member in rest:
+            tree[member] = []
+            nodes[head].add_peer(member)
+            nodes[member].add_peer(head)
+    return tree
+
+
+async def collect_partial(nodes: Dict[str, AINode], tree: AggregationTree,
+                          node_id: str) -> PartialAggregate:
+    """Compute the partial aggregate of the subtree rooted at node_id."""
+    children = await asyncio.gather(*(
+        collect_partial(nodes, tree, child) for child in tree.get(node_id, [])
+    ))
+    partial = nodes[node_id].partial_aggregate()
+    for child in children:
+        partial.merge(child)
+    return partial
+
+
+async def tree_aggregate(nodes: Dict[str, AINode], tree: AggregationTree,
+                         root_id: str) -> Dict[str, Any]:
+    """Aggregate the whole tree and apply the result at the root."""
+    root = nodes[root_id]
+    partials = [root.partial_aggregate()]
+    partials.extend(await asyncio.gather(*(
+        collect_partial(nodes, tree, child) for child in tree.get(root_id, [])
+    )))
+    return await root.aggregate_partials(partials)
@@ -0,0 +1,187 @@
+"""
+Federated training rounds
+
+A round coordinator drives an ``AINode`` through numbered training rounds.
+Every round, all idle participants are asked to train concurrently against
+the current global weights. The round closes at its deadline (or earlier if
+everybody answered) and aggregates whatever arrived in time, provided a
+quorum of updates and samples was reached. Participants still running when
+the round closes are stragglers: they are not waited for, and their update
+is folded into a later round with a staleness discount, or dropped once it
+is too old.
+"""
+
+import asyncio
+import dataclasses
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from . import AINode, ModelUpdate
+
+# A participant trains on the given global weights and returns its update
+Participant = Callable[[int, Dict[str, Any]], Awaitable[ModelUpdate]]
+
+
+@dataclass
+class RoundConfig:
+    """Settings for federated rounds."""
+    deadline: float = 30.0
+    min_updates: int = 1
+    min_samples: int = 0
+    staleness_decay: float = 0.5
+    max_staleness: int = 1
+
+
+@dataclass
+class RoundResult:
+    """Outcome of a single federated round."""
+    round_id: int
+    weights: Optional[Dict[str, Any]]
+    accepted: List[str] = field(default_factory=list)
+    stale: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+    stragglers: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+    total_samples: float = 0.0
+    duration: float = 0.0
+
+    @property
+    def committed(self) -> bool:
+        """Whether the round reached quorum and produced new weights."""
+        return self.weights is not None
+
+
+def node_participant(node: AINode, data: Dict[str, Any],
+                     epochs: int = 1) -> Participant:
+    """Wrap an in-process AINode as a round participant."""
+    async def participate(round_id: int, weights: Dict[str, Any]) -> ModelUpdate:
+        node.model.set_weights(weights)
+        update = await node.train(data, epochs=epochs)
+        return dataclasses.replace(update, round_id=round_id)
+    return participate
+
+
+class RoundCoordinator:
+    """Runs deadline-bounded federated rounds on behalf of an AINode."""
+
+    def __init__(self, node: AINode, config: Optional[RoundConfig] = None):
+        self.node = node
+        self.config = config or RoundConfig()
+        self.participants: Dict[str, Participant] = {}
+        self.round_id = 0
+        self._running: Dict[str, asyncio.Task] = {}
+        self._late: Dict[str, ModelUpdate] = {}
+
+    def add_participant(self, node_id: str, participant: Participant):
+        """Register a participant and record it as a peer of the node."""
+        self.participants[node_id] = participant
+        self.node.add_peer(node_id)
+
+    def remove_participant(self, node_id: str):
+        """Forget a participant and cancel its outstanding work."""
+        self.participants.pop(node_id, None)
+        task = self._running.pop(node_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def run_round(self) -> RoundResult:
+        """Run one round and aggregate the updates that arrived in time."""
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        self.round_id += 1
+        round_id = self.round_id
+        result = RoundResult(round_id=round_id, weights=None)
+
+        global_weights = self.node.model.get_weights()
+        launched = {}
+        for node_id, participant in self.participants.items():
+            if node_id in self._running:
+                # Still busy with an earlier round; do not queue more work
+                continue
+            task = loop.create_task(participant(round_id, global_weights))
+            task.add_done_callback(self._make_collector(node_id, round_id))
+            self._running[node_id] = task
+            launched[node_id] = task
+
+        if launched:
+            await asyncio.wait(
+                launched.values(), timeout=self.config.deadline
+            )
+
+        updates: Dict[str, ModelUpdate] = {}
+        for node_id, task in launched.items():
+            if not task.done():
+                result.stragglers.append(node_id)
+            elif task.cancelled() or task.exception() is not None:
+                result.failed.append(node_id)
+            else:
+                # The collector callback may not have run yet; claim the
+                # task so it does not file the update a second time
+                if self._running.get(node_id) is task:
+                    del self._running[node_id]
+                self._late.pop(node_id, None)
+                updates[node_id] = self._stamp(task.result(), round_id)
+                result.accepted.append(node_id)
+
+        # Fold in updates that missed their own round
+        folded: Dict[str, ModelUpdate] = {}
+        for node_id in list(self._late):
+            if node_id in updates:
+                continue
+            late = self._late.pop(node_id)
+            folded[node_id] = late
+            staleness = round_id - (late.round_id or 0)
+            if staleness > self.config.max_staleness:
+                result.dropped.append(node_id)
+                continue
+            discount = self.config.staleness_decay ** staleness
+            updates[node_id] = dataclasses.replace(
+                late, samples_count=late.samples_count * discount
+            )
+            result.stale.append(node_id)
+
+        result.total_samples = sum(u.samples_count for u in updates.values())
+        if (len(updates) >= self.config.min_updates
+                and result.total_samples >= self.config.min_samples
+                and result.total_samples > 0):
+            self.node.updates = updates
+            result.weights = await self.node.aggregate_updates()
+        else:
+            # No quorum: keep on-time and stale updates for the next round
+            for node_id in result.accepted:
+                self._late[node_id] = updates[node_id]
+            for node_id in result.stale:
+                self._late[node_id] = folded[node_id]
+
+        result.duration = loop.time() - started
+        return result
+
+    async def run(self, num_rounds: int) -> List[RoundResult]:
+        """Run several rounds back to back."""
+        return [await self.run_round() for _ in range(num_rounds)]
+
+    async def close(self):
+        """Cancel any straggler work that is still running."""
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._running.clear()
+
+    def _make_collector(self, node_id: str, round_id: int):
+        """Build a callback that files a finished update."""
+        def collect(task: asyncio.Task):
+            if self._running.get(node_id) is not task:
+                return  # cancelled by remove_participant, or claimed by run_round
+            del self._running[node_id]
+            if task.cancelled() or task.exception() is not None:
+                return
+            self._late[node_id] = self._stamp(task.result(), round_id)
+        return collect
+
+    @staticmethod
+    def _stamp(update: ModelUpdate, round_id: int) -> ModelUpdate:
+        """Attribute an update without a round to the round it was started in."""
+        if update.round_id is None:
+            update = dataclasses.replace(update, round_id=round_id)
+        return update
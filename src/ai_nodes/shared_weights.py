@@ -0,0 +1,203 @@
+"""
+Shared-memory global weights
+
+Nodes running as separate processes on one host can share a single copy of
+the global model. The publisher writes the weights once into a
+``multiprocessing.shared_memory`` block, using the checkpoint image layout,
+and hands out the block name. Attaching is O(1): tensors are read-only views
+into the block, and a node that modifies a tensor gets a private copy of
+that tensor only (copy-on-write). Broadcasting a new global model is a
+matter of publishing a new block and sending its name.
+
+Before Python 3.13 an attached block is registered with the attaching
+process's resource tracker. Processes started through ``multiprocessing``
+share the publisher's tracker, so this is harmless for them, but an
+unrelated process that attaches will unlink the block when it exits.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterator, Optional
+
+import numpy as np
+
+from .checkpoint import parse_header, prepare_image, tensor_view, write_image
+
+
+# Detached blocks whose views were still in use when they were closed
+_lingering = []
+_lingering_lock = threading.Lock()
+
+
+def _open_block(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing block, without tracking it where supported."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _close_lingering():
+    """Close detached blocks whose views have all been dropped since."""
+    with _lingering_lock:
+        for block in list(_lingering):
+            try:
+                block.close()
+            except BufferError:
+                continue
+            _lingering.remove(block)
+
+
+def _release(block: shared_memory.SharedMemory):
+    """Close a block now, or once the views still using it are gone."""
+    try:
+        block.close()
+    except BufferError:
+        with _lingering_lock:
+            _lingering.append(block)
+    _close_lingering()
+
+
+class SharedWeightsBlock:
+    """A published, owned copy of weights in shared memory."""
+
+    def __init__(self, weights: Dict[str, Any], version: int = 0):
+        arrays, header, size = prepare_image(weights)
+        header["model_version"] = version
+        self.version = version
+        self._block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        try:
+            write_image(self._block.buf, arrays, header)
+        except BaseException:
+            self.close()
+            raise
+
+    @property
+    def name(self) -> str:
+        """Handle other processes use to attach to the block."""
+        return self._block.name
+
+    @property
+    def size(self) -> int:
+        """Size of the block in bytes."""
+        return self._block.size
+
+    def close(self):
+        """Release and unlink the block."""
+        _release(self._block)
+        try:
+            self._block.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedWeightsPublisher:
+    """Publishes successive global models and retires old blocks."""
+
+    def __init__(self, keep: int = 2):
+        self.keep = max(1, keep)
+        self.version = 0
+        self._blocks: "OrderedDict[int, SharedWeightsBlock]" = OrderedDict()
+
+    def publish(self, weights: Dict[str, Any]) -> str:
+        """Publish a new global model and return its block name."""
+        self.version += 1
+        block = SharedWeightsBlock(weights, self.version)
+        self._blocks[self.version] = block
+        while len(self._blocks) > self.keep:
+            _, old = self._blocks.popitem(last=False)
+            old.close()
+        return block.name
+
+    def close(self):
+        """Unlink every block still held by the publisher."""
+        while self._blocks:
+            _, block = self._blocks.popitem(last=False)
+            block.close()
+
+
+class SharedWeights(MutableMapping):
+    """Copy-on-write mapping over weights held in a shared memory block."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._views: Dict[str, np.ndarray] = {}
+        self._local: Dict[str, np.ndarray] = {}
+        self._deleted = set()
+        # Held until close(), since the views below point into its mapping
+        self._block: Optional[shared_memory.SharedMemory] = _open_block(name)
+        self._buffer: Optional[np.ndarray] = np.frombuffer(self._block.buf, dtype=np.uint8)
+        header = parse_header(self._buffer)
+        if header is None:
+            self.close()
+            raise ValueError(f"Shared memory block {name} holds no weights")
+        self.header = header
+        self.version = header.get("model_version", 0)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name in self._local:
+            return self._local[name]
+        if name in self._deleted or name not in self.header["tensors"]:
+            raise KeyError(name)
+        view = self._views.get(name)
+        if view is None:
+            if self._buffer is None:
+                raise ValueError("Shared weights have been closed")
+            view = tensor_view(self._buffer, self.header, name)
+            view.flags.writeable = False
+            self._views[name] = view
+        return view
+
+    def __setitem__(self, name: str, value: Any):
+        self._local[name] = value
+        self._deleted.discard(name)
+
+    def __delitem__(self, name: str):
+        if name not in self:
+            raise KeyError(name)
+        self._local.pop(name, None)
+        self._deleted.add(name)
+
+    def __iter__(self) -> Iterator[str]:
+        for name in self.header["tensors"]:
+            if name not in self._deleted and name not in self._local:
+                yield name
+        yield from self._local
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def writable(self, name: str) -> np.ndarray:
+        """Return a private, writable copy of a tensor (copy on write)."""
+        if name not in self._local:
+            self._local[name] = np.array(self[name])
+        return self._local[name]
+
+    @property
+    def modified(self) -> Dict[str, np.ndarray]:
+        """Tensors that this process has replaced or copied locally."""
+        return dict(self._local)
+
+    def close(self):
+        """Detach from the shared block.
+        
+        The mapping is removed now, or at a later ``close`` once no views
+        handed out earlier remain.
+        """
+        self._views.clear()
+        self._buffer = None
+        if self._block is not None:
+            block, self._block = self._block, None
+            _release(block)
+
+    def __del__(self):
+        # Drop our views before the block is finalized, or closing it fails
+        if getattr(self, "_block", None) is not None:
+            self.close()
+
+
+def attach_weights(name: str) -> SharedWeights:
+    """Attach to global weights published under the given block name."""
+    return SharedWeights(name)
@@ -0,0 +1,283 @@
+"""
+Differential model sync
+
+Peers exchange model updates by content digest instead of shipping every
+tensor every round. The sender advertises a manifest holding the update's
+metadata and one digest per tensor; the receiver answers with the names of
+the tensors it does not already hold, and only those are transferred.
+Frozen or unchanged layers therefore cost a digest, not a tensor.
+
+Tensors received or aggregated locally are kept in a ``TensorStore``
+keyed by digest, bounded by total bytes. The store holds read-only copies,
+so callers cannot change a tensor under its digest. A tensor evicted while
+an exchange is under way is asked for again rather than failing it, and so
+is a reply whose tensors do not match their digests; after
+``MAX_REQUESTS`` requests the update is dropped.
+"""
+
+import base64
+import itertools
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import AINode, ModelUpdate
+from .checkpoint import tensor_digest
+
+MANIFEST = "model_manifest"
+WANT = "model_want"
+TENSORS = "model_tensors"
+
+# Updates kept while waiting for a peer's request or for its tensors
+PENDING_LIMIT = 64
+# Tensor requests per update before it is given up
+MAX_REQUESTS = 3
+
+
+class TensorStore:
+    """Content-addressed tensors with least-recently-used eviction."""
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._tensors: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+
+    def add(self, array: Any, digest: Optional[str] = None) -> str:
+        """Store a read-only copy of an array and return its digest."""
+        digest = digest or tensor_digest(array)
+        if digest in self._tensors:
+            self._tensors.move_to_end(digest)
+            return digest
+        array = np.array(array, copy=True, order="C")
+        array.setflags(write=False)
+        self._tensors[digest] = array
+        self.nbytes += array.nbytes
+        while self.nbytes > self.max_bytes and len(self._tensors) > 1:
+            _, evicted = self._tensors.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        return digest
+
+    def add_weights(self, weights: Dict[str, Any]):
+        """Store every tensor of a weights dict."""
+        for value in weights.values():
+            self.add(value)
+
+    def get(self, digest: str) -> Optional[np.ndarray]:
+        array = self._tensors.get(digest)
+        if array is not None:
+            self._tensors.move_to_end(digest)
+        return array
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._tensors
+
+    def __len__(self) -> int:
+        return len(self._tensors)
+
+    def missing(self, manifest: Dict[str, Any]) -> List[str]:
+        """Names of the manifest's tensors that are not stored."""
+        return [name for name, digest in manifest["digests"].items() if digest not in self._tensors]
+
+    def assemble(self, manifest: Dict[str, Any],
+                 tensors: Optional[Dict[str, np.ndarray]] = None) -> Optional[ModelUpdate]:
+        """
+        Rebuild the advertised update from stored and received tensors.
+
+        Every tensor is checked against its advertised digest and received
+        ones are stored; a stored tensor that fails the check is dropped.
+        Returns None if a tensor is neither stored nor received, after
+        storing what was received, so ``missing`` lists what to ask for.
+        """
+        tensors = tensors or {}
+        digests = manifest["digests"]
+        layouts = manifest.get("layouts", {})
+        for name, digest in digests.items():
+            if name in tensors and tensor_digest(tensors[name]) != digest:
+                raise ValueError(f"Tensor {name!r} does not match its advertised digest")
+
+        # Stored tensors are taken before received ones are added, which may evict them
+        weights = {}
+        complete = True
+        for name, digest in digests.items():
+            if name in tensors:
+                continue
+            array = self.get(digest)
+            if array is not None and tensor_digest(array) != digest:
+                self.discard(digest)
+                array = None
+            if array is None:
+                complete = False
+                continue
+            if name in layouts:
+                # Digests cover raw bytes only, e.g. equal zero tensors of any shape
+                dtype, shape = layouts[name]
+                array = array.view(np.dtype(dtype)).reshape(shape)
+            weights[name] = array
+        for name, array in tensors.items():
+            if name in digests:
+                self.add(array, digests[name])
+                weights[name] = array
+        if not complete:
+            return None
+        return ModelUpdate(
+            node_id=manifest["node_id"],
+            weights=weights,
+            samples_count=manifest["samples_count"],
+            timestamp=manifest["timestamp"],
+            signature=manifest.get("signature"),
+            round_id=manifest.get("round_id"),
+            digests=dict(digests)
+        )
+
+    def discard(self, digest: str):
+        """Drop a stored tensor, if present."""
+        array = self._tensors.pop(digest, None)
+        if array is not None:
+            self.nbytes -= array.nbytes
+
+
+def make_manifest(update: ModelUpdate) -> Dict[str, Any]:
+    """JSON-ready metadata and tensor digests of an update."""
+    return {
+        "node_id": update.node_id,
+        "samples_count": update.samples_count,
+        "timestamp": update.timestamp,
+        "signature": update.signature,
+        "round_id": update.round_id,
+        "digests": update.tensor_digests(),
+        "layouts": {
+            name: [np.asarray(value).dtype.str, list(np.shape(value))]
+            for name, value in update.weights.items()
+        },
+    }
+
+
+def encode_tensors(tensors: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Tensors as dtype, shape and base64 raw bytes, for JSON messages."""
+    encoded = {}
+    for name, value in tensors.items():
+        array = np.asarray(value, order="C")
+        encoded[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "data": base64.b64encode(array.data).decode(),
+        }
+    return encoded
+
+
+def decode_tensors(encoded: Dict[str, Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Inverse of ``encode_tensors``."""
+    return {
+        name: np.frombuffer(base64.b64decode(item["data"]), dtype=np.dtype(item["dtype"]))
+        .reshape(item["shape"])
+        for name, item in encoded.items()
+    }
+
+
+class ModelSync:
+    """
+    Differential update exchange for an AINode over a QMP service.
+
+    ``publish`` sends a manifest; receivers request only missing tensors,
+    and the assembled update lands in ``node.updates``. The node's current
+    model weights are stored up front, so layers that did not change since
+    the last aggregation are never transferred.
+    """
+
+    def __init__(self, node: AINode, qmp, max_bytes: int = 512 * 1024 * 1024):
+        self.node = node
+        self.qmp = qmp
+        self.store = TensorStore(max_bytes)
+        self.store.add_weights(node.model.get_weights())
+        self._outgoing: 'OrderedDict[int, ModelUpdate]' = OrderedDict()
+        # Manifests waiting for tensors, with the number of requests sent so far
+        self._incoming: 'OrderedDict[Tuple[int, str], Tuple[Dict[str, Any], int]]' = OrderedDict()
+        self._ids = itertools.count(1)
+        self.stats = {"tensors_sent": 0, "tensors_skipped": 0, "bytes_sent": 0, "updates_received": 0,
+                      "replies_rejected": 0, "updates_dropped": 0}
+        qmp.register_handler(MANIFEST, self._handle_manifest)
+        qmp.register_handler(WANT, self._handle_want)
+        qmp.register_handler(TENSORS, self._handle_tensors)
+
+    def remember_weights(self, weights: Dict[str, Any]):
+        """Store tensors a peer can later be assumed to have, e.g. aggregated weights."""
+        self.store.add_weights(weights)
+
+    async def publish(self, update: ModelUpdate, writer=None):
+        """Advertise an update to one connection, or broadcast it when writer is None."""
+        update_id = next(self._ids)
+        self._outgoing[update_id] = update
+        if len(self._outgoing) > PENDING_LIMIT:
+            self._outgoing.popitem(last=False)
+        message = self.qmp.create_message(
+            {"update_id": update_id, "manifest": make_manifest(update)}, MANIFEST
+        )
+        if writer is None:
+            await self.qmp.broadcast(message)
+        else:
+            await self.qmp.send(message, writer)
+
+    def _accept(self, update: ModelUpdate):
+        self.node.updates[update.node_id] = update
+        self.stats["updates_received"] += 1
+
+    async def _handle_manifest(self, message, writer):
+        content = message.content
+        await self._complete(content["update_id"], message.sender_id, content["manifest"], {}, 0, writer)
+
+    async def _handle_want(self, message, writer):
+        update = self._outgoing.get(message.content["update_id"])
+        if update is None:
+            return  # evicted; the peer falls back to waiting for the next round
+        # Names come from the peer; ones the update does not have are ignored
+        names = message.content["names"]
+        tensors = {name: update.weights[name] for name in names if name in update.weights}
+        self.stats["tensors_sent"] += len(tensors)
+        self.stats["tensors_skipped"] += len(update.weights) - len(tensors)
+        self.stats["bytes_sent"] += sum(np.asarray(t).nbytes for t in tensors.values())
+        reply = self.qmp.create_message(
+            {"update_id": message.content["update_id"], "tensors": encode_tensors(tensors)}, TENSORS
+        )
+        await self.qmp.send(reply, writer)
+
+    async def _handle_tensors(self, message, writer):
+        update_id = message.content["update_id"]
+        pending = self._incoming.pop((update_id, message.sender_id), None)
+        if pending is None:
+            return
+        manifest, requests = pending
+        try:
+            tensors = decode_tensors(message.content["tensors"])
+        except (ValueError, TypeError, KeyError):
+            tensors = None
+        await self._complete(update_id, message.sender_id, manifest, tensors, requests, writer)
+
+    async def _complete(self, update_id: int, sender_id: str, manifest: Dict[str, Any],
+                        tensors: Optional[Dict[str, np.ndarray]], requests: int, writer):
+        """
+        Accept the update if every tensor is at hand, or ask the sender for
+        the rest. ``tensors`` is None for a reply that could not be used.
+        """
+        if tensors is not None and (tensors or not self.store.missing(manifest)):
+            try:
+                update = self.store.assemble(manifest, tensors)
+            except ValueError:
+                update = None
+                tensors = None
+            else:
+                if update is not None:
+                    self._accept(update)
+                    return
+        if tensors is None:
+            self.stats["replies_rejected"] += 1
+        if requests >= MAX_REQUESTS:
+            self.stats["updates_dropped"] += 1
+            return
+        # Never held, evicted since the request, or the reply was unusable
+        names = self.store.missing(manifest)
+        self._incoming[update_id, sender_id] = (manifest, requests + 1)
+        if len(self._incoming) > PENDING_LIMIT:
+            self._incoming.popitem(last=False)
+        reply = self.qmp.create_message({"update_id": update_id, "names": names}, WANT)
+        await self.qmp.send(reply, writer)
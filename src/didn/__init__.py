@@ -5,10 +5,31 @@ A decentralized identity and data layer that replaces DNS, PKI, and SSL.
 """
 
 import hashlib
+import itertools
 import json
-from typing import Dict, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 from dataclasses import dataclass, asdict
 from datetime import datetime
+import time
+
+from .. import metrics
+from .filters import BloomFilter
+from .versions import VersionChain
+
+# Membership summaries start at this many keys and double when full
+SUMMARY_CAPACITY = 1024
+SUMMARY_FP_RATE = 0.01
+
+_REGISTERED = metrics.counter("didn_identities_registered_total", "Identities registered")
+_STORED = metrics.counter("didn_data_stored_total", "Data items stored")
+_STORE_SECONDS = metrics.histogram("didn_store_seconds", "Time to hash and store a data item")
+_RESOLVED = {
+    (kind, found): metrics.counter(
+        "didn_resolves_total", "Identity and data lookups", kind=kind,
+        result="hit" if found else "miss"
+    )
+    for kind in ("identity", "data") for found in (True, False)
+}
 
 @dataclass
 class Identity:
@@ -33,6 +54,14 @@ class DIDN:
     def __init__(self):
         self.identities = {}
         self.data_store = {}
+        self.summaries = {
+            "identities": BloomFilter(SUMMARY_CAPACITY, SUMMARY_FP_RATE),
+            "data": BloomFilter(SUMMARY_CAPACITY, SUMMARY_FP_RATE),
+        }
+        # (identity_id, name) -> versions of that logical record
+        self.versions: Dict[Tuple[str, str], VersionChain] = {}
+        # Content ID of a version -> its record key and version number
+        self._version_ids: Dict[str, Tuple[Tuple[str, str], int]] = {}
     
     def register_identity(self, public_key: str, signature: str, metadata: Dict = None) -> str:
         """Register a new identity in the network."""
@@ -47,7 +76,12 @@ class DIDN:
             metadata=metadata
         )
         
+        is_new = identity_id not in self.identities
         self.identities[identity_id] = identity
+        if is_new:
+            self._summarize("identities", identity_id, self.identities)
+        if metrics.ENABLED:
+            _REGISTERED.inc()
         return identity_id
     
     def store_data(self, identity_id: str, data: Dict, signature: str) -> str:
@@ -55,22 +89,113 @@ class DIDN:
         if identity_id not in self.identities:
             raise ValueError("Unknown identity")
             
+        start = time.perf_counter() if metrics.ENABLED else None
         data_id = self._generate_data_id(data)
+        is_new = data_id not in self.data_store and data_id not in self._version_ids
         self.data_store[data_id] = {
             'data': data,
             'identity': identity_id,
             'timestamp': datetime.utcnow().isoformat(),
             'signature': signature
         }
+        if is_new:
+            self._summarize("data", data_id, self._data_ids())
+        if start is not None:
+            _STORED.inc()
+            _STORE_SECONDS.observe(time.perf_counter() - start)
         return data_id
     
     def resolve_identity(self, identity_id: str) -> Optional[Identity]:
         """Resolve an identity by its ID."""
-        return self.identities.get(identity_id)
+        identity = self.identities.get(identity_id)
+        if metrics.ENABLED:
+            _RESOLVED["identity", identity is not None].inc()
+        return identity
     
     def resolve_data(self, data_id: str) -> Optional[Dict]:
         """Resolve data by its ID."""
-        return self.data_store.get(data_id)
+        data = self.data_store.get(data_id)
+        if data is None and data_id in self._version_ids:
+            data = self._version_entry(data_id)
+        if metrics.ENABLED:
+            _RESOLVED["data", data is not None].inc()
+        return data
+    
+    def put_version(self, identity_id: str, name: str, data: Dict, signature: str,
+                    timestamp: float = None) -> Tuple[int, str]:
+        """
+        Store a new version of the record ``name`` owned by an identity.
+        
+        Returns the version number and its content ID, which also resolves
+        through ``resolve_data``. Versions are kept as deltas with periodic
+        snapshots instead of full copies.
+        """
+        if identity_id not in self.identities:
+            raise ValueError("Unknown identity")
+        key = (identity_id, name)
+        chain = self.versions.get(key)
+        if chain is None:
+            chain = self.versions[key] = VersionChain()
+        data_id = self._generate_data_id(data)
+        if timestamp is None:
+            # The wall clock may step backwards; version timestamps must not
+            timestamp = max([time.time(), *chain.timestamps[-1:]])
+        version = chain.append(data, timestamp, data_id, signature)
+        if data_id not in self._version_ids and data_id not in self.data_store:
+            self._version_ids[data_id] = (key, version)
+            self._summarize("data", data_id, self._data_ids())
+        return version, data_id
+    
+    def get_version(self, identity_id: str, name: str, version: int = None,
+                    at: float = None) -> Optional[Dict]:
+        """
+        Data of a record: the latest version, a version number, or the
+        version current at timestamp ``at``. None if there is no such version.
+        """
+        chain = self.versions.get((identity_id, name))
+        if chain is None:
+            return None
+        if at is not None:
+            version = chain.version_at(at)
+            if version is None:
+                return None
+        try:
+            return chain.get(-1 if version is None else version)
+        except IndexError:
+            return None
+    
+    def history(self, identity_id: str, name: str) -> List[Dict]:
+        """Version number, timestamp and content ID of every version of a record."""
+        chain = self.versions.get((identity_id, name))
+        return chain.history() if chain is not None else []
+    
+    def _version_entry(self, data_id: str) -> Dict:
+        """A versioned record in the shape of a data_store entry."""
+        (identity_id, name), version = self._version_ids[data_id]
+        chain = self.versions[identity_id, name]
+        return {
+            'data': chain.get(version),
+            'identity': identity_id,
+            'timestamp': datetime.utcfromtimestamp(chain.timestamps[version]).isoformat(),
+            'signature': chain.signatures[version]
+        }
+    
+    def _data_ids(self) -> Iterable[str]:
+        return itertools.chain(self.data_store, self._version_ids)
+    
+    def membership_summary(self) -> Dict[str, str]:
+        """Serialized Bloom filters over identity and data IDs, for peers."""
+        return {kind: bloom.to_text() for kind, bloom in self.summaries.items()}
+    
+    def _summarize(self, kind: str, key: str, keys: Iterable[str]):
+        """Add a new key to its summary, rebuilding from all keys at twice the size when full."""
+        bloom = self.summaries[kind]
+        if bloom.full:
+            bloom = BloomFilter(bloom.capacity * 2, SUMMARY_FP_RATE)
+            bloom.update(keys)
+            self.summaries[kind] = bloom
+        else:
+            bloom.add(key)
     
     def _generate_identity_id(self, public_key: str) -> str:
         """Generate a unique ID for an identity."""
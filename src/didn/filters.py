@@ -0,0 +1,172 @@
+"""
+Membership Filters
+
+Compact, probabilistic summaries of which keys a node holds.
+
+A ``BloomFilter`` answers "definitely not here" or "probably here" for a
+key using a fixed number of bits per key. Nodes exchange serialized filters
+over their identities and data so a lookup is only sent to peers whose
+filter may contain the key; ``PeerDirectory`` keeps those summaries and
+picks the peers. A summary misses keys its node added after sending it, so
+it only rules peers out for ``ttl`` seconds; after that the peer is asked
+again until a fresh summary arrives.
+"""
+
+import base64
+import hashlib
+import math
+import struct
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+MAGIC = b"QBF1"
+_HEADER = struct.Struct(">4sIQQ")  # magic, hashes, bits, count
+
+# Seconds a received summary is trusted to rule a peer out
+SUMMARY_TTL = 30.0
+
+
+def optimal_parameters(capacity: int, fp_rate: float) -> Tuple[int, int]:
+    """Bits and hash count giving ``fp_rate`` at ``capacity`` keys."""
+    if capacity < 1:
+        raise ValueError("capacity must be positive")
+    if not 0 < fp_rate < 1:
+        raise ValueError("fp_rate must be between 0 and 1")
+    bits = math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)
+    bits = max(64, (bits + 63) // 64 * 64)
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+
+class BloomFilter:
+    """
+    Bloom filter with double hashing over a BLAKE2b digest.
+
+    Keys are strings or bytes and can only be added. ``count`` is the
+    number of ``add`` calls, so the false-positive estimate assumes keys are
+    not added twice.
+    """
+
+    def __init__(self, capacity: int = 1024, fp_rate: float = 0.01,
+                 bits: Optional[int] = None, hashes: Optional[int] = None):
+        if bits is None or hashes is None:
+            bits, hashes = optimal_parameters(capacity, fp_rate)
+        self.bits = bits
+        self.hashes = hashes
+        self.capacity = capacity
+        self.count = 0
+        self.array = bytearray(bits // 8 + (bits % 8 > 0))
+
+    def _positions(self, key: Union[str, bytes]):
+        if isinstance(key, str):
+            key = key.encode()
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        bits = self.bits
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % bits
+
+    def add(self, key: Union[str, bytes]):
+        """Add a key."""
+        array = self.array
+        for pos in self._positions(key):
+            array[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def update(self, keys: Iterable[str]):
+        """Add many keys."""
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key: Union[str, bytes]) -> bool:
+        array = self.array
+        return all(array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.array)
+
+    @property
+    def full(self) -> bool:
+        """True once more keys were added than the filter was sized for."""
+        return self.count > self.capacity
+
+    def false_positive_rate(self) -> float:
+        """Expected false-positive rate at the current fill."""
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+    def union(self, other: 'BloomFilter') -> 'BloomFilter':
+        """Filter holding the keys of both; both must have the same shape."""
+        if (self.bits, self.hashes) != (other.bits, other.hashes):
+            raise ValueError("Bloom filters differ in size or hash count")
+        merged = BloomFilter(bits=self.bits, hashes=self.hashes,
+                             capacity=self.capacity + other.capacity)
+        merged.array = bytearray(a | b for a, b in zip(self.array, other.array))
+        merged.count = self.count + other.count
+        return merged
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(MAGIC, self.hashes, self.bits, self.count) + bytes(self.array)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BloomFilter':
+        magic, hashes, bits, count = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a serialized Bloom filter")
+        array = data[_HEADER.size:]
+        if len(array) != bits // 8 + (bits % 8 > 0):
+            raise ValueError("Bloom filter data is truncated")
+        bloom = cls(bits=bits, hashes=hashes, capacity=max(count, 1))
+        bloom.array = bytearray(array)
+        bloom.count = count
+        return bloom
+
+    def to_text(self) -> str:
+        """Base64 form for JSON messages."""
+        return base64.b64encode(self.to_bytes()).decode()
+
+    @classmethod
+    def from_text(cls, text: str) -> 'BloomFilter':
+        return cls.from_bytes(base64.b64decode(text))
+
+
+class PeerDirectory:
+    """Membership summaries received from peers, used to route lookups."""
+
+    def __init__(self, ttl: Optional[float] = SUMMARY_TTL):
+        self.ttl = ttl
+        self.summaries: Dict[str, Dict[str, BloomFilter]] = {}
+        self.received: Dict[str, float] = {}
+
+    def update(self, peer_id: str, summary: Dict[str, str]):
+        """Store a peer's serialized summary, as made by ``DIDN.membership_summary``."""
+        self.summaries[peer_id] = {kind: BloomFilter.from_text(text) for kind, text in summary.items()}
+        self.received[peer_id] = time.monotonic()
+
+    def remove(self, peer_id: str):
+        self.summaries.pop(peer_id, None)
+        self.received.pop(peer_id, None)
+
+    def expired(self, peer_id: str) -> bool:
+        """Whether the peer has no summary or one older than ``ttl``."""
+        if peer_id not in self.received:
+            return True
+        return self.ttl is not None and time.monotonic() - self.received[peer_id] > self.ttl
+
+    def peers_for(self, kind: str, key: str, peers: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Peers that may hold ``key``.
+
+        Chooses among ``peers``, by default every peer with a summary. Peers
+        without a current summary of ``kind`` are always included.
+        """
+        candidates = []
+        for peer_id in self.summaries if peers is None else peers:
+            bloom = None if self.expired(peer_id) else self.summaries[peer_id].get(kind)
+            if bloom is None or key in bloom:
+                candidates.append(peer_id)
+        return candidates
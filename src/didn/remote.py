@@ -0,0 +1,365 @@
+"""
+Remote Resolution
+
+Resolve identities and data held by another node over QMP.
+
+A node serving lookups runs ``ResolverService``, which answers
+``didn_resolve`` requests from its DIDN. A node asking runs
+``RemoteResolver`` on a connection to it. The resolver keeps a local LRU
+cache, coalesces concurrent lookups of the same ID into one pending
+request (single-flight) and batches every ID requested within a short
+window into one ``didn_resolve`` frame, so thousands of concurrent lookups
+cost a handful of round trips.
+
+``RemoteResolver.refresh_summary`` fetches the peer's membership summary;
+for ``summary_ttl`` seconds after that, IDs the summary rules out are
+answered locally as misses. Keys the peer adds later are not in the
+summary, so once it expires every ID is asked for again until the next
+refresh.
+
+``PeerResolver`` resolves across several peers, with one ``RemoteResolver``
+per connection. It keeps their summaries in a ``PeerDirectory`` and sends a
+lookup only to the peers that may hold the ID.
+
+Any number of resolvers can share one QMP service: replies are routed by
+the connection they arrive on and a request ID unique within the process.
+"""
+
+import asyncio
+import itertools
+import time
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import DIDN, Identity
+from .filters import SUMMARY_TTL, BloomFilter, PeerDirectory
+
+RESOLVE = "didn_resolve"
+RESOLVED = "didn_resolved"
+SUMMARY = "didn_summary"
+SUMMARY_STATE = "didn_summary_state"
+KINDS = ("identities", "data")
+
+# Shared by every resolver, so request IDs never repeat within the process
+_request_ids = itertools.count(1)
+
+
+class ResolverService:
+    """Answer ``didn_resolve`` and ``didn_summary`` requests from a local DIDN."""
+
+    def __init__(self, didn: DIDN, qmp):
+        self.didn = didn
+        self.qmp = qmp
+        self.requests = 0
+        qmp.register_handler(RESOLVE, self._handle_resolve)
+        qmp.register_handler(SUMMARY, self._handle_summary)
+
+    async def _handle_summary(self, message, writer):
+        reply = self.qmp.create_message(
+            {"request_id": message.content["request_id"], "summary": self.didn.membership_summary()},
+            SUMMARY_STATE
+        )
+        await self.qmp.send(reply, writer)
+
+    async def _handle_resolve(self, message, writer):
+        self.requests += 1
+        content = message.content
+        identities = {}
+        for identity_id in content.get("identities", []):
+            identity = self.didn.resolve_identity(identity_id)
+            identities[identity_id] = identity.to_dict() if identity is not None else None
+        data = {
+            data_id: self.didn.resolve_data(data_id)
+            for data_id in content.get("data", [])
+        }
+        reply = self.qmp.create_message(
+            {"request_id": content["request_id"], "identities": identities, "data": data},
+            RESOLVED
+        )
+        await self.qmp.send(reply, writer)
+
+
+class _Replies:
+    """Route ``didn_resolved`` and ``didn_summary_state`` replies on one QMP service."""
+
+    _services: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+
+    def __init__(self, qmp):
+        self.waiting: Dict[Tuple[object, int], Callable[[Dict], None]] = {}
+        qmp.register_handler(RESOLVED, self._handle)
+        qmp.register_handler(SUMMARY_STATE, self._handle)
+
+    @classmethod
+    def of(cls, qmp) -> '_Replies':
+        """The dispatcher of ``qmp``, registering it on first use."""
+        replies = cls._services.get(qmp)
+        if replies is None:
+            replies = cls._services[qmp] = cls(qmp)
+        return replies
+
+    async def _handle(self, message, writer):
+        callback = self.waiting.pop((writer, message.content.get("request_id")), None)
+        if callback is not None:
+            callback(message.content)
+
+
+class RemoteResolver:
+    """
+    Resolve IDs through a peer running ``ResolverService``.
+
+    Args:
+        qmp: Local QMP service; it receives the replies.
+        writer: Connection to the peer, e.g. from ``qmp.connect``.
+        local: Optional DIDN consulted before asking the peer.
+        batch_window: Seconds to collect IDs before sending a request.
+        max_batch: IDs per request; a full batch is sent immediately.
+        cache_size: Resolved entries kept in the LRU cache.
+        timeout: Seconds to wait for a reply.
+        summary_ttl: Seconds a fetched summary is used to rule IDs out;
+            None trusts it until the next refresh.
+    """
+
+    def __init__(self, qmp, writer, local: Optional[DIDN] = None,
+                 batch_window: float = 0.002, max_batch: int = 512,
+                 cache_size: int = 10000, timeout: float = 5.0,
+                 summary_ttl: Optional[float] = SUMMARY_TTL):
+        self.qmp = qmp
+        self.writer = writer
+        self.local = local
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self.summary_ttl = summary_ttl
+        self.cache: 'OrderedDict[Tuple[str, str], object]' = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._pending: Dict[str, List[str]] = {kind: [] for kind in KINDS}
+        self._requests: Dict[int, List[Tuple[str, str]]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.summary: Optional[Dict[str, BloomFilter]] = None
+        self._summary_received = 0.0
+        self.stats = {"lookups": 0, "cache_hits": 0, "coalesced": 0, "filtered": 0, "requests": 0}
+        self._replies = _Replies.of(qmp)
+
+    async def refresh_summary(self) -> Dict[str, BloomFilter]:
+        """Fetch the peer's membership summary and filter lookups with it."""
+        summary = await self.fetch_summary()
+        self.summary = {kind: BloomFilter.from_text(text) for kind, text in summary.items()}
+        self._summary_received = time.monotonic()
+        return self.summary
+
+    async def fetch_summary(self) -> Dict[str, str]:
+        """The peer's serialized membership summary, without using it here."""
+        request_id = next(_request_ids)
+        future = asyncio.get_running_loop().create_future()
+
+        def answered(content: Dict):
+            if not future.done():
+                future.set_result(content["summary"])
+
+        self._replies.waiting[self.writer, request_id] = answered
+        try:
+            await self.qmp.send(self.qmp.create_message({"request_id": request_id}, SUMMARY), self.writer)
+            summary = await asyncio.wait_for(future, self.timeout)
+        finally:
+            self._replies.waiting.pop((self.writer, request_id), None)
+        return summary
+
+    def _ruled_out(self, kind: str, key_id: str) -> bool:
+        """Whether a current summary says the peer does not hold the key."""
+        if self.summary is None or kind not in self.summary:
+            return False
+        if self.summary_ttl is not None and time.monotonic() - self._summary_received > self.summary_ttl:
+            return False
+        return key_id not in self.summary[kind]
+
+    async def resolve_identity(self, identity_id: str) -> Optional[Identity]:
+        """Resolve an identity locally, from the cache or from the peer."""
+        if self.local is not None:
+            identity = self.local.resolve_identity(identity_id)
+            if identity is not None:
+                return identity
+        return await self._lookup("identities", identity_id)
+
+    async def resolve_data(self, data_id: str) -> Optional[Dict]:
+        """Resolve a data entry locally, from the cache or from the peer."""
+        if self.local is not None:
+            entry = self.local.resolve_data(data_id)
+            if entry is not None:
+                return entry
+        return await self._lookup("data", data_id)
+
+    async def resolve_identities(self, identity_ids: Iterable[str]) -> Dict[str, Optional[Identity]]:
+        """Resolve many identities in as few round trips as the batch size allows."""
+        identity_ids = list(identity_ids)
+        results = await asyncio.gather(*(self.resolve_identity(i) for i in identity_ids))
+        return dict(zip(identity_ids, results))
+
+    def _lookup(self, kind: str, key_id: str) -> asyncio.Future:
+        self.stats["lookups"] += 1
+        key = (kind, key_id)
+        loop = asyncio.get_running_loop()
+        if key in self.cache:
+            self.stats["cache_hits"] += 1
+            self.cache.move_to_end(key)
+            future = loop.create_future()
+            future.set_result(self.cache[key])
+            return future
+        if self._ruled_out(kind, key_id):
+            # The peer's summary rules the key out; no need to ask
+            self.stats["filtered"] += 1
+            future = loop.create_future()
+            future.set_result(None)
+            return future
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            # Shielded so one caller's cancellation does not fail the others
+            return asyncio.shield(future)
+
+        future = self._inflight[key] = loop.create_future()
+        pending = self._pending[kind]
+        pending.append(key_id)
+        if sum(len(ids) for ids in self._pending.values()) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        return asyncio.shield(future)
+
+    def _flush(self):
+        """Send every pending ID in one request."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not any(self._pending.values()):
+            return
+        request_id = next(_request_ids)
+        content = {"request_id": request_id}
+        keys = []
+        for kind in KINDS:
+            content[kind] = self._pending[kind]
+            keys.extend((kind, key_id) for key_id in self._pending[kind])
+            self._pending[kind] = []
+        self._requests[request_id] = keys
+        self._replies.waiting[self.writer, request_id] = self._resolved
+        self.stats["requests"] += 1
+
+        loop = asyncio.get_running_loop()
+        loop.call_later(self.timeout, self._expire, request_id)
+        message = self.qmp.create_message(content, RESOLVE)
+        task = loop.create_task(self.qmp.send(message, self.writer))
+        task.add_done_callback(lambda t: self._send_done(t, request_id))
+
+    def _send_done(self, task: asyncio.Task, request_id: int):
+        if not task.cancelled() and task.exception() is not None:
+            self._fail(request_id, task.exception())
+
+    def _expire(self, request_id: int):
+        self._fail(request_id, asyncio.TimeoutError(f"No reply to {RESOLVE} request {request_id}"))
+
+    def _fail(self, request_id: int, error: BaseException):
+        self._replies.waiting.pop((self.writer, request_id), None)
+        for key in self._requests.pop(request_id, []):
+            future = self._inflight.pop(key, None)
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+    def _resolved(self, content: Dict):
+        keys = self._requests.pop(content["request_id"], None)
+        if keys is None:
+            return  # expired
+        for kind, key_id in keys:
+            value = content.get(kind, {}).get(key_id)
+            if kind == "identities" and value is not None:
+                value = Identity.from_dict(value)
+            if value is not None:
+                # Misses are not cached; the ID may be registered later
+                self.cache[kind, key_id] = value
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            future = self._inflight.pop((kind, key_id), None)
+            if future is not None and not future.done():
+                future.set_result(value)
+
+
+class PeerResolver:
+    """
+    Resolve IDs through several peers running ``ResolverService``.
+
+    Each lookup goes to the peers ``directory`` says may hold the ID, in
+    parallel, and the first answer found in peer order wins. Peers whose
+    summary is missing or older than ``summary_ttl`` are always asked.
+
+    Args:
+        qmp: Local QMP service; it receives the replies.
+        local: Optional DIDN consulted before asking any peer.
+        summary_ttl: Seconds a peer's summary is used to rule it out.
+        options: Passed on to each peer's ``RemoteResolver``.
+    """
+
+    def __init__(self, qmp, local: Optional[DIDN] = None,
+                 summary_ttl: Optional[float] = SUMMARY_TTL, **options):
+        self.qmp = qmp
+        self.local = local
+        self.directory = PeerDirectory(ttl=summary_ttl)
+        self.peers: Dict[str, RemoteResolver] = {}
+        self._options = options
+        self.stats = {"lookups": 0, "filtered": 0, "asked": 0}
+
+    def add_peer(self, peer_id: str, writer) -> RemoteResolver:
+        """Route lookups to a peer as well; it is asked for everything until its summary arrives."""
+        self.peers[peer_id] = RemoteResolver(self.qmp, writer, **self._options)
+        return self.peers[peer_id]
+
+    def remove_peer(self, peer_id: str):
+        self.peers.pop(peer_id, None)
+        self.directory.remove(peer_id)
+
+    async def refresh_summaries(self):
+        """Fetch every peer's membership summary into the directory."""
+        peer_ids = list(self.peers)
+        summaries = await asyncio.gather(
+            *(self.peers[peer_id].fetch_summary() for peer_id in peer_ids), return_exceptions=True
+        )
+        for peer_id, summary in zip(peer_ids, summaries):
+            # A peer that does not answer keeps its old summary until it expires
+            if not isinstance(summary, BaseException) and peer_id in self.peers:
+                self.directory.update(peer_id, summary)
+
+    async def resolve_identity(self, identity_id: str) -> Optional[Identity]:
+        """Resolve an identity locally or from the peers that may hold it."""
+        if self.local is not None:
+            identity = self.local.resolve_identity(identity_id)
+            if identity is not None:
+                return identity
+        return await self._lookup("identities", identity_id)
+
+    async def resolve_data(self, data_id: str) -> Optional[Dict]:
+        """Resolve a data entry locally or from the peers that may hold it."""
+        if self.local is not None:
+            entry = self.local.resolve_data(data_id)
+            if entry is not None:
+                return entry
+        return await self._lookup("data", data_id)
+
+    async def _lookup(self, kind: str, key_id: str):
+        self.stats["lookups"] += 1
+        peer_ids = self.directory.peers_for(kind, key_id, self.peers)
+        if not peer_ids:
+            self.stats["filtered"] += 1
+            return None
+        self.stats["asked"] += len(peer_ids)
+        results = await asyncio.gather(
+            *(self.peers[peer_id]._lookup(kind, key_id) for peer_id in peer_ids),
+            return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        for result in results:
+            if result is not None and not isinstance(result, BaseException):
+                return result
+        if errors:
+            # A peer that failed may have held it, so this is not a miss
+            raise errors[0]
+        return None
@@ -0,0 +1,136 @@
+"""
+Versioned Data
+
+History of one logical record as a chain of versions.
+
+Each version is stored either as a full snapshot or as a delta against the
+previous version; a snapshot is taken every ``snapshot_interval`` versions,
+so reading any version applies at most that many deltas and memory grows
+with the size of the changes rather than with full copies. Version
+timestamps are kept sorted, so the version current at a point in time is
+found by binary search.
+"""
+
+import copy
+import json
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional
+
+SNAPSHOT_INTERVAL = 32
+
+
+def _same(a: Any, b: Any) -> bool:
+    """Equality that also tells 1, 1.0 and True apart, at any depth."""
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_same(a[key], b[key]) for key in a)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def diff(old: Dict, new: Dict) -> Dict:
+    """Delta turning ``old`` into ``new``; nested dicts are diffed recursively."""
+    delta: Dict[str, Any] = {}
+    sets = {}
+    subs = {}
+    for key, value in new.items():
+        if key not in old:
+            sets[key] = value
+            continue
+        previous = old[key]
+        if _same(previous, value):
+            continue
+        if isinstance(previous, dict) and isinstance(value, dict):
+            subs[key] = diff(previous, value)
+        else:
+            sets[key] = value
+    removed = [key for key in old if key not in new]
+    if sets:
+        delta["set"] = sets
+    if subs:
+        delta["sub"] = subs
+    if removed:
+        delta["del"] = removed
+    return delta
+
+
+def patch(data: Dict, delta: Dict) -> Dict:
+    """Apply a delta from ``diff`` to ``data`` in place and return it."""
+    for key in delta.get("del", ()):
+        del data[key]
+    for key, value in delta.get("set", {}).items():
+        data[key] = copy.deepcopy(value)
+    for key, sub in delta.get("sub", {}).items():
+        patch(data[key], sub)
+    return data
+
+
+class VersionChain:
+    """
+    Versions of one record, numbered from 0, with non-decreasing timestamps.
+
+    Each entry also records the content ID and signature of its version.
+    """
+
+    def __init__(self, snapshot_interval: int = SNAPSHOT_INTERVAL):
+        if snapshot_interval < 1:
+            raise ValueError("snapshot_interval must be positive")
+        self.snapshot_interval = snapshot_interval
+        self.timestamps: List[float] = []
+        self.data_ids: List[str] = []
+        self.signatures: List[str] = []
+        # A snapshot (full data) or a delta against the previous version
+        self._payloads: List[Dict] = []
+        self._latest: Optional[Dict] = None
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def append(self, data: Dict, timestamp: float, data_id: str, signature: str = "") -> int:
+        """Add a version and return its number."""
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            raise ValueError("Version timestamps must not decrease")
+        # A private copy, so later changes by the caller do not leak in
+        data = json.loads(json.dumps(data))
+        version = len(self.timestamps)
+        if version % self.snapshot_interval == 0:
+            self._payloads.append({"snapshot": data})
+        else:
+            self._payloads.append({"delta": diff(self._latest, data)})
+        self.timestamps.append(timestamp)
+        self.data_ids.append(data_id)
+        self.signatures.append(signature)
+        self._latest = data
+        return version
+
+    def get(self, version: int = -1) -> Dict:
+        """Data of a version; negative numbers count from the latest."""
+        if version < 0:
+            version += len(self)
+        if not 0 <= version < len(self):
+            raise IndexError(f"No version {version}")
+        if version == len(self) - 1:
+            return copy.deepcopy(self._latest)
+        base = version - version % self.snapshot_interval
+        data = copy.deepcopy(self._payloads[base]["snapshot"])
+        for index in range(base + 1, version + 1):
+            patch(data, self._payloads[index]["delta"])
+        return data
+
+    def version_at(self, timestamp: float) -> Optional[int]:
+        """Number of the version current at ``timestamp``, or None if none existed yet."""
+        index = bisect_right(self.timestamps, timestamp) - 1
+        return index if index >= 0 else None
+
+    def history(self) -> List[Dict[str, Any]]:
+        """Version number, timestamp and content ID of every version."""
+        return [
+            {"version": version, "timestamp": timestamp, "data_id": data_id}
+            for version, (timestamp, data_id) in enumerate(zip(self.timestamps, self.data_ids))
+        ]
+
+    def stored_bytes(self) -> int:
+        """Approximate size of the stored snapshots and deltas, as JSON."""
+        return sum(len(json.dumps(payload)) for payload in self._payloads)
@@ -0,0 +1,274 @@
+"""
+Runtime Metrics
+
+Lightweight counters, gauges and log-bucketed (HDR-style) latency
+histograms shared by all subsystems, exportable in the Prometheus text
+format from a small local HTTP endpoint.
+
+Instrumented code checks the module-level ``ENABLED`` flag before touching
+any metric, so with metrics disabled a hot path pays for one attribute
+lookup. Set ``OSIRIS_METRICS=0`` in the environment, or call ``disable()``,
+to turn them off.
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+ENABLED = os.environ.get("OSIRIS_METRICS", "1").lower() not in ("0", "false", "no", "off")
+
+# Histogram buckets split every power of two into this many linear steps,
+# giving about 3% relative error on quantiles
+SUB_BUCKETS = 16
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def enable():
+    """Turn metric collection on."""
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    """Turn metric collection off; instrumented code skips all updates."""
+    global ENABLED
+    ENABLED = False
+
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    """Monotonically increasing value."""
+
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name: str) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        yield name, {}, self.value
+
+
+class Gauge:
+    """Value that can go up and down."""
+
+    kind = "gauge"
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def samples(self, name: str) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        yield name, {}, self.value
+
+
+class Histogram:
+    """
+    Latency distribution in log-linear buckets.
+
+    Memory grows with the number of distinct buckets hit (a few hundred at
+    most for latencies), not with the number of observations.
+    """
+
+    kind = "summary"
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.buckets: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _index(value: float) -> int:
+        if value <= 0:
+            return -(1 << 30)
+        mantissa, exponent = math.frexp(value)
+        return exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+
+    @staticmethod
+    def _upper_bound(index: int) -> float:
+        if index == -(1 << 30):
+            return 0.0
+        exponent, sub = divmod(index, SUB_BUCKETS)
+        return math.ldexp(0.5 + (sub + 1) / (2 * SUB_BUCKETS), exponent)
+
+    def observe(self, value: float):
+        """Record one value (seconds for latencies)."""
+        index = self._index(value)
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    @contextmanager
+    def time(self):
+        """Observe the duration of a with-block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile."""
+        with self._lock:
+            items = sorted(self.buckets.items())
+            count = self.count
+        if not count:
+            return math.nan
+        rank = q * count
+        seen = 0
+        for index, n in items:
+            seen += n
+            if seen >= rank:
+                return self._upper_bound(index)
+        return self._upper_bound(items[-1][0])
+
+    def samples(self, name: str) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        for q in QUANTILES:
+            yield name, {"quantile": str(q)}, self.quantile(q)
+        yield f"{name}_sum", {}, self.sum
+        yield f"{name}_count", {}, self.count
+
+
+class Registry:
+    """Named metrics, each with any number of label sets."""
+
+    def __init__(self):
+        self._families: Dict[str, Tuple[type, str, Dict[LabelKey, object]]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help_text: str, labels: Dict[str, str]):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        family = self._families.get(name)
+        if family is None:
+            with self._lock:
+                family = self._families.setdefault(name, (cls, help_text, {}))
+        if family[0] is not cls:
+            raise ValueError(f"Metric {name} is already registered as a {family[0].kind}")
+        children = family[2]
+        metric = children.get(key)
+        if metric is None:
+            with self._lock:
+                metric = children.setdefault(key, cls())
+        return metric
+
+    def counter(self, name: str, help_text: str = "", **labels) -> Counter:
+        """Get or create a counter."""
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str = "", **labels) -> Gauge:
+        """Get or create a gauge."""
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str = "", **labels) -> Histogram:
+        """Get or create a latency histogram."""
+        return self._get(Histogram, name, help_text, labels)
+
+    def get(self, name: str, **labels):
+        """Look up an existing metric, or None."""
+        family = self._families.get(name)
+        if family is None:
+            return None
+        return family[2].get(tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def reset(self):
+        """Zero every metric in place; references held by callers stay valid."""
+        with self._lock:
+            for _, _, children in self._families.values():
+                for metric in children.values():
+                    metric.__init__()
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for name, (cls, help_text, children) in sorted(self._families.items()):
+            if help_text:
+                lines.append(f"# HELP {name} {_escape_help(help_text)}")
+            lines.append(f"# TYPE {name} {cls.kind}")
+            for key, metric in list(children.items()):
+                for sample_name, extra, value in metric.samples(name):
+                    labels = dict(key, **extra)
+                    lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+async def serve(host: str = "127.0.0.1", port: int = 9464,
+                registry: Optional[Registry] = None) -> asyncio.AbstractServer:
+    """Serve ``GET /metrics`` in the Prometheus text format."""
+    registry = registry or REGISTRY
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readline()
+            # Skip the request headers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                body = registry.render().encode()
+                status = "200 OK"
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                body = b"Not Found\n"
+                status = "404 Not Found"
+                content_type = "text/plain"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
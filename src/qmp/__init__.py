@@ -8,8 +8,29 @@ import asyncio
 from typing import Dict, Any, Optional, Callable
 import json
 import hashlib
+import os
+import time
 from dataclasses import dataclass
 
+from .. import metrics
+from . import transports
+from .profiling import HandlerTimer, SamplingProfiler
+
+_CONNECTIONS = metrics.gauge("qmp_connections", "Open QMP connections")
+_BYTES_RECEIVED = metrics.counter("qmp_received_bytes_total", "Frame bytes received")
+_BYTES_SENT = metrics.counter("qmp_sent_bytes_total", "Frame bytes sent")
+_MESSAGES_SENT = metrics.counter("qmp_sent_messages_total", "Frames written by broadcast")
+_SEND_ERRORS = metrics.counter("qmp_send_errors_total", "Failed broadcast writes")
+_DECODE_SECONDS = metrics.histogram("qmp_decode_seconds", "Time to decode one frame")
+_ENCODE_SECONDS = metrics.histogram("qmp_encode_seconds", "Time to encode one broadcast frame")
+_DROPPED_DUPLICATE = metrics.counter("qmp_dropped_messages_total", "Frames dropped by the replay guard",
+                                     reason="duplicate")
+_DROPPED_STALE = metrics.counter("qmp_dropped_messages_total", reason="stale")
+_DROPPED_OVERFLOW = metrics.counter("qmp_dropped_messages_total", reason="overflow")
+# Message types come from peers; only types with a handler get their own series
+_RECEIVED_HELP = "Frames received by message type"
+_RECEIVED_OTHER = metrics.counter("qmp_received_messages_total", _RECEIVED_HELP, type="other")
+
 @dataclass
 class QMPMessage:
     """Represents a message in the Quantum Mesh Protocol."""
@@ -37,47 +58,106 @@ class QMPMessage:
 class QMPService:
     """Implementation of the Quantum Mesh Protocol service."""
     
-    def __init__(self, node_id: str, private_key: str = None):
+    def __init__(self, node_id: str, private_key: str = None,
+                 slow_threshold: Optional[float] = None, replay_guard=None):
         self.node_id = node_id
         self.private_key = private_key
         self.message_handlers = {}
+        self._received_counters: Dict[str, metrics.Counter] = {}
         self.connections = set()
         self.message_queue = asyncio.Queue()
+        # Messages slower than slow_threshold seconds are logged
+        self.handler_timer = HandlerTimer(slow_threshold)
+        self.profiler: Optional[SamplingProfiler] = None
+        self.peer_tasks = set()
+        self.unix_path: Optional[str] = None
+        # Optional dedup.ReplayGuard dropping duplicate and stale messages
+        self.replay_guard = replay_guard
     
-    async def start(self, host: str = '0.0.0.0', port: int = 0):
-        """Start the QMP service."""
-        self.server = await asyncio.start_server(
-            self._handle_connection, 
-            host=host, 
-            port=port
+    async def start(self, host: str = '0.0.0.0', port: int = 0, path: str = None,
+                    reuse_port: bool = False):
+        """
+        Start the QMP service.
+        
+        Listens on the Unix socket ``path`` when given, on TCP otherwise.
+        With ``reuse_port`` several processes can listen on the same port.
+        Returns the bound address (the path for Unix sockets).
+        """
+        self.server = await transports.start_server(
+            self._handle_connection,
+            host=host,
+            port=port,
+            path=path,
+            reuse_port=reuse_port
         )
+        self.unix_path = path
         return self.server.sockets[0].getsockname()
     
     async def stop(self):
-        """Stop the QMP service."""
-        self.server.close()
-        await self.server.wait_closed()
+        """Stop the QMP service and close outbound peer connections."""
+        # A service that only made outbound connections has no server
+        if getattr(self, "server", None) is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            if self.unix_path is not None and os.path.exists(self.unix_path):
+                os.unlink(self.unix_path)
+        for task in list(self.peer_tasks):
+            task.cancel()
+        if self.peer_tasks:
+            await asyncio.gather(*self.peer_tasks, return_exceptions=True)
+    
+    async def connect(self, host: str = None, port: int = None, path: str = None):
+        """Connect to a peer; its messages go to the registered handlers like inbound ones."""
+        reader, writer = await transports.open_connection(host, port, path)
+        # Added here as well, so a broadcast right after connect reaches the peer
+        self.connections.add(writer)
+        task = asyncio.ensure_future(self._handle_connection(reader, writer))
+        self.peer_tasks.add(task)
+        task.add_done_callback(self.peer_tasks.discard)
+        return writer
+    
+    async def send(self, message: QMPMessage, writer):
+        """Send a message over one connection."""
+        message_data = json.dumps(message.to_dict()).encode()
+        writer.write(len(message_data).to_bytes(4, 'big') + message_data)
+        await writer.drain()
+        if metrics.ENABLED:
+            _MESSAGES_SENT.inc()
+            _BYTES_SENT.inc(len(message_data) + 4)
     
     def register_handler(self, message_type: str, handler: Callable):
         """Register a message handler for a specific message type."""
         self.message_handlers[message_type] = handler
+        self._received_counters[message_type] = metrics.counter(
+            "qmp_received_messages_total", _RECEIVED_HELP, type=message_type
+        )
     
     async def broadcast(self, message: QMPMessage, exclude: set = None):
         """Broadcast a message to all connected nodes."""
         if exclude is None:
             exclude = set()
         
+        start = time.perf_counter() if metrics.ENABLED else None
         message_data = json.dumps(message.to_dict()).encode()
+        if start is not None:
+            _ENCODE_SECONDS.observe(time.perf_counter() - start)
         for writer in self.connections - exclude:
             try:
                 writer.write(len(message_data).to_bytes(4, 'big') + message_data)
                 await writer.drain()
+                if metrics.ENABLED:
+                    _MESSAGES_SENT.inc()
+                    _BYTES_SENT.inc(len(message_data) + 4)
             except Exception as e:
+                if metrics.ENABLED:
+                    _SEND_ERRORS.inc()
                 print(f"Error broadcasting message: {e}")
     
     async def _handle_connection(self, reader, writer):
         """Handle incoming connection."""
         self.connections.add(writer)
+        if metrics.ENABLED:
+            _CONNECTIONS.inc()
         try:
             while True:
                 # Read message length (4 bytes)
@@ -87,7 +167,27 @@ class QMPService:
                     
                 # Read message data
                 data = await reader.readexactly(int.from_bytes(data_length, 'big'))
-                message = QMPMessage.from_dict(json.loads(data.decode()))
+                guard = self.replay_guard
+                dropped = guard.seen_frame(data) if guard is not None else None
+                if dropped is not None:
+                    # Duplicates are dropped before they are decoded
+                    if metrics.ENABLED:
+                        (_DROPPED_OVERFLOW if dropped == "overflow" else _DROPPED_DUPLICATE).inc()
+                    continue
+                if metrics.ENABLED:
+                    start = time.perf_counter()
+                    message = QMPMessage.from_dict(json.loads(data.decode()))
+                    _DECODE_SECONDS.observe(time.perf_counter() - start)
+                    _BYTES_RECEIVED.inc(len(data) + 4)
+                    self._received_counters.get(message.message_type, _RECEIVED_OTHER).inc()
+                else:
+                    message = QMPMessage.from_dict(json.loads(data.decode()))
+                if guard is not None:
+                    if not guard.fresh(message.timestamp):
+                        if metrics.ENABLED:
+                            _DROPPED_STALE.inc()
+                        continue
+                    guard.remember(data)
                 
                 # Process message
                 await self._process_message(message, writer)
@@ -95,16 +195,40 @@ class QMPService:
         except (asyncio.IncompleteReadError, ConnectionResetError):
             pass
         finally:
+            if metrics.ENABLED and writer in self.connections:
+                _CONNECTIONS.dec()
             self.connections.discard(writer)
             writer.close()
             await writer.wait_closed()
     
     async def _process_message(self, message: QMPMessage, writer):
-        """Process incoming message."""
-        if message.message_type in self.message_handlers:
-            await self.message_handlers[message.message_type](message, writer)
-        else:
+        """Process incoming message, timing it per message type."""
+        handler = self.message_handlers.get(message.message_type)
+        if handler is None:
             print(f"No handler for message type: {message.message_type}")
+            return
+        start = time.perf_counter()
+        try:
+            await handler(message, writer)
+        finally:
+            self.handler_timer.record(message.message_type, time.perf_counter() - start)
+    
+    def start_profiler(self, interval: float = 0.01) -> SamplingProfiler:
+        """Start the sampling profiler, keeping samples from earlier runs."""
+        if self.profiler is None:
+            self.profiler = SamplingProfiler(interval)
+        self.profiler.interval = interval
+        self.profiler.start()
+        return self.profiler
+    
+    def stop_profiler(self, path: Optional[str] = None) -> Optional[str]:
+        """Stop the profiler; returns the collapsed stacks, or writes them to path."""
+        if self.profiler is None:
+            return None
+        self.profiler.stop()
+        if path is not None:
+            return self.profiler.dump(path)
+        return self.profiler.collapsed()
     
     def create_message(self, content: Dict, message_type: str) -> QMPMessage:
         """Create a new QMP message."""
@@ -112,5 +236,5 @@ class QMPService:
             content=content,
             sender_id=self.node_id,
             message_type=message_type,
-            timestamp=asyncio.get_event_loop().time()
+            timestamp=time.time()
         )
@@ -0,0 +1,95 @@
+"""
+Replay Protection
+
+Drop duplicate and replayed QMP frames with bounded memory.
+
+``ReplayGuard`` remembers the raw bytes of recently accepted frames in two
+rotating Bloom filters, so a duplicate is recognised before it is decoded.
+Each filter covers one ``window`` and filters rotate by time only;
+keeping the previous one means every frame is remembered for at least a
+full window. Messages whose timestamp is further than ``max_skew`` from
+the local clock are rejected as stale. A frame therefore stays fresh for
+up to ``2 * max_skew`` seconds after it was first accepted, and because
+that may not exceed ``window``, a replay is either still remembered or
+already stale.
+
+A frame is only remembered once it has decoded and passed the freshness
+check, so junk and stale frames cost no capacity. Rotating early when a
+filter fills up would break the guarantee above, so once ``capacity``
+frames were accepted within a window further new frames are dropped until
+the next rotation. Size ``capacity`` for the peak frame rate times
+``window``.
+
+A false positive drops a message that was never seen, so filters are sized
+for a very low rate (one in a million by default).
+"""
+
+import time
+from typing import Callable, Optional
+
+from ..didn.filters import BloomFilter
+
+
+class ReplayGuard:
+    """
+    Time-windowed duplicate filter for raw frames.
+
+    Args:
+        window: Seconds each Bloom generation covers.
+        max_skew: Largest accepted distance between a message timestamp
+            and the local clock, in seconds.
+        capacity: Frames accepted per window; more are dropped until the
+            next rotation.
+        fp_rate: False-positive rate of each generation at capacity.
+        clock: Wall-clock source, seconds since the epoch.
+    """
+
+    def __init__(self, window: float = 60.0, max_skew: float = 30.0,
+                 capacity: int = 100000, fp_rate: float = 1e-6,
+                 clock: Callable[[], float] = time.time):
+        if 2 * max_skew > window:
+            raise ValueError("max_skew must not exceed half the window, or old replays slip through")
+        self.window = window
+        self.max_skew = max_skew
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.clock = clock
+        self.current = BloomFilter(capacity, fp_rate)
+        self.previous = BloomFilter(capacity, fp_rate)
+        self.rotated_at = clock()
+        self.stats = {"accepted": 0, "duplicate": 0, "stale": 0, "overflow": 0}
+
+    def _rotate(self):
+        self.previous = self.current
+        self.current = BloomFilter(self.capacity, self.fp_rate)
+        self.rotated_at = self.clock()
+
+    def seen_frame(self, frame: bytes) -> Optional[str]:
+        """
+        Why the frame must be dropped, or None.
+
+        ``"duplicate"`` if it was seen recently, ``"overflow"`` if this
+        window is already at capacity. Call ``remember`` once the frame
+        has been decoded and found fresh.
+        """
+        if self.clock() - self.rotated_at >= self.window:
+            self._rotate()
+        if frame in self.current or frame in self.previous:
+            self.stats["duplicate"] += 1
+            return "duplicate"
+        if self.current.count >= self.capacity:
+            self.stats["overflow"] += 1
+            return "overflow"
+        return None
+
+    def remember(self, frame: bytes):
+        """Record an accepted frame so its replays are dropped."""
+        self.current.add(frame)
+
+    def fresh(self, timestamp: float) -> bool:
+        """True if a message timestamp is within the skew window."""
+        if abs(self.clock() - timestamp) > self.max_skew:
+            self.stats["stale"] += 1
+            return False
+        self.stats["accepted"] += 1
+        return True
@@ -0,0 +1,209 @@
+"""
+Handler Profiling
+
+Per-message-type handler timing and a low-overhead sampling profiler.
+
+``HandlerTimer`` attributes processing time to the message type that caused
+it and reports messages slower than a threshold. ``SamplingProfiler`` walks
+the stacks of all other threads from a background thread at a fixed
+interval and aggregates them as collapsed stacks (``frame;frame;frame N``),
+the input format of flamegraph.pl, speedscope and similar tools. Its cost
+is proportional to the sample rate, not to the amount of work being done,
+so it can stay on in production at a low rate.
+"""
+
+import os
+import signal
+import sys
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from .. import metrics
+
+# Distinct stacks kept before new ones are folded into one bucket
+MAX_STACKS = 10000
+TRUNCATED = "[truncated]"
+
+
+class HandlerStats:
+    """Running totals for one message type."""
+
+    __slots__ = ("count", "total", "max", "slow")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"count": self.count, "total": self.total, "mean": self.mean,
+                "max": self.max, "slow": self.slow}
+
+
+class HandlerTimer:
+    """
+    Time message handling per message type.
+
+    Durations also go to the ``qmp_handler_seconds`` histogram, labelled by
+    type, while metrics are enabled. A message taking longer than
+    ``slow_threshold`` seconds is passed to ``on_slow``.
+    """
+
+    def __init__(self, slow_threshold: Optional[float] = None,
+                 on_slow: Optional[Callable[[str, float], None]] = None):
+        self.slow_threshold = slow_threshold
+        self.on_slow = on_slow or _print_slow
+        self.stats: Dict[str, HandlerStats] = {}
+
+    def record(self, message_type: str, elapsed: float):
+        """Account one handled message."""
+        stats = self.stats.get(message_type)
+        if stats is None:
+            stats = self.stats[message_type] = HandlerStats()
+        stats.count += 1
+        stats.total += elapsed
+        if elapsed > stats.max:
+            stats.max = elapsed
+        if metrics.ENABLED:
+            metrics.histogram(
+                "qmp_handler_seconds", "Handler time by message type", type=message_type
+            ).observe(elapsed)
+        if self.slow_threshold is not None and elapsed > self.slow_threshold:
+            stats.slow += 1
+            if metrics.ENABLED:
+                metrics.counter(
+                    "qmp_slow_messages_total", "Messages over the slow threshold", type=message_type
+                ).inc()
+            self.on_slow(message_type, elapsed)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per-type statistics, slowest total first."""
+        ordered = sorted(self.stats.items(), key=lambda item: item[1].total, reverse=True)
+        return {name: stats.to_dict() for name, stats in ordered}
+
+
+def _print_slow(message_type: str, elapsed: float):
+    print(f"Slow message: {message_type} took {elapsed * 1000:.1f} ms")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling every thread except its own.
+
+    Args:
+        interval: Seconds between samples (0.01 = 100 Hz).
+        max_depth: Frames kept per stack, innermost first.
+    """
+
+    def __init__(self, interval: float = 0.01, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start sampling in a daemon thread; no-op when already running."""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="qmp-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling; collected stacks are kept."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def toggle(self) -> bool:
+        """Start when stopped, stop when running; returns the new state."""
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+        return self.running
+
+    def reset(self):
+        """Drop all collected samples."""
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            # Thread names are looked up lazily; new threads appear rarely
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                self._add(names.get(ident, str(ident)), frame)
+            del frames
+
+    def _add(self, thread_name: str, frame):
+        stack: List[str] = []
+        while frame is not None and len(stack) < self.max_depth:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        stack.append(thread_name)
+        key = ";".join(reversed(stack))
+        with self._lock:
+            self.samples += 1
+            if key not in self.stacks and len(self.stacks) >= MAX_STACKS:
+                key = f"{thread_name};{TRUNCATED}"
+            self.stacks[key] += 1
+
+    def collapsed(self) -> str:
+        """Samples as collapsed stacks, one ``stack count`` line each."""
+        with self._lock:
+            items = sorted(self.stacks.items())
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def dump(self, path: str) -> str:
+        """Write collapsed stacks to path and return it."""
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+        return path
+
+
+def install_signal_toggle(profiler: SamplingProfiler, path: str,
+                          signum: int = getattr(signal, "SIGUSR2", None)):
+    """
+    Toggle the profiler with a signal, dumping collected stacks on stop.
+
+    ``kill -USR2 <pid>`` starts sampling; the next signal stops it and
+    writes the collapsed stacks to path.
+    """
+    if signum is None:
+        raise RuntimeError("Signal toggling is not supported on this platform")
+
+    def handle(signum, frame):
+        # Stopping joins the sampler thread, which never blocks on this one
+        if not profiler.toggle():
+            profiler.dump(path)
+            print(f"Profile written to {path}")
+
+    signal.signal(signum, handle)
@@ -0,0 +1,158 @@
+"""
+QMP Transports
+
+Listener and connection backends for QMPService.
+
+Besides TCP, a service can listen on a Unix domain socket, which skips the
+TCP/IP stack for nodes on the same host. ``install_uvloop`` switches the
+event loop policy to uvloop when that package is installed. ``ReusePortGroup``
+runs several processes that each listen on the same TCP port with
+``SO_REUSEPORT``, letting the kernel spread inbound connections across them.
+"""
+
+import asyncio
+import importlib
+import multiprocessing
+import socket
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Address = Dict[str, Any]
+
+
+def parse_address(address: str) -> Address:
+    """
+    Parse ``tcp://host:port``, ``unix:///path`` or plain ``host:port``.
+
+    Returns keyword arguments for ``QMPService.start`` and ``connect``.
+    """
+    if address.startswith("unix://"):
+        return {"path": address[len("unix://"):]}
+    if address.startswith("tcp://"):
+        address = address[len("tcp://"):]
+    host, sep, port = address.rpartition(":")
+    if not sep or not host:
+        raise ValueError(f"Expected tcp://host:port, unix:///path or host:port, got {address!r}")
+    return {"host": host.strip("[]"), "port": int(port)}
+
+
+async def start_server(handler: Callable, host: Optional[str] = None, port: int = 0,
+                       path: Optional[str] = None, reuse_port: bool = False) -> asyncio.AbstractServer:
+    """Listen on a Unix socket when path is given, on TCP otherwise."""
+    if path is not None:
+        return await asyncio.start_unix_server(handler, path=path)
+    return await asyncio.start_server(handler, host=host, port=port,
+                                      reuse_port=reuse_port or None)
+
+
+async def open_connection(host: Optional[str] = None, port: Optional[int] = None,
+                          path: Optional[str] = None):
+    """Connect over a Unix socket when path is given, over TCP otherwise."""
+    if path is not None:
+        return await asyncio.open_unix_connection(path)
+    return await asyncio.open_connection(host, port)
+
+
+def uvloop_available() -> bool:
+    """True when the optional uvloop package can be imported."""
+    try:
+        importlib.import_module("uvloop")
+    except ImportError:
+        return False
+    return True
+
+
+def install_uvloop() -> bool:
+    """Use uvloop for new event loops if it is installed; returns whether it was."""
+    try:
+        uvloop = importlib.import_module("uvloop")
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+def new_event_loop(kind: str = "asyncio") -> asyncio.AbstractEventLoop:
+    """A new ``asyncio`` or ``uvloop`` event loop."""
+    if kind == "uvloop":
+        return importlib.import_module("uvloop").new_event_loop()
+    if kind != "asyncio":
+        raise ValueError(f"Unknown event loop {kind!r}")
+    return asyncio.new_event_loop()
+
+
+def _reuse_port_child(factory: Callable, args: Tuple, host: str, port: int,
+                      use_uvloop: bool, ready):
+    if use_uvloop:
+        install_uvloop()
+
+    async def serve():
+        service = factory(*args)
+        await service.start(host, port, reuse_port=True)
+        ready.set()
+        # Serve until the parent terminates this process
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+class ReusePortGroup:
+    """
+    Several processes serving one TCP port through ``SO_REUSEPORT``.
+
+    Args:
+        factory: Picklable callable returning a QMPService with its handlers
+            registered; it is called in each process with ``args``.
+        processes: Number of listening processes.
+        use_uvloop: Install uvloop in the children when available.
+    """
+
+    def __init__(self, factory: Callable, args: Tuple = (), host: str = "127.0.0.1",
+                 port: int = 0, processes: int = 2, use_uvloop: bool = False):
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise RuntimeError("SO_REUSEPORT is not supported on this platform")
+        self.factory = factory
+        self.args = args
+        self.host = host
+        self.port = port
+        self.processes = processes
+        self.use_uvloop = use_uvloop
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._context = multiprocessing.get_context(method)
+        self._children: List[multiprocessing.Process] = []
+
+    @property
+    def pids(self) -> List[int]:
+        return [child.pid for child in self._children]
+
+    def start(self, timeout: float = 30.0) -> int:
+        """Start the processes and return the shared port once all listen."""
+        # Bound but never listening, this socket only reserves the port
+        # (possibly picked by the OS) until the children have bound it too
+        reserve = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET)
+        reserve.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        try:
+            reserve.bind((self.host, self.port))
+            self.port = reserve.getsockname()[1]
+            for _ in range(self.processes):
+                ready = self._context.Event()
+                child = self._context.Process(
+                    target=_reuse_port_child, daemon=True,
+                    args=(self.factory, self.args, self.host, self.port, self.use_uvloop, ready)
+                )
+                child.start()
+                self._children.append(child)
+                if not ready.wait(timeout):
+                    self.stop()
+                    raise RuntimeError(f"Listener process {child.pid} did not start")
+        finally:
+            reserve.close()
+        return self.port
+
+    def stop(self):
+        """Terminate every listener process."""
+        for child in self._children:
+            if child.is_alive():
+                child.terminate()
+        for child in self._children:
+            child.join()
+        self._children.clear()
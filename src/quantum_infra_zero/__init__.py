@@ -0,0 +1,10 @@
+"""
+Quantum Infrastructure Zero
+
+Node runtime that wires DIDN, QMP, AI nodes and the CI/CD runner together,
+and the ``quantum-node`` command line that launches it.
+"""
+
+from .runtime import NodeConfig, NodeRuntime
+
+__version__ = "0.1.0"
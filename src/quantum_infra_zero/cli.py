@@ -0,0 +1,135 @@
+"""
+quantum-node command line.
+
+Usage:
+    quantum-node --config node.json
+    quantum-node --node-id relay-1 --port 7000 --no-didn --relay chat_message
+    quantum-node --config node.json --profile-startup
+
+``--profile-startup`` starts the node once in a child interpreter under
+``-X importtime``, stops it again and prints the slowest imports and the
+total startup time.
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from ..qmp.transports import install_uvloop
+
+from .runtime import NodeConfig, NodeRuntime, format_address
+
+# Imports shown by --profile-startup
+TOP_IMPORTS = 15
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="quantum-node", description="Run a Quantum Infrastructure Zero node")
+    parser.add_argument("--config", help="JSON node config; flags override its values")
+    parser.add_argument("--node-id", help="node identifier")
+    parser.add_argument("--host", help="address to listen on")
+    parser.add_argument("--port", type=int, help="port to listen on (0 picks a free one)")
+    parser.add_argument("--unix-path", dest="path", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--uvloop", action="store_true", help="use the uvloop event loop when installed")
+    parser.add_argument("--peer", action="append", default=[],
+                        help="peer to connect to as host:port or unix:///path (repeatable)")
+    parser.add_argument("--relay", action="append", default=[],
+                        help="message type to forward to all other peers (repeatable)")
+    parser.add_argument("--no-didn", action="store_true", help="do not start the identity layer")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port")
+    parser.add_argument("--slow-threshold", type=float, help="log messages slower than this many seconds")
+    parser.add_argument("--replay-window", type=float,
+                        help="drop duplicate frames seen within this many seconds, and stale messages")
+    parser.add_argument("--exit-after-start", action="store_true",
+                        help="start the node, then stop it and exit (startup check)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report import times and total startup time, then exit")
+    return parser
+
+
+def config_from_args(args: argparse.Namespace) -> NodeConfig:
+    """Load the config file, if any, and apply command-line overrides."""
+    config = NodeConfig.load(args.config) if args.config else NodeConfig()
+    for name in ("node_id", "host", "port", "path", "metrics_port", "slow_threshold", "replay_window"):
+        value = getattr(args, name)
+        if value is not None:
+            setattr(config, name, value)
+    config.peers = config.peers + args.peer
+    config.relay = config.relay + args.relay
+    if args.no_didn:
+        config.didn = False
+    if args.uvloop:
+        config.uvloop = True
+    return config
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """``(module, self_us, cumulative_us)`` for each line of ``-X importtime`` output."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # the header line
+        imports.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+    return imports
+
+
+def profile_startup(argv: List[str]) -> int:
+    """Start the node under -X importtime in a child process and report."""
+    child_argv = [a for a in argv if a != "--profile-startup"] + ["--exit-after-start"]
+    module = __spec__.name if __spec__ else "src.quantum_infra_zero.cli"
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", module, *child_argv],
+        capture_output=True, text=True, cwd=os.getcwd()
+    )
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        return proc.returncode
+
+    imports = parse_importtime(proc.stderr)
+    total_us = sum(self_us for _, self_us, _ in imports)
+
+    print(f"Startup (process start to exit): {elapsed * 1000:.1f} ms")
+    print(f"Imports: {len(imports)} modules, {total_us / 1000:.1f} ms")
+    print(f"\n{'cumulative ms':>14}  {'self ms':>8}  module")
+    for name, self_us, cumulative in sorted(imports, key=lambda i: i[2], reverse=True)[:TOP_IMPORTS]:
+        print(f"{cumulative / 1000:14.1f}  {self_us / 1000:8.1f}  {name.strip()}")
+    return 0
+
+
+async def _start_and_stop(runtime: NodeRuntime):
+    start = time.perf_counter()
+    address = await runtime.start()
+    print(f"Node {runtime.config.node_id} started on {format_address(address)} "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+    await runtime.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point of the quantum-node script."""
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_parser().parse_args(argv)
+    if args.profile_startup:
+        return profile_startup(argv)
+
+    config = config_from_args(args)
+    if config.uvloop and not install_uvloop():
+        print("uvloop is not installed; using the default asyncio event loop")
+    runtime = NodeRuntime(config)
+    if args.exit_after_start:
+        asyncio.run(_start_and_stop(runtime))
+    else:
+        asyncio.run(runtime.run_forever())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
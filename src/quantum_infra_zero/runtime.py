@@ -0,0 +1,192 @@
+"""
+Node Runtime
+
+Assembles DIDN, QMP, AI and CI/CD components into one node from a config.
+
+Only QMP is imported up front. DIDN, the AI node (and with it numpy) and
+the CI/CD runner are imported when the config enables them, so a node that
+just relays QMP traffic starts without paying for them.
+"""
+
+import asyncio
+import importlib
+import json
+import signal
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..qmp import QMPMessage, QMPService
+from ..qmp.transports import parse_address
+
+# Relayed message keys remembered to stop relay loops between peers
+RELAY_MEMORY = 4096
+
+
+@dataclass
+class NodeConfig:
+    """
+    What a node runs and where it listens.
+
+    ``ai`` and ``cicd`` enable those components: ``ai`` takes a ``model``
+    factory as ``"module:callable"``, ``cicd`` a ``project_root``. With
+    ``path`` set the node listens on that Unix socket instead of TCP.
+    Peers are ``host:port`` or ``unix:///path``.
+    """
+    node_id: str = "node"
+    host: str = "127.0.0.1"
+    port: int = 0
+    path: Optional[str] = None
+    uvloop: bool = False
+    peers: List[str] = field(default_factory=list)
+    relay: List[str] = field(default_factory=list)
+    didn: bool = True
+    ai: Optional[Dict[str, Any]] = None
+    cicd: Optional[Dict[str, Any]] = None
+    metrics_port: Optional[int] = None
+    slow_threshold: Optional[float] = None
+    # Drop duplicate frames seen within this many seconds, and messages
+    # whose timestamp is further than max_skew from the local clock
+    replay_window: Optional[float] = None
+    max_skew: float = 30.0
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'NodeConfig':
+        """Build a config, rejecting unknown keys."""
+        known = {f.name for f in fields(cls)}
+        unknown = set(data) - known
+        if unknown:
+            raise ValueError(f"Unknown node config keys: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+    @classmethod
+    def load(cls, path: str) -> 'NodeConfig':
+        """Read a JSON config file."""
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+
+def format_address(address) -> str:
+    """``host:port`` for TCP addresses, ``unix://path`` for socket paths."""
+    if isinstance(address, str):
+        return f"unix://{address}"
+    return f"{address[0]}:{address[1]}"
+
+
+def load_object(spec: str) -> Any:
+    """Import ``module:attribute``."""
+    module, sep, attr = spec.partition(":")
+    if not sep:
+        raise ValueError(f"Expected module:attribute, got {spec!r}")
+    obj = importlib.import_module(module)
+    for part in attr.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+class NodeRuntime:
+    """A running node: a QMP service plus the components its config enables."""
+
+    def __init__(self, config: NodeConfig):
+        self.config = config
+        replay_guard = None
+        if config.replay_window is not None:
+            from ..qmp.dedup import ReplayGuard
+            replay_guard = ReplayGuard(config.replay_window, min(config.max_skew, config.replay_window / 2))
+        self.qmp = QMPService(config.node_id, slow_threshold=config.slow_threshold,
+                              replay_guard=replay_guard)
+        self.didn = None
+        self.ai_node = None
+        self.model_sync = None
+        self.cicd = None
+        self.identity_id: Optional[str] = None
+        self.address = None
+        self._metrics_server = None
+        self._relayed: 'OrderedDict[Tuple, None]' = OrderedDict()
+        self._stopped = asyncio.Event()
+
+        for message_type in config.relay:
+            self.qmp.register_handler(message_type, self._relay)
+
+    async def start(self):
+        """Start the enabled components and connect to peers."""
+        config = self.config
+        if config.didn:
+            from ..didn import DIDN
+            self.didn = DIDN()
+            self.identity_id = self.didn.register_identity(
+                public_key=f"public_key_{config.node_id}",
+                signature=f"signature_{config.node_id}",
+                metadata={"name": config.node_id}
+            )
+        if config.ai is not None:
+            self._start_ai(config.ai)
+        if config.cicd is not None:
+            from ..self_contained_cicd import SelfContainedCICD
+            self.cicd = SelfContainedCICD(config.cicd.get("project_root", "."))
+        if config.metrics_port is not None:
+            from .. import metrics
+            self._metrics_server = await metrics.serve(config.host, config.metrics_port)
+
+        address = await self.qmp.start(config.host, config.port, path=config.path)
+        # (host, port) for TCP, the socket path for Unix sockets
+        self.address = address if config.path is not None else tuple(address[:2])
+        for peer in config.peers:
+            await self.qmp.connect(**parse_address(peer))
+        return self.address
+
+    def _start_ai(self, options: Dict[str, Any]):
+        from ..ai_nodes import AINode, ModelUpdate
+        from ..ai_nodes.sync import ModelSync
+        import numpy as np
+
+        model = load_object(options["model"])()
+        self.ai_node = AINode(self.config.node_id, model)
+        # Differential exchange; model_update below still takes full weights
+        self.model_sync = ModelSync(self.ai_node, self.qmp)
+
+        async def handle_model_update(message: QMPMessage, writer):
+            update = message.content["update"]
+            self.ai_node.updates[message.content["node_id"]] = ModelUpdate(
+                node_id=message.content["node_id"],
+                weights={k: np.asarray(v) for k, v in update["weights"].items()},
+                samples_count=update["samples_count"],
+                timestamp=update["timestamp"]
+            )
+
+        self.qmp.register_handler("model_update", handle_model_update)
+
+    async def _relay(self, message: QMPMessage, writer):
+        """Forward a message to every other connection, once."""
+        key = (message.sender_id, message.message_type, message.timestamp)
+        if key in self._relayed:
+            return
+        self._relayed[key] = None
+        if len(self._relayed) > RELAY_MEMORY:
+            self._relayed.popitem(last=False)
+        await self.qmp.broadcast(message, exclude={writer})
+
+    async def stop(self):
+        """Close peer connections and stop every started component."""
+        if self.address is not None:
+            await self.qmp.stop()
+            self.address = None
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+            await self._metrics_server.wait_closed()
+            self._metrics_server = None
+        self._stopped.set()
+
+    async def run_forever(self):
+        """Start, then serve until SIGINT/SIGTERM or stop()."""
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self._stopped.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        print(f"Node {self.config.node_id} listening on {format_address(await self.start())}")
+        try:
+            await self._stopped.wait()
+        finally:
+            await self.stop()
@@ -9,13 +9,26 @@ import asyncio
 import subprocess
 import shutil
 import os
+import signal
 import json
 from pathlib import Path
-from typing import Dict, List, Optional, Callable, Any
+from typing import Dict, List, Optional, Callable, Any, Set
 from dataclasses import dataclass
-import hashlib
+from datetime import datetime
 import logging
 
+from .. import metrics
+from .artifacts import ArtifactStore
+from .cache import DEFAULT_MAX_BYTES, StepCache, is_cacheable
+from .changes import ChangeDetector, step_affected
+from .checksum import ChecksumCache
+from .dag import StepResult, build_graph, critical_path, run_dag
+from .distributed import StepCoordinator
+from .sharding import TestSharder, TestTimings
+from .streaming import OutputCallback, OutputCapture, log_file_name
+from .tracing import DEFAULT_KEEP_RUNS, RunRecorder, StepRecord
+from .workers import ScriptWorkerPool
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -37,6 +50,22 @@ class SelfContainedCICD:
         self.build_dir = self.project_root / "build"
         self.artifacts_dir = self.project_root / "artifacts"
         self.config = self._load_config()
+        self.step_results: Dict[str, Dict[str, StepResult]] = {}
+        self.output_callback: Optional[OutputCallback] = None
+        self.step_logs: Dict[str, Path] = {}
+        self.changed_files: Optional[Set[str]] = None
+        self.coordinator: Optional[StepCoordinator] = None
+        self.run_recorder = RunRecorder(self.build_dir / "runs")
+        self.script_pool: Optional[ScriptWorkerPool] = None
+        self.checksums = ChecksumCache(self.build_dir / "checksums.json")
+        # Test durations per sharded step, so steps never prune each other's tests
+        self.test_timings: Dict[str, TestTimings] = {}
+        self.artifact_store = ArtifactStore(self.artifacts_dir / ".store", self.checksums)
+        self.step_cache = StepCache(
+            self.build_dir / "cache",
+            hasher=self._calculate_checksum,
+            hash_many=self.calculate_checksums
+        )
         self._setup_directories()
     
     def _load_config(self) -> Dict:
@@ -61,7 +90,27 @@ class SelfContainedCICD:
         """Run the complete CI/CD pipeline."""
         logger.info("Starting CI/CD pipeline")
         
+        self.run_recorder = RunRecorder(self.build_dir / "runs")
+        success = False
+        started_coordinator = False
         try:
+            settings = self.config.get("distributed", {})
+            if settings.get("enabled") and self.coordinator is None:
+                await self.start_coordinator()
+                started_coordinator = True
+                await self.coordinator.wait_for_workers(
+                    settings.get("min_workers", 1), settings.get("worker_timeout", 60)
+                )
+            
+            detector = self._change_detector()
+            if detector is not None:
+                loop = asyncio.get_event_loop()
+                self.changed_files = await loop.run_in_executor(None, detector.detect)
+                if self.changed_files is None:
+                    logger.info("No previous successful run, running all steps")
+                else:
+                    logger.info(f"{len(self.changed_files)} files changed since last successful run")
+            
             # Run build steps
             build_success = await self.run_build()
             if not build_success:
@@ -80,69 +129,200 @@ class SelfContainedCICD:
                 logger.error("Deployment failed")
                 return False
             
+            if detector is not None:
+                detector.record_success()
+            
             logger.info("CI/CD pipeline completed successfully")
+            success = True
             return True
             
         except Exception as e:
             logger.error(f"Pipeline failed: {str(e)}")
             return False
+        
+        finally:
+            self.changed_files = None
+            if self.coordinator is not None:
+                for worker_id, stats in self.coordinator.summary().items():
+                    logger.info(
+                        f"Worker {worker_id}: {stats['steps']} steps, "
+                        f"{stats['failed']} failed, {stats['busy']:.2f}s busy"
+                    )
+                if started_coordinator:
+                    await self.stop_coordinator()
+            if self.script_pool is not None:
+                await self.script_pool.close()
+                self.script_pool = None
+            logger.info(f"Step cache: {self.step_cache.summary()}")
+            self.checksums.save()
+            self._save_run_record("success" if success else "failed")
     
     async def run_build(self) -> bool:
         """Run build steps."""
         logger.info("Running build steps")
-        
-        for step in self.config.get("build_steps", []):
-            success = await self._run_step(step, "build")
-            if not success:
-                return False
-        
-        return True
+        return await self._run_stage(self.config.get("build_steps", []), "build")
     
     async def run_tests(self) -> bool:
         """Run test steps."""
         logger.info("Running tests")
-        
-        for step in self.config.get("test_steps", []):
-            success = await self._run_step(step, "test")
-            if not success:
-                return False
-        
-        return True
+        return await self._run_stage(self.config.get("test_steps", []), "test")
     
     async def run_deployment(self) -> bool:
         """Run deployment steps."""
         logger.info("Running deployment")
+        return await self._run_stage(self.config.get("deploy_steps", []), "deploy")
+    
+    async def _run_stage(self, steps: List[Dict], step_type: str) -> bool:
+        """Run the steps of one stage as a dependency graph.
         
-        for step in self.config.get("deploy_steps", []):
-            success = await self._run_step(step, "deploy")
-            if not success:
-                return False
+        Steps may declare ``needs`` on other steps of the stage; independent
+        steps run concurrently up to the ``max_parallel`` config setting, or
+        as many as the connected workers have slots for.
+        """
+        if not steps:
+            self.step_results[step_type] = {}
+            return True
         
-        return True
+        max_parallel = self.config.get("max_parallel") or os.cpu_count() or 1
+        if self.coordinator is not None and "max_parallel" not in self.config:
+            # Steps mostly wait on workers; keep every worker slot busy
+            slots = sum(worker.slots for worker in self.coordinator.workers.values())
+            max_parallel = max(max_parallel, slots)
+        results = await run_dag(
+            steps, lambda step: self._run_step(step, step_type), max_parallel
+        )
+        self.step_results[step_type] = results
+        
+        for result in results.values():
+            if result.status in ("cancelled", "skipped"):
+                logger.warning(f"{step_type.capitalize()} step {result.name} {result.status}")
+        
+        path = critical_path(build_graph(steps), results)
+        total = sum(results[name].duration for name in path)
+        logger.info(f"Critical path ({total:.2f}s): {' -> '.join(path)}")
+        
+        return all(result.success for result in results.values())
     
     async def _run_step(self, step: Dict, step_type: str) -> bool:
+        """Execute a single CI/CD step, recording its timing."""
+        record = self.run_recorder.begin_step(step["name"], step_type)
+        success = False
+        try:
+            success = await self._execute_step(step, step_type, record)
+            return success
+        except asyncio.CancelledError:
+            record.status = "cancelled"
+            raise
+        finally:
+            if record.status == "running":
+                record.status = "success" if success else "failed"
+            self.run_recorder.end_step(record)
+            if metrics.ENABLED:
+                self._record_step_metrics(record)
+    
+    @staticmethod
+    def _record_step_metrics(record: StepRecord):
+        """Count the step and observe its duration in the metrics registry."""
+        metrics.counter(
+            "cicd_steps_total", "Pipeline steps by outcome", stage=record.stage, status=record.status
+        ).inc()
+        metrics.histogram(
+            "cicd_step_seconds", "Pipeline step wall time", stage=record.stage
+        ).observe(record.duration)
+        if record.cache:
+            metrics.counter(
+                "cicd_step_cache_total", "Step cache lookups by result", result=record.cache
+            ).inc()
+    
+    async def _execute_step(self, step: Dict, step_type: str, record: StepRecord) -> bool:
         """Execute a single CI/CD step."""
-        step_name = step.get("name", "unnamed")
+        step_name = step["name"]
+        if not step_affected(step, self.changed_files):
+            logger.info(f"Skipping {step_type} step {step_name}: no changes under its paths")
+            record.status = "skipped"
+            record.cache = "unchanged"
+            return True
+        
         logger.info(f"Running {step_type} step: {step_name}")
         
         try:
-            if "command" in step:
+            loop = asyncio.get_event_loop()
+            cache = self._cache_for(step)
+            cache_key = None
+            if cache is not None:
+                cache_key = await loop.run_in_executor(
+                    None, cache.compute_key, step, self.project_root
+                )
+                restored = await loop.run_in_executor(
+                    None, cache.restore, cache_key, self.project_root
+                )
+                record.cache = "hit" if restored else "miss"
+                if restored:
+                    logger.info(f"Step {step_name} restored from cache")
+                    return True
+            
+            if "command" in step and step.get("shards", 1) > 1:
+                # Split a pytest command into balanced parallel shards
+                run = await self._test_sharder(step_type, step_name).run(
+                    step["command"], step["shards"], step_name
+                )
+                record.exit_code = max(run.returncodes, default=0)
+                totals = run.totals
+                logger.info(
+                    f"Step {step_name}: {len(run.returncodes)} shards, "
+                    f"{totals.get('tests', 0):.0f} tests, {totals.get('failures', 0):.0f} failures, "
+                    f"{totals.get('errors', 0):.0f} errors; report at {run.report}"
+                )
+                if not run.success:
+                    logger.error(f"Step {step_name} failed with shard exit codes {run.returncodes}")
+                    logger.error(f"Stderr: {run.stderr}")
+                    return False
+                
+            elif "command" in step and self._runs_remotely(step):
+                # Execute on a worker node
+                result = await self.coordinator.submit(step)
+                record.worker = result.worker_id
+                record.exit_code = result.returncode
+                if not result.success:
+                    reason = result.error or f"exit code {result.returncode}"
+                    logger.error(f"Step {step_name} failed on worker {result.worker_id}: {reason}")
+                    logger.error(f"Stderr: {result.stderr}")
+                    return False
+                
+                logger.debug(
+                    f"Step {step_name} ran on worker {result.worker_id} "
+                    f"after {result.attempts} attempt(s)"
+                )
+                
+            elif "command" in step:
                 # Execute shell command
                 proc = await asyncio.create_subprocess_shell(
                     step["command"],
                     cwd=self.project_root,
                     stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
+                    stderr=asyncio.subprocess.PIPE,
+                    start_new_session=(os.name == "posix")
                 )
                 
-                stdout, stderr = await proc.communicate()
+                capture = self._output_capture(step_name, step_type)
+                self.step_logs[step_name] = capture.log_path
+                try:
+                    await capture.capture(proc.stdout, proc.stderr)
+                    await proc.wait()
+                except asyncio.CancelledError:
+                    # Cancelled by a failing sibling step: don't leave it running
+                    await self._kill_process(proc)
+                    raise
+                finally:
+                    capture.close()
                 
+                record.exit_code = proc.returncode
                 if proc.returncode != 0:
                     logger.error(f"Step {step_name} failed with exit code {proc.returncode}")
-                    logger.error(f"Stderr: {stderr.decode()}")
+                    logger.error(f"Stderr: {capture.tail('stderr')}")
                     return False
                 
-                logger.debug(f"Step {step_name} output: {stdout.decode()}")
+                logger.debug(f"Step {step_name} output logged to {capture.log_path}")
                 
             elif "script" in step:
                 # Execute Python script
@@ -151,27 +331,173 @@ class SelfContainedCICD:
                     logger.error(f"Script not found: {script_path}")
                     return False
                 
-                # In a real implementation, we would execute the script here
-                logger.info(f"Would execute script: {script_path}")
+                # Execute in a warm, pre-imported worker process
+                log_path = self.build_dir / "logs" / step_type / log_file_name(step_name)
+                self.step_logs[step_name] = log_path
+                result = await self._script_workers().run(
+                    script_path,
+                    step.get("args", []),
+                    cwd=self.project_root,
+                    log_path=log_path
+                )
+                record.exit_code = result.exit_code
+                # Pool workers are never reaped, so child usage would read 0
+                record.set_usage(result.cpu_user, result.cpu_system, result.max_rss_kb)
+                if not result.success:
+                    logger.error(f"Step {step_name} failed with exit code {result.exit_code}")
+                    logger.error(f"Output: {result.tail()}")
+                    return False
                 
+                logger.debug(f"Step {step_name} ran in worker {result.worker_pid} in {result.duration:.3f}s")
+            
+            if cache_key is not None:
+                await loop.run_in_executor(
+                    None, cache.store, cache_key, self.project_root, step["outputs"]
+                )
+            
             return True
             
         except Exception as e:
             logger.error(f"Error in step {step_name}: {str(e)}")
             return False
     
+    def _save_run_record(self, status: str):
+        """Write the run record and trace exports unless tracing is disabled."""
+        self.run_recorder.finish(status)
+        settings = self.config.get("tracing", {})
+        if not settings.get("enabled", True):
+            return
+        try:
+            path = self.run_recorder.save(
+                settings.get("formats", ["chrome"]),
+                keep=settings.get("keep", DEFAULT_KEEP_RUNS)
+            )
+            logger.info(f"Run record written to {path}")
+        except OSError as e:
+            logger.warning(f"Could not write run record: {e}")
+    
+    def _output_capture(self, step_name: str, step_type: str) -> OutputCapture:
+        """Set up streaming output capture for a step."""
+        settings = self.config.get("logs", {})
+        return OutputCapture(
+            step_name,
+            self.build_dir / "logs" / step_type,
+            tail_lines=settings.get("tail_lines", 200),
+            max_bytes=settings.get("max_bytes", 10 * 1024 * 1024),
+            backup_count=settings.get("backup_count", 3),
+            callback=self.output_callback
+        )
+    
+    def _script_workers(self) -> ScriptWorkerPool:
+        """Return the script worker pool, creating it on first use."""
+        if self.script_pool is None:
+            settings = self.config.get("scripts", {})
+            self.script_pool = ScriptWorkerPool(
+                size=settings.get("workers"),
+                preload=settings.get("preload", []),
+                max_jobs=settings.get("max_jobs", 100)
+            )
+        return self.script_pool
+    
+    def _test_sharder(self, step_type: str, step_name: str) -> TestSharder:
+        """Set up a sharded test run whose shards log like ordinary steps."""
+        timings = self.test_timings.get(step_name)
+        if timings is None:
+            timings = TestTimings(
+                self.build_dir / "test_timings" / (log_file_name(step_name)[:-len(".log")] + ".json")
+            )
+            self.test_timings[step_name] = timings
+        return TestSharder(
+            self.project_root,
+            self.build_dir / "shards",
+            self.build_dir / "reports",
+            timings,
+            make_capture=lambda name: self._output_capture(name, step_type),
+            kill=self._kill_process
+        )
+    
+    async def start_coordinator(self):
+        """Start accepting worker nodes; command steps then run on them.
+        
+        Returns the address workers should connect to.
+        """
+        settings = self.config.get("distributed", {})
+        self.coordinator = StepCoordinator(
+            f"cicd-{os.getpid()}",
+            self.project_root,
+            checksums=self.checksums,
+            heartbeat_interval=settings.get("heartbeat_interval", 1.0),
+            heartbeat_timeout=settings.get("heartbeat_timeout", 5.0),
+            max_attempts=settings.get("max_attempts", 3)
+        )
+        return await self.coordinator.start(
+            settings.get("host", "127.0.0.1"), settings.get("port", 0)
+        )
+    
+    async def stop_coordinator(self):
+        """Shut down connected workers and run steps locally again."""
+        if self.coordinator is not None:
+            await self.coordinator.stop()
+            self.coordinator = None
+    
+    def _runs_remotely(self, step: Dict) -> bool:
+        """Whether a step is dispatched to a worker node."""
+        return self.coordinator is not None and not step.get("local", False)
+    
+    def _change_detector(self) -> Optional[ChangeDetector]:
+        """Return a change detector unless incremental runs are disabled."""
+        settings = self.config.get("incremental", {})
+        if not settings.get("enabled", True):
+            return None
+        excluded = [
+            str(path.relative_to(self.project_root))
+            for path in (self.build_dir, self.artifacts_dir)
+        ]
+        return ChangeDetector(
+            self.project_root,
+            self.build_dir / "incremental",
+            exclude=excluded,
+            strategy=settings.get("strategy", "auto")
+        )
+    
+    def _cache_for(self, step: Dict) -> Optional[StepCache]:
+        """Return the step cache if it is enabled and applies to this step."""
+        settings = self.config.get("cache", {})
+        if not settings.get("enabled", True) or not is_cacheable(step):
+            return None
+        self.step_cache.max_bytes = settings.get("max_bytes", DEFAULT_MAX_BYTES)
+        return self.step_cache
+    
+    @staticmethod
+    async def _kill_process(proc):
+        """Kill a step's process together with any children it spawned."""
+        if proc.returncode is not None:
+            return
+        try:
+            if os.name == "posix":
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+    
     def create_artifact(self, source_path: str, name: str, metadata: Dict = None) -> BuildArtifact:
-        """Create a build artifact."""
+        """Create a build artifact.
+        
+        The content goes into the deduplicating artifact store without
+        passing through userspace where the filesystem allows it, and the
+        named artifact is linked to the stored object.
+        """
         source = Path(source_path)
         if not source.exists():
             raise FileNotFoundError(f"Source file not found: {source_path}")
         
-        # Calculate checksum
-        checksum = self._calculate_checksum(source)
+        checksum, _ = self.artifact_store.put(source)
         
-        # Copy to artifacts directory
         artifact_path = self.artifacts_dir / name
-        shutil.copy2(source, artifact_path)
+        method = self.artifact_store.link(checksum, artifact_path)
+        logger.debug(f"Artifact {name} placed via {method}")
         
         artifact = BuildArtifact(
             name=name,
@@ -187,12 +513,16 @@ class SelfContainedCICD:
         return artifact
     
     def _calculate_checksum(self, file_path: Path) -> str:
-        """Calculate SHA-256 checksum of a file."""
-        sha256_hash = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
+        """Calculate SHA-256 checksum of a file.
+        
+        Digests are cached by path, size, mtime and inode, so unchanged
+        files are not read again.
+        """
+        return self.checksums.digest(file_path)
+    
+    def calculate_checksums(self, paths: List[Path]) -> Dict[Path, str]:
+        """Calculate SHA-256 checksums of many files concurrently."""
+        return self.checksums.digest_many(paths)
     
     def _save_artifact_metadata(self, artifact: BuildArtifact):
         """Save artifact metadata to a JSON file."""
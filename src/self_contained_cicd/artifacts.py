@@ -0,0 +1,165 @@
+"""
+Zero-copy artifact storage
+
+Artifacts are kept in a content-addressed store under ``artifacts/.store``,
+one read-only object per distinct SHA-256, so identical outputs of
+different builds are stored once. Files are placed with the cheapest
+mechanism the platform offers: a reflink (FICLONE) that shares extents, a
+hardlink, an in-kernel ``copy_file_range``/``sendfile`` copy, and only then
+a userspace copy that hashes the data in the same pass.
+
+Sources are never hardlinked into the store, because a build step that
+later rewrites its output in place would silently change the stored
+object. Store objects are immutable, so named artifacts are hardlinked to
+them.
+"""
+
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from typing import Optional, Tuple
+
+from .checksum import BUFFER_SIZE, ChecksumCache
+
+_FICLONE = 0x40049409
+
+
+def _reflink(src_fd: int, dst_fd: int) -> bool:
+    """Share the source extents with the destination (btrfs, XFS, ...)."""
+    try:
+        import fcntl
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+        return True
+    except (ImportError, OSError):
+        return False
+
+
+def _kernel_copy(src_fd: int, dst_fd: int, size: int) -> Optional[str]:
+    """Copy inside the kernel; return the mechanism used or None."""
+    for method in ("copy_file_range", "sendfile"):
+        if not hasattr(os, method):
+            continue
+        copied = 0
+        try:
+            while copied < size:
+                if method == "copy_file_range":
+                    n = os.copy_file_range(src_fd, dst_fd, size - copied)
+                else:
+                    n = os.sendfile(dst_fd, src_fd, copied, size - copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError:
+            copied = -1
+        if copied == size:
+            return method
+        # Start over with the next mechanism
+        os.lseek(src_fd, 0, os.SEEK_SET)
+        os.lseek(dst_fd, 0, os.SEEK_SET)
+        os.ftruncate(dst_fd, 0)
+    return None
+
+
+def _copy_hashing(src, dst) -> str:
+    """Copy through userspace, hashing each block as it passes."""
+    digest = hashlib.sha256()
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    while True:
+        read = src.readinto(buffer)
+        if not read:
+            break
+        digest.update(view[:read])
+        dst.write(view[:read])
+    return digest.hexdigest()
+
+
+def clone_file(source: Path, target: Path, allow_hardlink: bool = True) -> Tuple[str, Optional[str]]:
+    """
+    Place a copy of source at target using the cheapest available mechanism.
+
+    Returns ``(method, digest)``. The digest is only known when the data
+    went through userspace; otherwise it is None.
+    """
+    if target.exists() or target.is_symlink():
+        target.unlink()
+
+    with open(source, "rb") as src:
+        with open(target, "wb") as dst:
+            if _reflink(src.fileno(), dst.fileno()):
+                method = "reflink"
+            else:
+                method = None
+
+        if method is None and allow_hardlink:
+            try:
+                target.unlink()
+                os.link(source, target)
+                return "hardlink", None
+            except OSError:
+                pass
+
+        if method is None:
+            with open(target, "wb") as dst:
+                size = os.fstat(src.fileno()).st_size
+                method = _kernel_copy(src.fileno(), dst.fileno(), size)
+                if method is None:
+                    src.seek(0)
+                    dst.seek(0)
+                    dst.truncate()
+                    digest = _copy_hashing(src, dst)
+                    shutil.copystat(source, target)
+                    return "copy", digest
+
+    shutil.copystat(source, target)
+    return method, None
+
+
+class ArtifactStore:
+    """Content-addressed, deduplicating store of artifact files."""
+
+    def __init__(self, root: Path, checksums: Optional[ChecksumCache] = None):
+        self.root = Path(root)
+        self.checksums = checksums or ChecksumCache()
+        self.stats = {"stored": 0, "deduplicated": 0}
+
+    def object_path(self, digest: str) -> Path:
+        """Location of the object holding content with this digest."""
+        return self.root / digest[:2] / digest
+
+    def put(self, source: Path) -> Tuple[str, Path]:
+        """Add a file to the store and return its digest and object path."""
+        source = Path(source)
+        known = self.checksums.lookup(source)
+        if known is not None and self.object_path(known).exists():
+            self.stats["deduplicated"] += 1
+            return known, self.object_path(known)
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / f".incoming.{os.getpid()}.{id(source)}"
+        try:
+            _, digest = clone_file(source, tmp, allow_hardlink=False)
+            if digest is not None:
+                self.checksums.remember(source, digest)
+            else:
+                digest = self.checksums.digest(source)
+
+            obj = self.object_path(digest)
+            if obj.exists():
+                self.stats["deduplicated"] += 1
+            else:
+                obj.parent.mkdir(parents=True, exist_ok=True)
+                os.chmod(tmp, 0o444)
+                os.replace(tmp, obj)
+                self.stats["stored"] += 1
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        return digest, obj
+
+    def link(self, digest: str, target: Path) -> str:
+        """Expose a stored object at target; returns the mechanism used."""
+        target.parent.mkdir(parents=True, exist_ok=True)
+        method, _ = clone_file(self.object_path(digest), target)
+        return method
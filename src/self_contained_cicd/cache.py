@@ -0,0 +1,264 @@
+"""
+Content-addressed step cache
+
+A step that declares ``inputs`` (files or globs) and ``outputs`` gets a cache
+key built from the hashes of its input files, its command or script and the
+values of the environment variables listed under ``env``. After a successful
+run the outputs are stored as content-addressed blobs under
+``build/cache/objects`` with a small manifest per key under
+``build/cache/entries``. When a later run computes the same key, the outputs
+are restored instead of running the step. Entries are evicted least recently
+used first once the cache grows beyond its size limit.
+
+Steps of one stage store and restore concurrently from executor threads, so
+objects that a store or restore is still working with are pinned and left
+alone by garbage collection, as are temporary files.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def expand_paths(root: Path, patterns: Iterable[str]) -> List[Path]:
+    """Expand files, directories and globs relative to root into files."""
+    files = set()
+    for pattern in patterns:
+        matches = list(root.glob(pattern)) if any(c in pattern for c in "*?[") \
+            else [root / pattern]
+        for match in matches:
+            if match.is_dir():
+                files.update(p for p in match.rglob("*") if p.is_file())
+            elif match.is_file():
+                files.add(match)
+    return sorted(files)
+
+
+def is_cacheable(step: Dict) -> bool:
+    """Whether a step declares enough to be cached."""
+    return bool(step.get("outputs")) and "inputs" in step and step.get("cache", True)
+
+
+class StepCache:
+    """Local content-addressed cache of step outputs."""
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_MAX_BYTES,
+                 hasher: Optional[Callable[[Path], str]] = None,
+                 hash_many: Optional[Callable[[List[Path]], Dict[Path, str]]] = None):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.entries_dir = self.root / "entries"
+        self.max_bytes = max_bytes
+        self.hasher = hasher or self._sha256
+        self.hash_many = hash_many or (lambda paths: {p: self.hasher(p) for p in paths})
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        # Digests in use by a running store or restore
+        self._pinned: Counter = Counter()
+        # Bytes in objects, scanned once and then kept up to date
+        self._bytes: Optional[int] = None
+
+    @staticmethod
+    def _sha256(path: Path) -> str:
+        """Hash a file with SHA-256."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def compute_key(self, step: Dict, project_root: Path) -> str:
+        """Derive the cache key of a step from everything that affects it."""
+        digests = self.hash_many(expand_paths(project_root, step.get("inputs", [])))
+        inputs = {
+            str(path.relative_to(project_root)): digest
+            for path, digest in digests.items()
+        }
+        if "script" in step:
+            script = project_root / step["script"]
+            if script.is_file():
+                inputs[str(step["script"])] = self.hasher(script)
+
+        material = {
+            "version": CACHE_VERSION,
+            "command": step.get("command"),
+            "script": step.get("script"),
+            "inputs": sorted(inputs.items()),
+            "env": {name: os.environ.get(name) for name in sorted(step.get("env", []))},
+            "outputs": sorted(step.get("outputs", [])),
+        }
+        return hashlib.sha256(json.dumps(material, sort_keys=True).encode()).hexdigest()
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest
+
+    def _entry_path(self, key: str) -> Path:
+        return self.entries_dir / f"{key}.json"
+
+    def restore(self, key: str, project_root: Path) -> bool:
+        """Restore the outputs recorded under key; False on a miss."""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.stats["misses"] += 1
+            return False
+
+        outputs = entry.get("outputs", {})
+        digests = [o["digest"] for o in outputs.values()]
+        with self._lock:
+            if not all(self._object_path(d).exists() for d in digests):
+                self.stats["misses"] += 1
+                return False
+            self._pinned.update(digests)
+        try:
+            for rel_path, output in outputs.items():
+                target = project_root / rel_path
+                target.parent.mkdir(parents=True, exist_ok=True)
+                tmp = target.with_name(f".{target.name}.restore")
+                shutil.copyfile(self._object_path(output["digest"]), tmp)
+                os.chmod(tmp, output.get("mode", 0o644))
+                os.replace(tmp, target)
+        finally:
+            self._unpin(digests)
+
+        # Touch the entry so eviction sees it as recently used
+        os.utime(entry_path, None)
+        self.stats["hits"] += 1
+        return True
+
+    def store(self, key: str, project_root: Path, patterns: Iterable[str]):
+        """Record the current output files of a step under key."""
+        outputs = {}
+        digests = self.hash_many(expand_paths(project_root, patterns))
+        with self._lock:
+            self._pinned.update(digests.values())
+        try:
+            for path, digest in digests.items():
+                self._store_object(path, digest)
+                stat = path.stat()
+                outputs[str(path.relative_to(project_root))] = {
+                    "digest": digest,
+                    "size": stat.st_size,
+                    "mode": stat.st_mode & 0o777,
+                }
+
+            self.entries_dir.mkdir(parents=True, exist_ok=True)
+            entry_path = self._entry_path(key)
+            tmp = entry_path.with_name(f".{entry_path.name}.{threading.get_ident()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump({"key": key, "created": time.time(), "outputs": outputs}, f)
+            os.replace(tmp, entry_path)
+        finally:
+            self._unpin(digests.values())
+        self.stats["stores"] += 1
+        self.evict()
+
+    def _store_object(self, path: Path, digest: str):
+        """Copy a file into the object store unless its digest is already there."""
+        obj = self._object_path(digest)
+        if obj.exists():
+            return
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        tmp = obj.with_name(f".{digest}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copyfile(path, tmp)
+        with self._lock:
+            if obj.exists():
+                # Another step stored the same content meanwhile
+                tmp.unlink()
+                return
+            size = tmp.stat().st_size
+            os.replace(tmp, obj)
+            if self._bytes is not None:
+                self._bytes += size
+
+    def _unpin(self, digests: Iterable[str]):
+        with self._lock:
+            self._pinned.subtract(digests)
+            self._pinned += Counter()  # drop digests no longer pinned
+
+    def size(self) -> int:
+        """Total bytes held in cached objects."""
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(obj.stat().st_size for obj in self._objects())
+            return self._bytes
+
+    def _objects(self) -> Iterable[Path]:
+        """Stored objects, skipping temporary files of stores in progress."""
+        if not self.objects_dir.exists():
+            return
+        for obj in self.objects_dir.rglob("*"):
+            if obj.is_file() and not obj.name.startswith("."):
+                yield obj
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits its limit."""
+        if self.size() <= self.max_bytes:
+            return
+
+        with self._lock:
+            entries = []
+            for entry_path in self.entries_dir.glob("*.json"):
+                try:
+                    with open(entry_path, "r") as f:
+                        outputs = json.load(f).get("outputs", {})
+                    entries.append((entry_path.stat().st_mtime, entry_path, outputs))
+                except (OSError, ValueError):
+                    continue
+            entries.sort(key=lambda e: e[0])
+
+            # Bytes each object would free once no remaining entry uses it
+            users: Counter = Counter()
+            sizes = {}
+            for _, _, outputs in entries:
+                for output in outputs.values():
+                    users[output["digest"]] += 1
+                    sizes[output["digest"]] = output.get("size", 0)
+
+            # Counting referenced objects only, orphans are left to the collection
+            total = sum(sizes.values())
+            for _, entry_path, outputs in entries:
+                if total <= self.max_bytes:
+                    break
+                entry_path.unlink()
+                self.stats["evictions"] += 1
+                for output in outputs.values():
+                    users[output["digest"]] -= 1
+                    if users[output["digest"]] == 0:
+                        total -= sizes[output["digest"]]
+            self._collect_garbage(+users)
+
+    def _collect_garbage(self, referenced: Iterable[str]):
+        """Delete objects that are neither referenced nor pinned; call with the lock held."""
+        keep = set(referenced) | set(self._pinned)
+        total = 0
+        for obj in self._objects():
+            if obj.name in keep:
+                total += obj.stat().st_size
+            else:
+                obj.unlink()
+        self._bytes = total
+
+    def summary(self) -> str:
+        """One-line hit/miss report."""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        rate = self.stats["hits"] / lookups * 100 if lookups else 0.0
+        return (
+            f"{self.stats['hits']} hits, {self.stats['misses']} misses "
+            f"({rate:.0f}% hit rate), {self.stats['stores']} stored, "
+            f"{self.stats['evictions']} evicted"
+        )
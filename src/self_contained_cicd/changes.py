@@ -0,0 +1,274 @@
+"""
+Change detection for incremental pipelines
+
+Steps may declare ``paths``: files, directories or globs (``*``, ``?``,
+``**``) relative to the project root. At the start of a pipeline the set of
+files changed since the last successful run is computed, either with
+``git diff`` against the commit recorded for that run or by comparing a
+file manifest (path -> size, mtime, digest). With git, the digests of files
+that were uncommitted at that run are recorded too, so edits that were
+built and then reverted still count as changes. Steps whose ``paths`` match
+none of the changed files are skipped. Without a previous successful run
+nothing is skipped.
+
+The manifest is an on-disk index: a rescan only stats files, in parallel,
+and re-hashes just those whose size or mtime moved.
+"""
+
+import json
+import os
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .checksum import file_sha256
+
+STATE_FILE = "incremental.json"
+MANIFEST_FILE = "manifest.json"
+
+
+@lru_cache(maxsize=256)
+def _glob_to_regex(pattern: str) -> "re.Pattern":
+    """Translate a path glob with ``**`` support into a regex."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile("".join(parts) + r"\Z")
+
+
+def path_matches(path: str, patterns: Iterable[str]) -> bool:
+    """Whether a project-relative POSIX path matches any pattern."""
+    for pattern in patterns:
+        pattern = pattern[2:] if pattern.startswith("./") else pattern
+        if any(c in pattern for c in "*?"):
+            if _glob_to_regex(pattern).match(path):
+                return True
+        else:
+            prefix = pattern.rstrip("/")
+            if path == prefix or path.startswith(prefix + "/"):
+                return True
+    return False
+
+
+def step_affected(step: Dict, changed: Optional[Set[str]]) -> bool:
+    """Whether a step has to run given the changed files (None: unknown)."""
+    patterns = step.get("paths")
+    if not patterns or changed is None:
+        return True
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    return any(path_matches(path, patterns) for path in changed)
+
+
+class FileManifest:
+    """Snapshot of a tree as path -> [size, mtime_ns, sha256]."""
+
+    def __init__(self, root: Path, exclude: Iterable[str] = (), max_workers: Optional[int] = None):
+        self.root = Path(root)
+        self.exclude = {e.strip("/") for e in exclude}
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+
+    def _walk(self, directory: str) -> List[Tuple[str, int, int]]:
+        """Stat every file below a directory (relative to root)."""
+        found = []
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            try:
+                entries = list(os.scandir(self.root / current if current else self.root))
+            except OSError:
+                continue
+            for entry in entries:
+                rel = f"{current}/{entry.name}" if current else entry.name
+                if rel in self.exclude:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(rel)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    found.append((rel, stat.st_size, stat.st_mtime_ns))
+        return found
+
+    def scan(self, previous: Optional[Dict[str, list]] = None) -> Dict[str, list]:
+        """Build a new manifest, re-hashing only files that look changed."""
+        previous = previous or {}
+        top_files, top_dirs = [], []
+        for entry in os.scandir(self.root):
+            if entry.name in self.exclude:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                top_dirs.append(entry.name)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                top_files.append((entry.name, stat.st_size, stat.st_mtime_ns))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            stats = top_files
+            for found in pool.map(self._walk, top_dirs):
+                stats.extend(found)
+
+            manifest: Dict[str, list] = {}
+            to_hash = []
+            for rel, size, mtime in stats:
+                old = previous.get(rel)
+                if old is not None and old[0] == size and old[1] == mtime:
+                    manifest[rel] = old
+                else:
+                    to_hash.append((rel, size, mtime))
+
+            digests = pool.map(lambda item: file_sha256(self.root / item[0]), to_hash)
+            for (rel, size, mtime), digest in zip(to_hash, digests):
+                manifest[rel] = [size, mtime, digest]
+        return manifest
+
+    @staticmethod
+    def diff(old: Dict[str, list], new: Dict[str, list]) -> Set[str]:
+        """Paths added, removed or modified between two manifests."""
+        changed = set(old.keys() ^ new.keys())
+        changed.update(p for p in old.keys() & new.keys() if old[p][2] != new[p][2])
+        return changed
+
+
+def _git(root: Path, *args: str) -> Optional[str]:
+    """Run a git command, returning None if git is unavailable or fails."""
+    try:
+        result = subprocess.run(
+            ["git", *args], cwd=root, capture_output=True, text=True, timeout=60
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def git_head(root: Path) -> Optional[str]:
+    """Current commit of the repository at root, if any."""
+    out = _git(root, "rev-parse", "HEAD")
+    return out.strip() if out else None
+
+
+def git_changed_files(root: Path, base: str) -> Optional[Set[str]]:
+    """Files changed since base, including uncommitted and untracked ones."""
+    prefix = _git(root, "rev-parse", "--show-prefix")
+    diff = _git(root, "diff", "--name-only", "--no-renames", base, "--", ".")
+    untracked = _git(root, "ls-files", "--others", "--exclude-standard")
+    if prefix is None or diff is None or untracked is None:
+        return None
+    prefix = prefix.strip()
+    changed = set()
+    for line in diff.splitlines():
+        # diff paths are relative to the repository root
+        if line.startswith(prefix):
+            changed.add(line[len(prefix):])
+    changed.update(line for line in untracked.splitlines() if line)
+    return changed
+
+
+def _digest_or_none(path: Path) -> Optional[str]:
+    try:
+        return file_sha256(path)
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return None
+
+
+def worktree_digests(root: Path, paths: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Content digests of files relative to root; None for missing files."""
+    paths = sorted(paths)
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4)) as pool:
+        return dict(zip(paths, pool.map(lambda p: _digest_or_none(root / p), paths)))
+
+
+class ChangeDetector:
+    """Works out what changed since the last successful pipeline run."""
+
+    def __init__(self, root: Path, state_dir: Path, exclude: Iterable[str] = (),
+                 strategy: str = "auto"):
+        if strategy not in ("auto", "git", "manifest"):
+            raise ValueError(f"Unknown change detection strategy: {strategy}")
+        self.root = Path(root)
+        self.state_dir = Path(state_dir)
+        self.strategy = strategy
+        self.manifest = FileManifest(root, exclude=[".git", *exclude])
+        self._pending: Optional[Dict] = None
+
+    def _load(self, name: str) -> Optional[Dict]:
+        path = self.state_dir / name
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, name: str, data: Dict):
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        path = self.state_dir / name
+        tmp = path.with_name(f".{name}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def detect(self) -> Optional[Set[str]]:
+        """Changed files since the last successful run, or None if unknown."""
+        state = self._load(STATE_FILE) or {}
+        head = git_head(self.root) if self.strategy in ("auto", "git") else None
+        self._pending = {"commit": head}
+
+        if head is not None:
+            dirty = git_changed_files(self.root, head)
+            if dirty is not None:
+                dirty = {p for p in dirty if not path_matches(p, self.manifest.exclude)}
+                self._pending["dirty"] = worktree_digests(self.root, dirty)
+            if not state.get("commit"):
+                return None
+            changed = git_changed_files(self.root, state["commit"])
+            if changed is not None and dirty is not None:
+                changed = {p for p in changed if not path_matches(p, self.manifest.exclude)}
+                # Compare against what was built, not just the recorded commit:
+                # files uncommitted at that run are changed unless their
+                # content is still the same
+                built = state.get("dirty", {})
+                current = worktree_digests(self.root, built.keys() - dirty)
+                current.update(self._pending["dirty"])
+                return {
+                    p for p in changed | built.keys()
+                    if p not in built or built[p] != current[p]
+                }
+        if self.strategy == "git":
+            # Not a repository, or the recorded commit is gone
+            return None
+
+        previous = self._load(MANIFEST_FILE)
+        current = self.manifest.scan((previous or {}).get("files"))
+        self._pending["files"] = current
+        if previous is None or not state:
+            return None
+        return FileManifest.diff(previous.get("files", {}), current)
+
+    def record_success(self):
+        """Remember the state seen by ``detect`` as the last good run."""
+        if self._pending is None:
+            return
+        if "files" in self._pending:
+            self._save(MANIFEST_FILE, {"files": self._pending["files"]})
+        self._save(STATE_FILE, {
+            "commit": self._pending["commit"],
+            "dirty": self._pending.get("dirty", {}),
+        })
+        self._pending = None
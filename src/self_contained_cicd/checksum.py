@@ -0,0 +1,151 @@
+"""
+Fast file checksums
+
+Files are hashed with large buffers (``hashlib.file_digest`` where
+available) and big files through ``mmap``, so the hash runs over the whole
+file in a few C calls. hashlib releases the GIL while hashing, which lets
+``ChecksumCache.digest_many`` hash many files concurrently on a thread pool.
+Digests are cached by (path, size, mtime, inode) and persisted, so files
+that have not changed are never read again; only the files that miss the
+cache go to the pool, which is created once per cache and reused.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+BUFFER_SIZE = 1024 * 1024
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+
+def file_sha256(path: Path) -> str:
+    """Compute the SHA-256 digest of a file."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return hashlib.sha256(mapped).hexdigest()
+
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
+        digest = hashlib.sha256()
+        buffer = bytearray(BUFFER_SIZE)
+        view = memoryview(buffer)
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+        return digest.hexdigest()
+
+
+class ChecksumCache:
+    """SHA-256 digests of files, cached by path, size, mtime and inode."""
+
+    def __init__(self, cache_path: Optional[Path] = None, max_workers: Optional[int] = None):
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.stats = {"hits": 0, "misses": 0}
+        self._entries: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._load()
+
+    def _load(self):
+        """Read persisted digests, ignoring a missing or corrupt file."""
+        if self.cache_path is None or not self.cache_path.exists():
+            return
+        try:
+            with open(self.cache_path, "r") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def save(self):
+        """Persist digests if anything changed."""
+        if self.cache_path is None or not self._dirty:
+            return
+        with self._lock:
+            entries = dict(self._entries)
+            self._dirty = False
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_path.with_name(f".{self.cache_path.name}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.cache_path)
+
+    def digest(self, path: Path) -> str:
+        """Return the digest of a file, hashing it only if it changed."""
+        path = Path(path).absolute()
+        stat = path.stat()
+        key = str(path)
+        signature = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[:3] == signature:
+                self.stats["hits"] += 1
+                return entry[3]
+
+        digest = file_sha256(path)
+        with self._lock:
+            self.stats["misses"] += 1
+            self._entries[key] = signature + [digest]
+            self._dirty = True
+        return digest
+
+    def lookup(self, path: Path) -> Optional[str]:
+        """Return a cached digest if the file is unchanged, without hashing."""
+        path = Path(path).absolute()
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._entries.get(str(path))
+        if entry is not None and entry[:3] == [stat.st_size, stat.st_mtime_ns, stat.st_ino]:
+            return entry[3]
+        return None
+
+    def remember(self, path: Path, digest: str):
+        """Record a digest computed elsewhere, e.g. while copying the file."""
+        path = Path(path).absolute()
+        stat = path.stat()
+        with self._lock:
+            self._entries[str(path)] = [stat.st_size, stat.st_mtime_ns, stat.st_ino, digest]
+            self._dirty = True
+
+    def digest_many(self, paths: Iterable[Path]) -> Dict[Path, str]:
+        """Digests of many files; the ones that changed are hashed concurrently."""
+        paths = list(paths)
+        digests: Dict[Path, str] = {}
+        misses = []
+        for path in paths:
+            digest = self.lookup(path)
+            if digest is None:
+                misses.append(path)
+            else:
+                digests[path] = digest
+        with self._lock:
+            self.stats["hits"] += len(digests)
+        if len(misses) <= 1:
+            digests.update((path, self.digest(path)) for path in misses)
+        else:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix="checksum")
+            digests.update(zip(misses, self._pool.map(self.digest, misses)))
+        return {path: digests[path] for path in paths}
+
+    def close(self):
+        """Stop the hashing threads; they are started again when needed."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,171 @@
+"""
+Dependency-aware step scheduling
+
+Steps in a stage may list the names of other steps in the same stage under
+``needs``. The stage is then run as a DAG: every step whose dependencies
+have succeeded is started, up to a concurrency limit. The first failure
+cancels running steps and skips everything not yet started. Stages where no
+step declares ``needs`` keep the original behaviour of running steps one
+after another.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+@dataclass
+class StepResult:
+    """Outcome and timing of a single step."""
+    name: str
+    status: str = "pending"
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+    @property
+    def success(self) -> bool:
+        return self.status == "success"
+
+    @property
+    def duration(self) -> float:
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+def step_names(steps: List[Dict]) -> List[str]:
+    """Name every step, falling back to its position for unnamed ones."""
+    names = [step.get("name") or f"step-{i}" for i, step in enumerate(steps)]
+    seen = set()
+    for name in names:
+        if name in seen:
+            raise ValueError(f"Duplicate step name: {name}")
+        seen.add(name)
+    return names
+
+
+def build_graph(steps: List[Dict]) -> Dict[str, List[str]]:
+    """Map each step name to the steps it needs, validating the DAG."""
+    names = step_names(steps)
+    if not any("needs" in step for step in steps):
+        # No declared dependencies: keep steps strictly in order
+        return {name: names[i - 1:i] for i, name in enumerate(names)}
+
+    graph = {}
+    for name, step in zip(names, steps):
+        needs = step.get("needs", [])
+        if isinstance(needs, str):
+            needs = [needs]
+        for dep in needs:
+            if dep not in names:
+                raise ValueError(f"Step {name} needs unknown step {dep}")
+        graph[name] = list(needs)
+
+    # Reject cycles with a depth-first search
+    state: Dict[str, int] = {}
+
+    def visit(node: str, path: List[str]):
+        if state.get(node) == 1:
+            cycle = path[path.index(node):] + [node]
+            raise ValueError(f"Dependency cycle: {' -> '.join(cycle)}")
+        if state.get(node) == 2:
+            return
+        state[node] = 1
+        for dep in graph[node]:
+            visit(dep, path + [node])
+        state[node] = 2
+
+    for name in graph:
+        visit(name, [])
+    return graph
+
+
+def critical_path(graph: Dict[str, List[str]],
+                  results: Dict[str, StepResult]) -> List[str]:
+    """Return the chain of steps with the longest total duration."""
+    finish: Dict[str, float] = {}
+    previous: Dict[str, Optional[str]] = {}
+
+    def longest(node: str) -> float:
+        if node not in finish:
+            best, best_dep = 0.0, None
+            for dep in graph[node]:
+                if longest(dep) > best:
+                    best, best_dep = finish[dep], dep
+            finish[node] = best + results[node].duration
+            previous[node] = best_dep
+        return finish[node]
+
+    if not graph:
+        return []
+    node: Optional[str] = max(graph, key=longest)
+    path = []
+    while node is not None:
+        path.append(node)
+        node = previous[node]
+    return path[::-1]
+
+
+async def run_dag(steps: List[Dict],
+                  run_step: Callable[[Dict], Awaitable[bool]],
+                  max_parallel: int = 1) -> Dict[str, StepResult]:
+    """
+    Run steps respecting their dependencies.
+
+    ``run_step`` receives a copy of each step with its ``name`` filled in.
+    Returns a result per step; its status is one of ``success``, ``failed``,
+    ``cancelled`` or ``skipped``.
+    """
+    graph = build_graph(steps)
+    # Steps are handed over under their DAG name, so unnamed ones are
+    # reported, logged and recorded as ``step-{i}`` everywhere
+    by_name = {name: {**step, "name": name} for name, step in zip(step_names(steps), steps)}
+    results = {name: StepResult(name) for name in graph}
+    limit = asyncio.Semaphore(max(1, max_parallel))
+    running: Dict[asyncio.Task, str] = {}
+    failed = False
+
+    async def execute(name: str) -> bool:
+        async with limit:
+            results[name].start = time.monotonic()
+            try:
+                return await run_step(by_name[name])
+            finally:
+                results[name].end = time.monotonic()
+
+    def ready() -> List[str]:
+        return [
+            name for name, deps in graph.items()
+            if results[name].status == "pending"
+            and all(results[d].status == "success" for d in deps)
+        ]
+
+    def start_ready():
+        for name in ready():
+            results[name].status = "running"
+            running[asyncio.ensure_future(execute(name))] = name
+
+    start_ready()
+    while running:
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            name = running.pop(task)
+            ok = not task.cancelled() and task.exception() is None and task.result()
+            results[name].status = "success" if ok else "failed"
+            failed = failed or not ok
+
+        if failed:
+            # Fail fast: stop everything still in flight
+            for task, name in running.items():
+                task.cancel()
+                results[name].status = "cancelled"
+            await asyncio.gather(*running, return_exceptions=True)
+            running.clear()
+        else:
+            start_ready()
+
+    for result in results.values():
+        if result.status == "pending":
+            result.status = "skipped"
+    return results
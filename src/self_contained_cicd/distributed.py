@@ -0,0 +1,545 @@
+"""
+Distributed step execution
+
+A ``StepCoordinator`` is a QMP service that hands command steps to worker
+processes instead of running them locally. Workers connect to it over a
+socket, register with a number of slots and then send heartbeats while they
+are alive. A worker id is held by one live connection at a time; a second
+registration under the same id is rejected. The coordinator speaks the usual QMP framing (4-byte big-endian
+length followed by a JSON ``QMPMessage``).
+
+Workers run in their own workspace and only see the files a step declares
+under ``inputs``; these are sent with the job, except for files the worker
+already received with the same digest. After a successful run the files
+matching ``outputs`` are sent back and written into the project.
+
+A worker whose connection drops or whose heartbeats stop is considered
+lost. The steps it was running go back to the queue and are retried on
+another worker, up to ``max_attempts`` dispatches per step. A step that
+exits non-zero is a failure of the step, not of the worker, and is not
+retried.
+
+Run a worker with::
+
+    python -m src.self_contained_cicd.distributed --connect 127.0.0.1:7700 --workspace /tmp/w1
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import logging
+import os
+import signal
+import socket
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Set
+
+from ..qmp import QMPMessage, QMPService
+from .cache import expand_paths
+from .checksum import ChecksumCache, file_sha256
+from .streaming import OutputCapture
+
+DEFAULT_HEARTBEAT_INTERVAL = 1.0
+DEFAULT_HEARTBEAT_TIMEOUT = 5.0
+DEFAULT_MAX_ATTEMPTS = 3
+TAIL_LINES = 50
+
+logger = logging.getLogger(__name__)
+
+
+def encode_message(message: QMPMessage) -> bytes:
+    """Frame a message for the wire."""
+    data = json.dumps(message.to_dict()).encode()
+    return len(data).to_bytes(4, "big") + data
+
+
+async def read_message(reader: asyncio.StreamReader) -> QMPMessage:
+    """Read one framed message; raises IncompleteReadError at EOF."""
+    length = int.from_bytes(await reader.readexactly(4), "big")
+    return QMPMessage.from_dict(json.loads(await reader.readexactly(length)))
+
+
+def _safe_path(root: Path, rel_path: str) -> Path:
+    """Resolve a transferred relative path, refusing to leave root."""
+    path = Path(rel_path)
+    if path.is_absolute() or ".." in path.parts:
+        raise ValueError(f"Refusing to write outside the workspace: {rel_path}")
+    return root / path
+
+
+def pack_files(root: Path, files: Dict[str, str]) -> Dict[str, Dict]:
+    """Encode files (relative path -> digest) for transfer."""
+    packed = {}
+    for rel_path, digest in files.items():
+        path = root / rel_path
+        packed[rel_path] = {
+            "digest": digest,
+            "mode": path.stat().st_mode & 0o777,
+            "data": base64.b64encode(path.read_bytes()).decode("ascii"),
+        }
+    return packed
+
+
+def unpack_files(root: Path, packed: Dict[str, Dict]):
+    """Verify and write transferred files under root."""
+    for rel_path, item in packed.items():
+        data = base64.b64decode(item["data"])
+        if hashlib.sha256(data).hexdigest() != item["digest"]:
+            raise ValueError(f"Checksum mismatch for transferred file {rel_path}")
+        target = _safe_path(root, rel_path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f".{target.name}.transfer")
+        tmp.write_bytes(data)
+        os.chmod(tmp, item.get("mode", 0o644))
+        os.replace(tmp, target)
+
+
+@dataclass
+class RemoteResult:
+    """Outcome of a step run on a worker."""
+    step_name: str
+    worker_id: Optional[str] = None
+    returncode: Optional[int] = None
+    stdout: str = ""
+    stderr: str = ""
+    duration: float = 0.0
+    attempts: int = 0
+    error: Optional[str] = None
+
+    @property
+    def success(self) -> bool:
+        return self.error is None and self.returncode == 0
+
+
+@dataclass
+class WorkerInfo:
+    """Coordinator-side state of a connected worker."""
+    worker_id: str
+    writer: asyncio.StreamWriter
+    slots: int = 1
+    last_seen: float = field(default_factory=time.monotonic)
+    running: Set[str] = field(default_factory=set)
+    sent: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def free_slots(self) -> int:
+        return self.slots - len(self.running)
+
+
+@dataclass
+class _Job:
+    job_id: str
+    step: Dict
+    future: asyncio.Future
+    attempts: int = 0
+    worker_id: Optional[str] = None
+
+
+class StepCoordinator(QMPService):
+    """Dispatches steps to registered workers and collects their results."""
+
+    def __init__(self, node_id: str, project_root: Path,
+                 checksums: Optional[ChecksumCache] = None,
+                 heartbeat_interval: float = DEFAULT_HEARTBEAT_INTERVAL,
+                 heartbeat_timeout: float = DEFAULT_HEARTBEAT_TIMEOUT,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        super().__init__(node_id)
+        self.project_root = Path(project_root)
+        self.checksums = checksums or ChecksumCache()
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_attempts = max_attempts
+        self.workers: Dict[str, WorkerInfo] = {}
+        self.results: Dict[str, RemoteResult] = {}
+        self._jobs: Dict[str, _Job] = {}
+        self._pending: Deque[str] = deque()
+        self._job_ids = itertools.count(1)
+        self._worker_joined = asyncio.Event()
+        self._monitor: Optional[asyncio.Task] = None
+
+        self.register_handler("register", self._on_register)
+        self.register_handler("heartbeat", self._on_heartbeat)
+        self.register_handler("result", self._on_result)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        """Start listening for workers and watching their heartbeats."""
+        address = await super().start(host, port)
+        self._monitor = asyncio.create_task(self._watch_heartbeats())
+        return address
+
+    async def stop(self):
+        """Shut down workers, fail queued steps and stop the server."""
+        if self._monitor is not None:
+            self._monitor.cancel()
+        for worker in list(self.workers.values()):
+            await self._send(worker, "shutdown", {})
+            worker.writer.close()
+        self.workers.clear()
+        for job in self._jobs.values():
+            if not job.future.done():
+                job.future.set_result(RemoteResult(
+                    job.step.get("name", job.job_id), attempts=job.attempts,
+                    error="coordinator stopped"
+                ))
+        self._jobs.clear()
+        self._pending.clear()
+        await super().stop()
+
+    async def wait_for_workers(self, count: int = 1, timeout: Optional[float] = None):
+        """Wait until at least count workers have registered."""
+        async def wait():
+            while len(self.workers) < count:
+                self._worker_joined.clear()
+                await self._worker_joined.wait()
+        await asyncio.wait_for(wait(), timeout)
+
+    async def submit(self, step: Dict) -> RemoteResult:
+        """Run a step on some worker and return its result."""
+        loop = asyncio.get_event_loop()
+        job = _Job(f"job-{next(self._job_ids)}", step, loop.create_future())
+        self._jobs[job.job_id] = job
+        self._pending.append(job.job_id)
+        await self._dispatch()
+        try:
+            result = await job.future
+        except asyncio.CancelledError:
+            await self._cancel(job)
+            raise
+        self.results[result.step_name] = result
+        return result
+
+    def summary(self) -> Dict[str, Dict]:
+        """Steps, failures and busy time per worker."""
+        per_worker: Dict[str, Dict] = {}
+        for result in self.results.values():
+            stats = per_worker.setdefault(
+                result.worker_id or "none", {"steps": 0, "failed": 0, "busy": 0.0}
+            )
+            stats["steps"] += 1
+            stats["failed"] += 0 if result.success else 1
+            stats["busy"] += result.duration
+        return per_worker
+
+    async def _handle_connection(self, reader, writer):
+        """Serve a worker connection and treat its end as losing the worker."""
+        try:
+            await super()._handle_connection(reader, writer)
+        finally:
+            for worker in list(self.workers.values()):
+                if worker.writer is writer:
+                    await self._lose_worker(worker.worker_id, "connection closed")
+
+    async def _send(self, worker: WorkerInfo, message_type: str, content: Dict) -> bool:
+        """Send a message to a worker; False if the connection is broken."""
+        try:
+            worker.writer.write(encode_message(self.create_message(content, message_type)))
+            await worker.writer.drain()
+            return True
+        except (ConnectionError, RuntimeError):
+            return False
+
+    async def _on_register(self, message: QMPMessage, writer):
+        worker_id = message.content["worker_id"]
+        slots = max(1, int(message.content.get("slots", 1)))
+        existing = self.workers.get(worker_id)
+        if existing is not None and existing.writer is writer:
+            existing.slots = slots
+        elif existing is not None and not existing.writer.is_closing():
+            # Worker ids are self-declared; never let a second connection
+            # take over a live worker and orphan the steps it is running
+            logger.warning(f"Rejected duplicate registration of worker {worker_id}")
+            writer.write(encode_message(self.create_message(
+                {"worker_id": worker_id, "reason": "worker id already registered"},
+                "register_rejected"
+            )))
+            writer.close()
+            return
+        else:
+            if existing is not None:
+                await self._lose_worker(worker_id, "re-registered")
+            self.workers[worker_id] = WorkerInfo(worker_id, writer, slots=slots)
+        self._worker_joined.set()
+        await self._dispatch()
+
+    async def _on_heartbeat(self, message: QMPMessage, writer):
+        worker = self.workers.get(message.content["worker_id"])
+        if worker is not None and worker.writer is writer:
+            worker.last_seen = time.monotonic()
+
+    async def _on_result(self, message: QMPMessage, writer):
+        content = message.content
+        job = self._jobs.get(content["job_id"])
+        worker = self.workers.get(message.sender_id)
+        if worker is None or worker.writer is not writer:
+            return  # not from the connection this worker registered on
+        worker.last_seen = time.monotonic()
+        worker.running.discard(content["job_id"])
+        if job is None or job.worker_id != message.sender_id:
+            # Cancelled, or already handed to another worker
+            await self._dispatch()
+            return
+
+        del self._jobs[job.job_id]
+        result = RemoteResult(
+            job.step.get("name", job.job_id),
+            worker_id=message.sender_id,
+            returncode=content.get("returncode"),
+            stdout=content.get("stdout", ""),
+            stderr=content.get("stderr", ""),
+            duration=content.get("duration", 0.0),
+            attempts=job.attempts,
+            error=content.get("error"),
+        )
+        if result.success and content.get("outputs"):
+            try:
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(
+                    None, unpack_files, self.project_root, content["outputs"]
+                )
+            except (OSError, ValueError) as e:
+                result.error = f"Output transfer failed: {e}"
+        if not job.future.done():
+            job.future.set_result(result)
+        await self._dispatch()
+
+    def _collect_inputs(self, step: Dict) -> Dict[str, str]:
+        """Relative path -> digest of the files a step declares as inputs."""
+        paths = expand_paths(self.project_root, step.get("inputs", []))
+        digests = self.checksums.digest_many(paths)
+        return {str(path.relative_to(self.project_root)): d for path, d in digests.items()}
+
+    async def _dispatch(self):
+        """Hand queued steps to the least loaded workers with free slots."""
+        while self._pending:
+            available = [w for w in self.workers.values() if w.free_slots > 0]
+            if not available:
+                return
+            worker = max(available, key=lambda w: w.free_slots)
+            job = self._jobs.get(self._pending.popleft())
+            if job is None:
+                continue
+            job.attempts += 1
+            job.worker_id = worker.worker_id
+            worker.running.add(job.job_id)
+            asyncio.create_task(self._send_job(worker, job))
+
+    async def _send_job(self, worker: WorkerInfo, job: _Job):
+        """Send a step and the inputs the worker does not have yet."""
+        try:
+            loop = asyncio.get_event_loop()
+            inputs = await loop.run_in_executor(None, self._collect_inputs, job.step)
+            missing = {p: d for p, d in inputs.items() if worker.sent.get(p) != d}
+            files = await loop.run_in_executor(None, pack_files, self.project_root, missing)
+        except (OSError, ValueError) as e:
+            worker.running.discard(job.job_id)
+            self._jobs.pop(job.job_id, None)
+            if not job.future.done():
+                job.future.set_result(RemoteResult(
+                    job.step.get("name", job.job_id), attempts=job.attempts,
+                    error=f"Input transfer failed: {e}"
+                ))
+            return
+
+        sent = await self._send(worker, "run_step", {
+            "job_id": job.job_id, "step": job.step, "files": files
+        })
+        if sent:
+            worker.sent.update(missing)
+        else:
+            await self._lose_worker(worker.worker_id, "send failed")
+
+    async def _cancel(self, job: _Job):
+        """Withdraw a step, telling its worker to kill it."""
+        self._jobs.pop(job.job_id, None)
+        worker = self.workers.get(job.worker_id) if job.worker_id else None
+        if worker is not None and job.job_id in worker.running:
+            # The worker reports nothing for a cancelled step, free its slot now
+            worker.running.discard(job.job_id)
+            await self._send(worker, "cancel", {"job_id": job.job_id})
+            await self._dispatch()
+
+    async def _lose_worker(self, worker_id: str, reason: str):
+        """Forget a worker and retry or fail the steps it was running."""
+        worker = self.workers.pop(worker_id, None)
+        if worker is None:
+            return
+        logger.warning(f"Lost worker {worker_id}: {reason}")
+        worker.writer.close()
+        for job_id in worker.running:
+            job = self._jobs.get(job_id)
+            if job is None or job.future.done():
+                continue
+            if job.attempts >= self.max_attempts:
+                del self._jobs[job_id]
+                job.future.set_result(RemoteResult(
+                    job.step.get("name", job_id), worker_id=worker_id,
+                    attempts=job.attempts,
+                    error=f"Worker lost after {job.attempts} attempts: {reason}"
+                ))
+            else:
+                job.worker_id = None
+                self._pending.appendleft(job_id)
+        await self._dispatch()
+
+    async def _watch_heartbeats(self):
+        """Drop workers whose heartbeats have stopped."""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval / 2)
+            now = time.monotonic()
+            for worker in list(self.workers.values()):
+                if now - worker.last_seen > self.heartbeat_timeout:
+                    await self._lose_worker(worker.worker_id, "heartbeat timeout")
+
+
+class StepWorker:
+    """Runs steps received from a coordinator in a local workspace."""
+
+    def __init__(self, worker_id: str, workspace: Path, slots: int = 1,
+                 heartbeat_interval: float = DEFAULT_HEARTBEAT_INTERVAL):
+        self.worker_id = worker_id
+        self.workspace = Path(workspace).absolute()
+        self.slots = slots
+        self.heartbeat_interval = heartbeat_interval
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._send_lock = asyncio.Lock()
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def _send(self, message_type: str, content: Dict):
+        message = QMPMessage(
+            content=content,
+            sender_id=self.worker_id,
+            message_type=message_type,
+            timestamp=time.time()
+        )
+        async with self._send_lock:
+            self._writer.write(encode_message(message))
+            await self._writer.drain()
+
+    async def run(self, host: str, port: int):
+        """Connect, register and serve steps until told to shut down."""
+        self.workspace.mkdir(parents=True, exist_ok=True)
+        reader, self._writer = await asyncio.open_connection(host, port)
+        await self._send("register", {
+            "worker_id": self.worker_id, "slots": self.slots, "pid": os.getpid()
+        })
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while True:
+                message = await read_message(reader)
+                if message.message_type == "run_step":
+                    job_id = message.content["job_id"]
+                    self._tasks[job_id] = asyncio.create_task(self._run_job(message.content))
+                elif message.message_type == "cancel":
+                    task = self._tasks.get(message.content["job_id"])
+                    if task is not None:
+                        task.cancel()
+                elif message.message_type == "register_rejected":
+                    logger.error(f"Registration rejected: {message.content.get('reason')}")
+                    break
+                elif message.message_type == "shutdown":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            heartbeat.cancel()
+            for task in self._tasks.values():
+                task.cancel()
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+            self._writer.close()
+
+    async def _heartbeat(self):
+        while True:
+            await self._send("heartbeat", {
+                "worker_id": self.worker_id, "running": list(self._tasks)
+            })
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def _run_job(self, content: Dict):
+        job_id = content["job_id"]
+        step = content["step"]
+        reply = {"job_id": job_id}
+        try:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, unpack_files, self.workspace, content.get("files", {}))
+            reply.update(await self._execute(step))
+            if reply["returncode"] == 0 and step.get("outputs"):
+                reply["outputs"] = await loop.run_in_executor(
+                    None, self._collect_outputs, step["outputs"]
+                )
+        except asyncio.CancelledError:
+            self._tasks.pop(job_id, None)
+            raise
+        except (OSError, ValueError) as e:
+            reply["error"] = str(e)
+        self._tasks.pop(job_id, None)
+        await self._send("result", reply)
+
+    async def _execute(self, step: Dict) -> Dict:
+        """Run a step's command in the workspace, keeping an output tail."""
+        start = time.monotonic()
+        proc = await asyncio.create_subprocess_shell(
+            step["command"],
+            cwd=self.workspace,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=(os.name == "posix")
+        )
+        capture = OutputCapture(
+            step.get("name", "step"), self.workspace / ".logs", tail_lines=TAIL_LINES
+        )
+        try:
+            await capture.capture(proc.stdout, proc.stderr)
+            await proc.wait()
+        except asyncio.CancelledError:
+            if proc.returncode is None:
+                try:
+                    if os.name == "posix":
+                        os.killpg(proc.pid, signal.SIGKILL)
+                    else:
+                        proc.kill()
+                except ProcessLookupError:
+                    pass
+                await proc.wait()
+            raise
+        finally:
+            capture.close()
+        return {
+            "returncode": proc.returncode,
+            "stdout": capture.tail("stdout"),
+            "stderr": capture.tail("stderr"),
+            "duration": time.monotonic() - start,
+        }
+
+    def _collect_outputs(self, patterns: List[str]) -> Dict[str, Dict]:
+        files = {
+            str(path.relative_to(self.workspace)): file_sha256(path)
+            for path in expand_paths(self.workspace, patterns)
+        }
+        return pack_files(self.workspace, files)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Run a step worker from the command line."""
+    parser = argparse.ArgumentParser(description="Self-contained CI/CD step worker")
+    parser.add_argument("--connect", required=True, help="coordinator address as host:port")
+    parser.add_argument("--workspace", required=True, help="directory steps run in")
+    parser.add_argument("--id", default=f"{socket.gethostname()}-{os.getpid()}",
+                        help="worker id (default: host-pid)")
+    parser.add_argument("--slots", type=int, default=1, help="steps to run concurrently")
+    parser.add_argument("--heartbeat", type=float, default=DEFAULT_HEARTBEAT_INTERVAL,
+                        help="heartbeat interval in seconds")
+    args = parser.parse_args(argv)
+
+    host, _, port = args.connect.rpartition(":")
+    worker = StepWorker(args.id, Path(args.workspace), args.slots, args.heartbeat)
+    asyncio.run(worker.run(host, int(port)))
+
+
+if __name__ == "__main__":
+    main()
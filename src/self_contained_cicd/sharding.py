@@ -0,0 +1,281 @@
+"""
+Sharded pytest runs
+
+A test step with ``"shards": N`` is split into N pytest processes that run
+in parallel. The test ids are collected once, then distributed over the
+shards longest-first onto the least loaded shard, using per-test durations
+recorded by earlier runs. Tests without history are assumed to take the
+mean known duration.
+
+Shard selection and timing are done by a small pytest plugin written to
+the work directory. The plugin and the collection or JUnit options reach
+pytest through ``PYTEST_ADDOPTS``, so the step command itself is left
+unchanged and may be any shell command that runs pytest, e.g.
+``cd sub && pytest | tee log``. Each shard writes a JUnit XML file; these
+are merged into a single report, and the measured durations are folded
+into the step's own timings database after every run.
+"""
+
+import asyncio
+import heapq
+import json
+import os
+import shlex
+import shutil
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .streaming import OutputCapture, log_file_name
+
+PLUGIN_NAME = "_cicd_shard"
+DEFAULT_DURATION = 1.0
+SMOOTHING = 0.5
+
+PLUGIN_SOURCE = '''\
+"""pytest plugin used by self_contained_cicd to collect, select and time tests."""
+import json
+import os
+
+_durations = {}
+
+
+def pytest_collection_modifyitems(config, items):
+    collect_to = os.environ.get("CICD_SHARD_COLLECT")
+    if collect_to:
+        with open(collect_to, "w") as f:
+            json.dump([item.nodeid for item in items], f)
+        return
+    selection = os.environ.get("CICD_SHARD_TESTS")
+    if not selection:
+        return
+    with open(selection) as f:
+        keep = set(json.load(f))
+    selected = [item for item in items if item.nodeid in keep]
+    deselected = [item for item in items if item.nodeid not in keep]
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = selected
+
+
+def pytest_runtest_logreport(report):
+    _durations[report.nodeid] = _durations.get(report.nodeid, 0.0) + report.duration
+
+
+def pytest_sessionfinish(session):
+    timings_to = os.environ.get("CICD_SHARD_TIMINGS")
+    if timings_to:
+        with open(timings_to, "w") as f:
+            json.dump(_durations, f)
+'''
+
+
+class TestTimings:
+    """Historical per-test durations, smoothed over runs."""
+
+    __test__ = False  # not a pytest test class
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else None
+        self.durations: Dict[str, float] = {}
+        if self.path is not None and self.path.exists():
+            try:
+                with open(self.path, "r") as f:
+                    self.durations = json.load(f)
+            except (OSError, ValueError):
+                self.durations = {}
+
+    def mean(self) -> float:
+        """Mean known duration, assumed for tests without history."""
+        if self.durations:
+            return sum(self.durations.values()) / len(self.durations)
+        return DEFAULT_DURATION
+
+    def estimate(self, test_id: str, default: Optional[float] = None) -> float:
+        """Expected duration of a test; ``default`` saves recomputing the mean."""
+        if test_id in self.durations:
+            return self.durations[test_id]
+        return self.mean() if default is None else default
+
+    def update(self, measured: Dict[str, float], collected: Optional[List[str]] = None):
+        """Fold in new measurements and forget tests that no longer exist."""
+        for test_id, duration in measured.items():
+            old = self.durations.get(test_id)
+            self.durations[test_id] = duration if old is None else \
+                old * (1 - SMOOTHING) + duration * SMOOTHING
+        if collected is not None:
+            alive = set(collected)
+            self.durations = {t: d for t, d in self.durations.items() if t in alive}
+
+    def save(self):
+        """Persist the database."""
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.durations, f, indent=0, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def plan_shards(test_ids: List[str], shards: int, timings: TestTimings) -> List[List[str]]:
+    """Split tests into shards of about equal expected duration (LPT)."""
+    shards = max(1, shards)
+    heap = [(0.0, i) for i in range(shards)]
+    plan: List[List[str]] = [[] for _ in range(shards)]
+    mean = timings.mean()
+    estimates = {test_id: timings.estimate(test_id, mean) for test_id in test_ids}
+    for test_id in sorted(test_ids, key=lambda t: (-estimates[t], t)):
+        load, index = heapq.heappop(heap)
+        plan[index].append(test_id)
+        heapq.heappush(heap, (load + estimates[test_id], index))
+    return plan
+
+
+def merge_junit(reports: List[Path], target: Path, suite_name: str) -> Dict[str, float]:
+    """Merge JUnit XML files into one test suite; returns its totals."""
+    merged = ET.Element("testsuite", name=suite_name)
+    totals = {"tests": 0, "failures": 0, "errors": 0, "skipped": 0, "time": 0.0}
+    for report in reports:
+        if not report.exists():
+            continue
+        root = ET.parse(report).getroot()
+        suites = [root] if root.tag == "testsuite" else root.findall("testsuite")
+        for suite in suites:
+            for key in totals:
+                totals[key] += float(suite.get(key, 0))
+            merged.extend(suite.findall("testcase"))
+
+    for key, value in totals.items():
+        merged.set(key, f"{value:.3f}" if key == "time" else str(int(value)))
+    target.parent.mkdir(parents=True, exist_ok=True)
+    document = ET.Element("testsuites")
+    document.append(merged)
+    ET.ElementTree(document).write(target, encoding="utf-8", xml_declaration=True)
+    return totals
+
+
+@dataclass
+class ShardedRun:
+    """Outcome of a sharded test step."""
+    returncodes: List[int] = field(default_factory=list)
+    report: Optional[Path] = None
+    totals: Dict[str, float] = field(default_factory=dict)
+    stderr: str = ""
+
+    @property
+    def success(self) -> bool:
+        return all(code == 0 for code in self.returncodes)
+
+
+class TestSharder:
+    """Runs a pytest command as several balanced, parallel shards."""
+
+    __test__ = False  # not a pytest test class
+
+    def __init__(self, project_root: Path, work_dir: Path, report_dir: Path,
+                 timings: TestTimings, make_capture: Callable[[str], OutputCapture],
+                 kill: Optional[Callable[[asyncio.subprocess.Process], Awaitable]] = None):
+        self.project_root = Path(project_root)
+        self.work_dir = Path(work_dir)
+        self.report_dir = Path(report_dir)
+        self.timings = timings
+        self.make_capture = make_capture
+        self.kill = kill
+
+    def _environment(self, options: List[str], **extra: str) -> Dict[str, str]:
+        """Environment loading the plugin with extra pytest options."""
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            p for p in (str(self.work_dir), env.get("PYTHONPATH")) if p
+        )
+        env["PYTEST_ADDOPTS"] = " ".join(
+            [env.get("PYTEST_ADDOPTS", ""), "-p", PLUGIN_NAME, *map(shlex.quote, options)]
+        ).strip()
+        env.update(extra)
+        return env
+
+    async def _run(self, command: str, env: Dict[str, str], capture_name: str) -> Tuple[int, str]:
+        proc = await asyncio.create_subprocess_shell(
+            command,
+            cwd=self.project_root,
+            env=env,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=(os.name == "posix")
+        )
+        capture = self.make_capture(capture_name)
+        try:
+            await capture.capture(proc.stdout, proc.stderr)
+            await proc.wait()
+        except asyncio.CancelledError:
+            if self.kill is not None:
+                await self.kill(proc)
+            elif proc.returncode is None:
+                proc.kill()
+            raise
+        finally:
+            capture.close()
+        return proc.returncode, capture.tail("stderr") or capture.tail("stdout")
+
+    async def collect(self, command: str, name: str, step_dir: Path) -> List[str]:
+        """Test ids the command would run."""
+        ids_path = step_dir / "collected.json"
+        code, output = await self._run(
+            command,
+            self._environment(["--collect-only", "-q"], CICD_SHARD_COLLECT=str(ids_path)),
+            f"{name} [collect]"
+        )
+        # Exit code 5 means no tests were collected
+        if code not in (0, 5) or not ids_path.exists():
+            raise RuntimeError(f"Test collection failed with exit code {code}: {output}")
+        with open(ids_path, "r") as f:
+            return json.load(f)
+
+    async def run(self, command: str, shards: int, name: str) -> ShardedRun:
+        """Collect, plan, run the shards in parallel and merge the results."""
+        step_dir = self.work_dir / log_file_name(name)[:-len(".log")]
+        shutil.rmtree(step_dir, ignore_errors=True)
+        step_dir.mkdir(parents=True)
+        (self.work_dir / f"{PLUGIN_NAME}.py").write_text(PLUGIN_SOURCE)
+
+        test_ids = await self.collect(command, name, step_dir)
+        plan = [tests for tests in plan_shards(test_ids, shards, self.timings) if tests]
+
+        async def run_shard(index: int, tests: List[str]) -> Tuple[int, str]:
+            selection = step_dir / f"shard-{index}.tests.json"
+            with open(selection, "w") as f:
+                json.dump(tests, f)
+            junit = step_dir / f"shard-{index}.xml"
+            return await self._run(
+                command,
+                self._environment(
+                    [f"--junitxml={junit}"],
+                    CICD_SHARD_TESTS=str(selection),
+                    CICD_SHARD_TIMINGS=str(step_dir / f"shard-{index}.timings.json")
+                ),
+                f"{name} [shard {index + 1} of {len(plan)}]"
+            )
+
+        outcomes = await asyncio.gather(*(run_shard(i, t) for i, t in enumerate(plan)))
+
+        measured: Dict[str, float] = {}
+        for index in range(len(plan)):
+            path = step_dir / f"shard-{index}.timings.json"
+            if path.exists():
+                with open(path, "r") as f:
+                    measured.update(json.load(f))
+        self.timings.update(measured, test_ids)
+        self.timings.save()
+
+        report = self.report_dir / (log_file_name(name)[:-len(".log")] + ".xml")
+        totals = merge_junit(
+            [step_dir / f"shard-{i}.xml" for i in range(len(plan))], report, name
+        )
+        return ShardedRun(
+            returncodes=[code for code, _ in outcomes],
+            report=report,
+            totals=totals,
+            stderr="\n".join(output for code, output in outcomes if code != 0)
+        )
@@ -0,0 +1,166 @@
+"""
+Streaming step output
+
+Step output is read from the process pipes chunk by chunk while the step is
+running instead of being collected with ``communicate()``. Every chunk is
+appended to a per-step log file that rotates once it reaches a size limit,
+and only a bounded tail of lines per stream is kept in memory for error
+reports. Consumers can watch output live through a callback or by
+iterating over ``OutputCapture.lines()``.
+"""
+
+import asyncio
+import re
+from collections import deque
+from pathlib import Path
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_TAIL_LINES = 200
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+
+# Called as callback(step_name, stream_name, line); may be a coroutine
+OutputCallback = Callable[[str, str, str], object]
+
+
+def log_file_name(step_name: str) -> str:
+    """Turn a step name into a safe log file name."""
+    return (re.sub(r"[^A-Za-z0-9._-]+", "_", step_name).strip("_") or "step") + ".log"
+
+
+class RotatingLog:
+    """
+    Append-only log file rotated by size, like logging's RotatingFileHandler.
+
+    The file is unbuffered: output arrives in drained chunks already, and
+    each one is on disk as soon as it is written, so a step that hangs or is
+    cancelled still leaves its output behind.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = DEFAULT_MAX_BYTES,
+                 backup_count: int = DEFAULT_BACKUP_COUNT):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "wb", buffering=0)
+        self._size = 0
+
+    def write(self, data: bytes):
+        """Append data, rotating first if it would exceed the size limit."""
+        if self.max_bytes and self._size and self._size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._size += len(data)
+
+    def _rotate(self):
+        """Shift log.N to log.N+1 and start a fresh file."""
+        self._file.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                older = self.path.with_name(f"{self.path.name}.{i}")
+                if older.exists():
+                    older.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        self._file = open(self.path, "wb", buffering=0)
+        self._size = 0
+
+    def close(self):
+        """Close the current file."""
+        self._file.close()
+
+
+class OutputCapture:
+    """Captures a step's stdout and stderr without buffering them whole."""
+
+    def __init__(self, step_name: str, log_dir: Path,
+                 tail_lines: int = DEFAULT_TAIL_LINES,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 backup_count: int = DEFAULT_BACKUP_COUNT,
+                 callback: Optional[OutputCallback] = None):
+        self.step_name = step_name
+        self.log = RotatingLog(Path(log_dir) / log_file_name(step_name), max_bytes, backup_count)
+        self.callback = callback
+        self.bytes_captured = 0
+        self._tails: Dict[str, Deque[str]] = {
+            "stdout": deque(maxlen=tail_lines),
+            "stderr": deque(maxlen=tail_lines),
+        }
+        self._subscribers: List[asyncio.Queue] = []
+
+    @property
+    def log_path(self) -> Path:
+        """Path of the current log file."""
+        return self.log.path
+
+    def tail(self, stream: str = "stderr") -> str:
+        """The last captured lines of a stream."""
+        return "\n".join(self._tails[stream])
+
+    def lines(self, max_pending: int = 1000) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Yield ``(stream, line)`` pairs as the step produces them.
+
+        Subscribes immediately, so call it before capture begins. A slow
+        consumer applies backpressure to the step instead of growing memory.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._subscribers.append(queue)
+
+        async def iterate():
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    yield item
+            finally:
+                self._subscribers.remove(queue)
+
+        return iterate()
+
+    async def capture(self, stdout: asyncio.StreamReader, stderr: asyncio.StreamReader):
+        """Pump both pipes until they are closed, then end live iteration."""
+        await asyncio.gather(self.pump(stdout, "stdout"), self.pump(stderr, "stderr"))
+        for queue in self._subscribers:
+            await queue.put(None)
+
+    async def pump(self, reader: Optional[asyncio.StreamReader], stream: str):
+        """Read one pipe to the end, chunk by chunk."""
+        if reader is None:
+            return
+        partial = b""
+        while True:
+            chunk = await reader.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            self.bytes_captured += len(chunk)
+            self.log.write(chunk)
+            *complete, partial = (partial + chunk).split(b"\n")
+            for line in complete:
+                await self._emit(stream, line)
+            if len(partial) > CHUNK_SIZE:
+                # Don't let a single endless line grow without bound
+                await self._emit(stream, partial)
+                partial = b""
+        if partial:
+            await self._emit(stream, partial)
+
+    async def _emit(self, stream: str, raw: bytes):
+        """Record a line in the tail and hand it to consumers."""
+        line = raw.decode(errors="replace").rstrip("\r")
+        self._tails[stream].append(line)
+        if self.callback is not None:
+            result = self.callback(self.step_name, stream, line)
+            if asyncio.iscoroutine(result):
+                await result
+        for queue in self._subscribers:
+            await queue.put((stream, line))
+
+    def close(self):
+        """Close the log file and release any live consumers."""
+        self.log.close()
+        for queue in self._subscribers:
+            if not queue.full():
+                queue.put_nowait(None)
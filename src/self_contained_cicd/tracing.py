@@ -0,0 +1,319 @@
+"""
+Pipeline timing records
+
+Every step of a pipeline run gets a ``StepRecord``: wall-clock start and
+end, CPU time and peak RSS of its child processes, exit code, cache status
+and, for distributed runs, the worker it ran on. The records of a run are
+written to ``build/runs/<run_id>.json`` and can be exported as Chrome
+trace events (load in chrome://tracing or Perfetto) or as OTLP/JSON spans
+for OpenTelemetry collectors. ``compare_runs`` reports steps that got
+slower between two run records.
+
+For command steps, CPU time and RSS come from ``getrusage(RUSAGE_CHILDREN)``
+deltas. They are exact when steps run one at a time; steps that overlap
+share the children reaped during their lifetime. The peak RSS is the
+high-water mark of all children reaped so far, as reported by the kernel.
+Script steps run in long-lived pool workers that are never reaped, so the
+worker measures them itself with ``RUSAGE_SELF``; their peak RSS is None
+unless the script raised the worker's high-water mark.
+
+Only the newest ``keep`` run records (and their exports) are kept.
+"""
+
+import argparse
+import json
+import os
+import secrets
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+DEFAULT_KEEP_RUNS = 50
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def _children_usage() -> Dict[str, float]:
+    if resource is None:
+        return {"user": 0.0, "system": 0.0, "max_rss_kb": 0}
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {"user": usage.ru_utime, "system": usage.ru_stime, "max_rss_kb": usage.ru_maxrss}
+
+
+@dataclass
+class StepRecord:
+    """Timing and resource usage of one step."""
+    name: str
+    stage: str
+    start: float
+    end: Optional[float] = None
+    status: str = "running"
+    exit_code: Optional[int] = None
+    cache: Optional[str] = None
+    worker: Optional[str] = None
+    cpu_user: float = 0.0
+    cpu_system: float = 0.0
+    max_rss_kb: Optional[int] = 0
+    _usage: Dict[str, float] = field(default_factory=dict, repr=False)
+    _measured: Optional[Dict[str, Any]] = field(default=None, repr=False)
+
+    def set_usage(self, cpu_user: Optional[float], cpu_system: Optional[float],
+                  max_rss_kb: Optional[int]):
+        """Use usage measured by whoever ran the step instead of child deltas."""
+        self._measured = {"user": cpu_user or 0.0, "system": cpu_system or 0.0,
+                          "max_rss_kb": max_rss_kb}
+
+    @property
+    def duration(self) -> float:
+        return (self.end or self.start) - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        del data["_usage"]
+        del data["_measured"]
+        data["duration"] = self.duration
+        return data
+
+
+class RunRecorder:
+    """Collects step records of a pipeline run and writes them out."""
+
+    def __init__(self, runs_dir: Path):
+        self.runs_dir = Path(runs_dir)
+        self.run_id = datetime.now().strftime("%Y%m%dT%H%M%S.%f") + f"-{os.getpid()}"
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.status = "running"
+        self.steps: List[StepRecord] = []
+
+    def begin_step(self, name: str, stage: str) -> StepRecord:
+        """Start timing a step."""
+        record = StepRecord(name, stage, time.time(), _usage=_children_usage())
+        self.steps.append(record)
+        return record
+
+    def end_step(self, record: StepRecord):
+        """Stop timing a step and attribute child resource usage to it."""
+        record.end = time.time()
+        if record._measured is not None:
+            record.cpu_user = record._measured["user"]
+            record.cpu_system = record._measured["system"]
+            record.max_rss_kb = record._measured["max_rss_kb"]
+            return
+        usage = _children_usage()
+        record.cpu_user = usage["user"] - record._usage.get("user", 0.0)
+        record.cpu_system = usage["system"] - record._usage.get("system", 0.0)
+        record.max_rss_kb = int(usage["max_rss_kb"])
+
+    def finish(self, status: str):
+        """Mark the run as finished."""
+        self.end = time.time()
+        self.status = status
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "run_id": self.run_id,
+            "start": self.start,
+            "end": self.end,
+            "status": self.status,
+            "steps": [record.to_dict() for record in self.steps],
+        }
+
+    def save(self, formats: List[str] = ("chrome",), keep: int = DEFAULT_KEEP_RUNS) -> Path:
+        """Write the run record and the requested trace exports."""
+        self.runs_dir.mkdir(parents=True, exist_ok=True)
+        record = self.to_dict()
+        path = self.runs_dir / f"{self.run_id}.json"
+        _write_json(path, record)
+        if "chrome" in formats:
+            _write_json(self.runs_dir / f"{self.run_id}.trace.json", chrome_trace(record))
+        if "otlp" in formats:
+            _write_json(self.runs_dir / f"{self.run_id}.otlp.json", otlp_spans(record))
+        self.prune(keep)
+        return path
+
+    def prune(self, keep: int = DEFAULT_KEEP_RUNS):
+        """Delete all but the newest ``keep`` run records and their exports."""
+        exports = (".trace.json", ".otlp.json")
+        # Run ids start with a timestamp, so they sort oldest first
+        run_ids = sorted(
+            p.name[:-len(".json")] for p in self.runs_dir.glob("*.json")
+            if not p.name.startswith(".") and not p.name.endswith(exports)
+        )
+        for run_id in run_ids[:max(0, len(run_ids) - keep)]:
+            for suffix in (".json", *exports):
+                try:
+                    (self.runs_dir / f"{run_id}{suffix}").unlink()
+                except FileNotFoundError:
+                    pass
+
+
+def _write_json(path: Path, data: Dict):
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def load_run(path: Path) -> Dict[str, Any]:
+    """Read a run record."""
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _lanes(steps: List[Dict]) -> List[int]:
+    """Give overlapping steps separate lanes so traces show them side by side."""
+    lanes: List[float] = []
+    assigned = [0] * len(steps)
+    for i in sorted(range(len(steps)), key=lambda i: steps[i]["start"]):
+        step = steps[i]
+        end = step["end"] or step["start"]
+        for lane, busy_until in enumerate(lanes):
+            if busy_until <= step["start"]:
+                lanes[lane] = end
+                assigned[i] = lane
+                break
+        else:
+            lanes.append(end)
+            assigned[i] = len(lanes) - 1
+    return assigned
+
+
+def chrome_trace(run: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a run record to the Chrome trace-event format."""
+    origin = run["start"]
+    steps = run["steps"]
+    events = [{
+        "name": "pipeline", "ph": "X", "pid": 1, "tid": 0, "ts": 0,
+        "dur": ((run["end"] or origin) - origin) * 1e6,
+        "args": {"run_id": run["run_id"], "status": run["status"]},
+    }]
+    lanes = _lanes(steps)
+    for step, lane in zip(steps, lanes):
+        events.append({
+            "name": step["name"],
+            "cat": step["stage"],
+            "ph": "X",
+            "pid": 1,
+            "tid": lane + 1,
+            "ts": (step["start"] - origin) * 1e6,
+            "dur": step["duration"] * 1e6,
+            "args": {
+                key: step[key] for key in
+                ("status", "exit_code", "cache", "worker", "cpu_user", "cpu_system", "max_rss_kb")
+            },
+        })
+    for tid in range(max(lanes, default=-1) + 2):
+        events.append({
+            "name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+            "args": {"name": "pipeline" if tid == 0 else f"lane {tid}"},
+        })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def otlp_spans(run: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a run record to OTLP/JSON (ExportTraceServiceRequest)."""
+    trace_id = secrets.token_hex(16)
+    root_id = secrets.token_hex(8)
+    spans = [{
+        "traceId": trace_id,
+        "spanId": root_id,
+        "name": "pipeline",
+        "kind": 1,
+        "startTimeUnixNano": str(int(run["start"] * 1e9)),
+        "endTimeUnixNano": str(int((run["end"] or run["start"]) * 1e9)),
+        "attributes": [_attribute("cicd.run_id", run["run_id"])],
+        "status": {"code": 1 if run["status"] == "success" else 2},
+    }]
+    for step in run["steps"]:
+        attributes = [_attribute("cicd.stage", step["stage"])]
+        for key in ("exit_code", "cache", "worker", "cpu_user", "cpu_system", "max_rss_kb"):
+            if step[key] is not None:
+                attributes.append(_attribute(f"cicd.{key}", step[key]))
+        spans.append({
+            "traceId": trace_id,
+            "spanId": secrets.token_hex(8),
+            "parentSpanId": root_id,
+            "name": step["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(int(step["start"] * 1e9)),
+            "endTimeUnixNano": str(int((step["end"] or step["start"]) * 1e9)),
+            "attributes": attributes,
+            "status": {"code": 1 if step["status"] in ("success", "skipped") else 2},
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", "self-contained-cicd")]},
+        "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+    }]}
+
+
+def compare_runs(baseline: Dict[str, Any], current: Dict[str, Any],
+                 threshold: float = 0.2, min_seconds: float = 0.1) -> List[Dict[str, Any]]:
+    """
+    Steps that got slower by more than threshold (a fraction).
+
+    Steps faster than min_seconds in both runs are ignored, as are steps
+    that were restored from cache or skipped in either run.
+    """
+    def timed(run):
+        return {
+            (s["stage"], s["name"]): s["duration"] for s in run["steps"]
+            if s["status"] == "success" and s["cache"] not in ("hit", "unchanged")
+        }
+
+    before, after = timed(baseline), timed(current)
+    regressions = []
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        if max(old, new) < min_seconds or new <= old * (1 + threshold):
+            continue
+        regressions.append({
+            "stage": key[0], "name": key[1], "baseline": old, "current": new,
+            "change": (new - old) / old if old else float("inf"),
+        })
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Export or compare run records from the command line."""
+    parser = argparse.ArgumentParser(description="Self-contained CI/CD run records")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="convert a run record to a trace")
+    export.add_argument("run")
+    export.add_argument("--format", choices=("chrome", "otlp"), default="chrome")
+    compare = commands.add_parser("compare", help="report steps that got slower")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        run = load_run(Path(args.run))
+        print(json.dumps(chrome_trace(run) if args.format == "chrome" else otlp_spans(run)))
+        return 0
+
+    regressions = compare_runs(load_run(Path(args.baseline)), load_run(Path(args.current)),
+                               args.threshold)
+    for r in regressions:
+        print(f"{r['stage']}/{r['name']}: {r['baseline']:.2f}s -> {r['current']:.2f}s "
+              f"(+{r['change'] * 100:.0f}%)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,269 @@
+"""
+Warm Python workers for script steps
+
+Starting a fresh interpreter for every ``script`` step costs interpreter
+startup plus re-importing everything the script uses. Script steps instead
+run in a pool of long-lived worker processes that import the modules listed
+under ``preload`` once, when they start, off the event loop. The process
+wide forkserver preload list is left alone, since it is shared with every
+other forkserver user and ignored once the server runs. Each script is
+executed with ``runpy.run_path`` as ``__main__`` in a fresh namespace, with
+its own working directory, ``sys.argv`` and environment, and its output
+redirected at the file-descriptor level into the step log. Afterwards the
+worker restores its state and drops modules the script imported.
+
+Isolation is best effort: a script can still change state inside preloaded
+modules or leave threads behind. Workers are therefore replaced after
+``max_jobs`` scripts, and always after a crash or cancellation.
+"""
+
+import asyncio
+import importlib
+import multiprocessing
+import os
+import runpy
+import sys
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+DEFAULT_MAX_JOBS = 100
+
+
+@dataclass
+class ScriptResult:
+    """Outcome of a script run in a worker."""
+    exit_code: int
+    duration: float
+    worker_pid: int
+    log_path: Optional[Path] = None
+    error: Optional[str] = None
+    # Resource usage of the worker during the script; None if unknown
+    cpu_user: Optional[float] = None
+    cpu_system: Optional[float] = None
+    max_rss_kb: Optional[int] = None
+
+    @property
+    def success(self) -> bool:
+        return self.exit_code == 0
+
+    def tail(self, lines: int = 50) -> str:
+        """The last lines the script wrote to its log."""
+        if self.log_path is None or not self.log_path.exists():
+            return self.error or ""
+        with open(self.log_path, "rb") as f:
+            return "\n".join(
+                line.decode(errors="replace") for line in deque(f, maxlen=lines)
+            ).rstrip("\n")
+
+
+def _exit_code(exc: SystemExit) -> int:
+    """Translate SystemExit the way the interpreter does."""
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    print(exc.code, file=sys.stderr)
+    return 1
+
+
+def _run_script(job: Dict, baseline_modules: set) -> Dict:
+    """Run one script in this process and put everything back afterwards."""
+    saved_cwd = os.getcwd()
+    saved_argv = sys.argv[:]
+    saved_path = sys.path[:]
+    saved_env = dict(os.environ)
+    saved_fds = (os.dup(1), os.dup(2))
+    usage_before = resource.getrusage(resource.RUSAGE_SELF) if resource else None
+    start = time.monotonic()
+    error = None
+
+    log_path = job.get("log_path") or os.devnull
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with open(log_path, "ab") as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            os.chdir(job["cwd"])
+            os.environ.update(job.get("env") or {})
+            sys.argv = [job["script"], *job.get("args", [])]
+            sys.path.insert(0, os.path.dirname(os.path.abspath(job["script"])))
+            runpy.run_path(job["script"], run_name="__main__")
+            exit_code = 0
+        except SystemExit as e:
+            exit_code = _exit_code(e)
+        except BaseException:
+            traceback.print_exc()
+            error = traceback.format_exc(limit=-1).strip().splitlines()[-1]
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved_fds[0], 1)
+            os.dup2(saved_fds[1], 2)
+            for fd in saved_fds:
+                os.close(fd)
+            os.chdir(saved_cwd)
+            os.environ.clear()
+            os.environ.update(saved_env)
+            sys.argv = saved_argv
+            sys.path[:] = saved_path
+            for name in set(sys.modules) - baseline_modules:
+                del sys.modules[name]
+
+    reply = {"exit_code": exit_code, "duration": time.monotonic() - start, "error": error}
+    if usage_before is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        reply["cpu_user"] = usage.ru_utime - usage_before.ru_utime
+        reply["cpu_system"] = usage.ru_stime - usage_before.ru_stime
+        # ru_maxrss is the worker's lifetime peak: it is this script's peak
+        # only if the script raised it, otherwise the script's peak is unknown
+        if usage.ru_maxrss > usage_before.ru_maxrss:
+            reply["max_rss_kb"] = usage.ru_maxrss
+    return reply
+
+
+def _worker_main(conn, preload: List[str]):
+    """Serve script jobs from the parent until told to stop."""
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+    baseline_modules = set(sys.modules)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        conn.send(_run_script(job, baseline_modules))
+
+
+class _Worker:
+    def __init__(self, context, preload: List[str]):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, preload), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def stop(self, kill: bool = False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class ScriptWorkerPool:
+    """Pool of pre-imported Python processes that run script steps."""
+
+    def __init__(self, size: Optional[int] = None, preload: Iterable[str] = (),
+                 max_jobs: int = DEFAULT_MAX_JOBS):
+        self.size = size or os.cpu_count() or 1
+        self.preload = list(preload)
+        self.max_jobs = max_jobs
+        self.stats = {"jobs": 0, "recycled": 0, "crashed": 0}
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._context = multiprocessing.get_context(method)
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: List[_Worker] = []
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._context, self.preload)
+        self._workers.append(worker)
+        return worker
+
+    def _retire(self, worker: _Worker, kill: bool = False):
+        self._workers.remove(worker)
+        worker.stop(kill=kill)
+
+    async def start(self):
+        """Start the workers; called on first use if not done explicitly."""
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        loop = asyncio.get_event_loop()
+        for _ in range(self.size):
+            await self._idle.put(await loop.run_in_executor(None, self._spawn))
+
+    async def run(self, script: Path, args: Iterable[str] = (), cwd: Optional[Path] = None,
+                  env: Optional[Dict[str, str]] = None,
+                  log_path: Optional[Path] = None) -> ScriptResult:
+        """Run a script in an idle worker and return its result."""
+        await self.start()
+        loop = asyncio.get_event_loop()
+        job = {
+            "script": str(script),
+            "args": [str(a) for a in args],
+            "cwd": str(cwd or Path(script).parent),
+            "env": env,
+            "log_path": str(log_path) if log_path else None,
+        }
+        if log_path is not None:
+            Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+            Path(log_path).write_bytes(b"")
+
+        worker = await self._idle.get()
+        replace = False
+        try:
+            worker.conn.send(job)
+            reply = await loop.run_in_executor(None, worker.conn.recv)
+        except asyncio.CancelledError:
+            # The job may still be running: the worker cannot be trusted
+            replace = True
+            worker.process.kill()
+            await loop.run_in_executor(None, self._retire, worker, True)
+            raise
+        except (EOFError, OSError) as e:
+            replace = True
+            self.stats["crashed"] += 1
+            await loop.run_in_executor(None, self._retire, worker, True)
+            exit_code = worker.process.exitcode
+            return ScriptResult(
+                exit_code if exit_code not in (None, 0) else 1, 0.0, worker.process.pid,
+                Path(log_path) if log_path else None, error=f"Worker died: {e!r}"
+            )
+        finally:
+            if replace:
+                await self._idle.put(await loop.run_in_executor(None, self._spawn))
+
+        self.stats["jobs"] += 1
+        worker.jobs += 1
+        pid = worker.process.pid
+        if self.max_jobs and worker.jobs >= self.max_jobs:
+            self.stats["recycled"] += 1
+            await loop.run_in_executor(None, self._retire, worker)
+            worker = await loop.run_in_executor(None, self._spawn)
+        await self._idle.put(worker)
+
+        return ScriptResult(
+            reply["exit_code"], reply["duration"], pid,
+            Path(log_path) if log_path else None, error=reply["error"],
+            cpu_user=reply.get("cpu_user"), cpu_system=reply.get("cpu_system"),
+            max_rss_kb=reply.get("max_rss_kb")
+        )
+
+    async def close(self):
+        """Stop all workers."""
+        loop = asyncio.get_event_loop()
+        for worker in list(self._workers):
+            await loop.run_in_executor(None, self._retire, worker)
+        self._idle = None
@@ -1,9 +1,20 @@
 """Tests for the AI Nodes component."""
 
+import asyncio
+import multiprocessing
+import time
 import pytest
 import numpy as np
 from unittest.mock import MagicMock, patch
 from src.ai_nodes import AINode, ModelUpdate
+from src.ai_nodes.checkpoint import LazyCheckpoint, load_checkpoint, tensor_digest
+from src.ai_nodes.hierarchy import (
+    build_aggregation_tree, build_clustered_tree, collect_partial, tree_aggregate
+)
+from src.ai_nodes.rounds import RoundConfig, RoundCoordinator
+from src.ai_nodes.secure_aggregation import dropped_participants
+from src.ai_nodes.shared_weights import SharedWeightsPublisher, attach_weights
+from src.ai_nodes.simulation import run_simulation
 
 class MockModel:
     """Mock model class for testing."""
@@ -147,3 +158,597 @@ async def test_model_update_serialization():
     assert update_dict['node_id'] == "test_node"
     assert update_dict['samples_count'] == 100
     np.testing.assert_array_equal(restored_weights["dense/kernel"], np.ones((2, 2)))
+
+def test_checkpoint_roundtrip(tmp_path, ai_node, mock_model):
+    """Test that checkpoints preserve tensor values, dtypes and shapes."""
+    mock_model.weights = {
+        "dense/kernel": np.random.rand(10, 5),
+        "dense/bias": np.arange(5, dtype=np.float32),
+        "step": np.array(7, dtype=np.int64),
+        "scale": np.array(7.0),
+    }
+    model_path = tmp_path / "model.ckpt"
+    written, total = ai_node.save_model(str(model_path))
+    assert (written, total) == (4, 4)
+    
+    restored = MockModel()
+    AINode.load_model("restored", str(model_path), restored)
+    
+    assert isinstance(restored.weights, LazyCheckpoint)
+    for name, expected in mock_model.weights.items():
+        assert restored.weights[name].dtype == expected.dtype
+        assert restored.weights[name].shape == expected.shape
+        np.testing.assert_array_equal(restored.weights[name], expected)
+
+    # Scalars also keep their shape through the sync wire format
+    from src.ai_nodes.sync import decode_tensors, encode_tensors
+    decoded = decode_tensors(encode_tensors(mock_model.weights))
+    assert {name: a.shape for name, a in decoded.items()} == {
+        name: a.shape for name, a in mock_model.weights.items()
+    }
+
+def test_checkpoint_incremental_save(tmp_path, ai_node, mock_model):
+    """Test that only changed tensors are rewritten on save."""
+    mock_model.weights = {
+        "a": np.zeros((4, 4)),
+        "b": np.ones(8),
+    }
+    model_path = str(tmp_path / "model.ckpt")
+    ai_node.save_model(model_path)
+    assert ai_node.save_model(model_path) == (0, 2)
+    
+    mock_model.weights["b"] = np.full(8, 3.0)
+    assert ai_node.save_model(model_path) == (1, 2)
+    
+    loaded = load_checkpoint(model_path)
+    np.testing.assert_array_equal(loaded["a"], np.zeros((4, 4)))
+    np.testing.assert_array_equal(loaded["b"], np.full(8, 3.0))
+    assert not list(tmp_path.glob(".*.tmp"))
+    
+    # A changed layout falls back to a full rewrite
+    mock_model.weights["b"] = np.ones(16)
+    assert ai_node.save_model(model_path) == (2, 2)
+    assert load_checkpoint(model_path)["b"].shape == (16,)
+
+def test_checkpoint_load_is_lazy(tmp_path, ai_node):
+    """Test that loading reads only the header."""
+    model_path = str(tmp_path / "model.ckpt")
+    ai_node.save_model(model_path)
+    
+    loaded = load_checkpoint(model_path)
+    assert loaded._buffer is None
+    assert list(loaded) == ["dense/kernel"]
+    assert loaded.digest("dense/kernel") == tensor_digest(
+        ai_node.model.weights["dense/kernel"]
+    )
+    assert loaded._buffer is None
+    
+    loaded["dense/kernel"]
+    assert loaded._buffer is not None
+
+def test_load_invalid_checkpoint(tmp_path, mock_model):
+    """Test that non-checkpoint files are rejected."""
+    bogus = tmp_path / "bogus.json"
+    bogus.write_text('{"model": "saved_model_weights"}')
+    with pytest.raises(ValueError):
+        AINode.load_model("node", str(bogus), mock_model)
+
+def _fixed_participant(node_id, value, samples, delay=0.0):
+    """Build a round participant returning constant weights after a delay."""
+    async def participate(round_id, weights):
+        await asyncio.sleep(delay)
+        return ModelUpdate(node_id, {"dense/kernel": np.full((10, 5), value)},
+                           samples, 0.0, round_id=round_id)
+    return participate
+
+@pytest.mark.asyncio
+async def test_round_aggregates_updates_within_deadline(ai_node, mock_model):
+    """Test that a round aggregates on-time updates and skips stragglers."""
+    coordinator = RoundCoordinator(ai_node, RoundConfig(deadline=0.1))
+    coordinator.add_participant("fast1", _fixed_participant("fast1", 1.0, 100))
+    coordinator.add_participant("fast2", _fixed_participant("fast2", 4.0, 200))
+    coordinator.add_participant("slow", _fixed_participant("slow", 9.0, 100, 0.3))
+    
+    result = await coordinator.run_round()
+    
+    assert result.committed
+    assert sorted(result.accepted) == ["fast1", "fast2"]
+    assert result.stragglers == ["slow"]
+    assert result.duration < 0.3
+    assert {"fast1", "fast2", "slow"} <= ai_node.peers
+    np.testing.assert_allclose(mock_model.weights["dense/kernel"], 3.0)
+    await coordinator.close()
+
+@pytest.mark.asyncio
+async def test_round_discounts_and_drops_stale_updates(ai_node, mock_model):
+    """Test that late updates are down-weighted, then dropped when too old."""
+    config = RoundConfig(deadline=0.05, staleness_decay=0.5, max_staleness=1)
+    coordinator = RoundCoordinator(ai_node, config)
+    coordinator.add_participant("fast", _fixed_participant("fast", 1.0, 100))
+    coordinator.add_participant("late", _fixed_participant("late", 4.0, 100, 0.08))
+    
+    first = await coordinator.run_round()
+    assert first.stragglers == ["late"]
+    await asyncio.sleep(0.05)
+    
+    second = await coordinator.run_round()
+    assert second.stale == ["late"]
+    # The late update counts for half its samples: (1*100 + 4*50) / 150
+    np.testing.assert_allclose(mock_model.weights["dense/kernel"], 2.0)
+    
+    await coordinator.close()
+    
+    # With no tolerance for staleness the late update is dropped
+    coordinator = RoundCoordinator(ai_node, RoundConfig(deadline=0.05, max_staleness=0))
+    coordinator.add_participant("fast", _fixed_participant("fast", 1.0, 100))
+    coordinator.add_participant("late", _fixed_participant("late", 4.0, 100, 0.08))
+    await coordinator.run_round()
+    await asyncio.sleep(0.05)
+    third = await coordinator.run_round()
+    assert third.dropped == ["late"]
+    await coordinator.close()
+
+@pytest.mark.asyncio
+async def test_round_without_quorum(ai_node, mock_model):
+    """Test that a round below quorum leaves the model untouched."""
+    original = mock_model.weights
+    coordinator = RoundCoordinator(ai_node, RoundConfig(deadline=0.05, min_updates=2))
+    coordinator.add_participant("only", _fixed_participant("only", 1.0, 100))
+    
+    result = await coordinator.run_round()
+    
+    assert not result.committed
+    assert mock_model.weights is original
+    await coordinator.close()
+
+@pytest.mark.asyncio
+async def test_round_collects_before_done_callbacks_run(ai_node, mock_model):
+    """Test that tasks finishing while the loop is blocked are still accepted."""
+    async def blocking(round_id, weights):
+        time.sleep(0.3)
+        return ModelUpdate("a", {"dense/kernel": np.full((10, 5), 1.0)}, 100, 0.0)
+    
+    coordinator = RoundCoordinator(ai_node, RoundConfig(deadline=0.1))
+    coordinator.add_participant("b", _fixed_participant("b", 3.0, 100, 0.05))
+    coordinator.add_participant("a", blocking)
+    
+    result = await coordinator.run_round()
+    await asyncio.sleep(0)
+    
+    assert sorted(result.accepted) == ["a", "b"]
+    # Claimed updates are not filed again as late ones
+    assert not coordinator._late
+    await coordinator.close()
+
+@pytest.mark.asyncio
+async def test_round_without_quorum_keeps_stale_updates(ai_node, mock_model):
+    """Test that stale updates survive a round that misses quorum."""
+    config = RoundConfig(deadline=0.05, min_updates=3, max_staleness=2)
+    coordinator = RoundCoordinator(ai_node, config)
+    coordinator.add_participant("late", _fixed_participant("late", 4.0, 100, 0.08))
+    
+    await coordinator.run_round()
+    await asyncio.sleep(0.05)
+    coordinator.remove_participant("late")
+    
+    second = await coordinator.run_round()
+    assert second.stale == ["late"] and not second.committed
+    # Kept undiscounted, so the next round applies its own staleness
+    assert coordinator._late["late"].samples_count == 100
+    await coordinator.close()
+
+@pytest.mark.asyncio
+async def test_simulation_with_hundreds_of_nodes():
+    """Test the in-process simulation harness at scale."""
+    results = await run_simulation(
+        300, 2, config=RoundConfig(deadline=0.1, min_updates=100),
+        straggler_fraction=0.1, failure_rate=0.01, seed=1
+    )
+    
+    assert len(results) == 2
+    assert all(r.committed for r in results)
+    assert all(r.duration < 0.5 for r in results)
+    assert results[0].stragglers
+
+def _mesh_of_nodes(count):
+    """Build fully peered nodes that each hold one local update."""
+    rng = np.random.default_rng(42)
+    nodes = {}
+    for i in range(count):
+        model = MockModel()
+        node = AINode(f"node_{i}", model)
+        node.updates[node.node_id] = ModelUpdate(
+            node.node_id, {"dense/kernel": rng.random((10, 5))},
+            int(rng.integers(1, 500)), 0.0
+        )
+        nodes[node.node_id] = node
+    for node in nodes.values():
+        for peer_id in nodes:
+            if peer_id != node.node_id:
+                node.add_peer(peer_id)
+    return nodes
+
+@pytest.mark.asyncio
+async def test_tree_aggregation_matches_flat_fedavg():
+    """Test that tree aggregation reproduces flat FedAvg."""
+    nodes = _mesh_of_nodes(40)
+    flat = AINode("flat", MockModel())
+    flat.updates = {k: n.updates[k] for k, n in nodes.items()}
+    expected = await flat.aggregate_updates()
+    
+    tree = build_aggregation_tree(nodes, "node_0", fanout=3)
+    assert len(tree["node_0"]) == 3
+    assert sum(len(children) for children in tree.values()) == 39
+    
+    result = await tree_aggregate(nodes, tree, "node_0")
+    np.testing.assert_allclose(result["dense/kernel"], expected["dense/kernel"])
+    np.testing.assert_allclose(nodes["node_0"].model.weights["dense/kernel"],
+                               expected["dense/kernel"])
+
+@pytest.mark.asyncio
+async def test_clustered_tree_aggregation():
+    """Test cluster topologies and partial sample counts."""
+    nodes = _mesh_of_nodes(10)
+    for node in nodes.values():
+        node.peers.clear()
+    tree = build_clustered_tree(nodes, "node_0", cluster_size=4)
+    
+    assert len(tree["node_0"]) == 3
+    partial = await collect_partial(nodes, tree, tree["node_0"][0])
+    assert partial.contributors == 4
+    assert partial.samples_count == sum(
+        nodes[n].updates[n].samples_count for n in [tree["node_0"][0]] + tree[tree["node_0"][0]]
+    )
+    
+    flat = AINode("flat", MockModel())
+    flat.updates = {k: n.updates[k] for k, n in nodes.items()}
+    expected = await flat.aggregate_updates()
+    result = await tree_aggregate(nodes, tree, "node_0")
+    np.testing.assert_allclose(result["dense/kernel"], expected["dense/kernel"])
+
+def test_aggregation_tree_requires_connected_peers():
+    """Test that unreachable nodes are reported."""
+    nodes = _mesh_of_nodes(3)
+    nodes["node_2"].peers.clear()
+    for node in nodes.values():
+        node.peers.discard("node_2")
+    with pytest.raises(ValueError):
+        build_aggregation_tree(nodes, "node_0")
+
+def _secure_cohort(count):
+    """Build nodes with secure aggregation established between them."""
+    rng = np.random.default_rng(7)
+    nodes = {}
+    for i in range(count):
+        node = AINode(f"node_{i}", MockModel())
+        node.updates[node.node_id] = ModelUpdate(
+            node.node_id,
+            {"dense/kernel": rng.normal(size=(10, 5)), "dense/bias": rng.normal(size=5)},
+            int(rng.integers(1, 500)), 0.0
+        )
+        nodes[node.node_id] = node
+    public_keys = {k: n.enable_secure_aggregation() for k, n in nodes.items()}
+    for node in nodes.values():
+        node.secure_aggregation.establish(public_keys)
+    return nodes
+
+@pytest.mark.asyncio
+async def test_secure_aggregation_matches_fedavg(ai_node):
+    """Test that masked updates aggregate to the plain FedAvg result."""
+    nodes = _secure_cohort(5)
+    masked = {
+        k: n.mask_update(n.updates[k], round_id=3) for k, n in nodes.items()
+    }
+    
+    # Individual masked vectors reveal nothing recognisable
+    plain = nodes["node_0"].updates["node_0"].weights["dense/bias"]
+    assert not np.allclose(masked["node_0"].masked[-6:-1].view(np.int64), plain)
+    
+    ai_node.updates = {k: n.updates[k] for k, n in nodes.items()}
+    expected = await ai_node.aggregate_updates()
+    
+    aggregator = AINode("aggregator", MockModel())
+    result = await aggregator.aggregate_masked(masked)
+    for name in expected:
+        np.testing.assert_allclose(result[name], expected[name], atol=1e-6)
+
+@pytest.mark.asyncio
+async def test_secure_aggregation_keeps_fractional_samples(ai_node):
+    """Test that staleness-discounted sample counts weigh as in plain FedAvg."""
+    nodes = _secure_cohort(3)
+    for k, node in nodes.items():
+        update = node.updates[k]
+        node.updates[k] = ModelUpdate(k, update.weights, update.samples_count * 0.375 + 0.3, 0.0)
+    masked = {k: n.mask_update(n.updates[k]) for k, n in nodes.items()}
+    
+    ai_node.updates = {k: n.updates[k] for k, n in nodes.items()}
+    expected = await ai_node.aggregate_updates()
+    
+    aggregator = AINode("aggregator", MockModel())
+    result = await aggregator.aggregate_masked(masked)
+    for name in expected:
+        np.testing.assert_allclose(result[name], expected[name], atol=1e-6)
+
+@pytest.mark.asyncio
+async def test_secure_aggregation_handles_dropouts(ai_node):
+    """Test that survivors' revealed seeds remove orphaned masks."""
+    nodes = _secure_cohort(5)
+    survivors = ["node_0", "node_2", "node_4"]
+    masked = {k: nodes[k].mask_update(nodes[k].updates[k]) for k in survivors}
+    
+    aggregator = AINode("aggregator", MockModel())
+    with pytest.raises(ValueError):
+        await aggregator.aggregate_masked(masked)
+    
+    dropped = dropped_participants(masked)
+    assert dropped == ["node_1", "node_3"]
+    revealed = {k: nodes[k].secure_aggregation.reveal_seeds(dropped) for k in survivors}
+    result = await aggregator.aggregate_masked(masked, revealed)
+    
+    ai_node.updates = {k: nodes[k].updates[k] for k in survivors}
+    expected = await ai_node.aggregate_updates()
+    for name in expected:
+        np.testing.assert_allclose(result[name], expected[name], atol=1e-6)
+
+def test_mask_update_requires_secure_mode(ai_node):
+    """Test that masking without enabling secure aggregation fails."""
+    update = ModelUpdate("test_node", {"w": np.ones(2)}, 1, 0.0)
+    with pytest.raises(RuntimeError):
+        ai_node.mask_update(update)
+
+@pytest.fixture
+def publisher():
+    """Fixture providing a shared weights publisher that is cleaned up."""
+    publisher = SharedWeightsPublisher(keep=2)
+    yield publisher
+    publisher.close()
+
+def _sum_shared_kernel(name, queue):
+    """Attach to shared weights in a child process and report a checksum."""
+    weights = attach_weights(name)
+    queue.put(float(weights["dense/kernel"].sum()))
+    weights.close()
+
+def test_shared_weights_copy_on_write(ai_node, mock_model, publisher):
+    """Test that attached weights are shared read-only with local copies."""
+    global_weights = {
+        "dense/kernel": np.arange(50, dtype=np.float32).reshape(10, 5),
+        "dense/bias": np.ones(5),
+    }
+    name = publisher.publish(global_weights)
+    shared = ai_node.attach_shared_weights(name)
+    
+    assert mock_model.weights is shared
+    assert shared.version == 1
+    kernel = shared["dense/kernel"]
+    np.testing.assert_array_equal(kernel, global_weights["dense/kernel"])
+    with pytest.raises(ValueError):
+        kernel[0, 0] = 42
+    
+    local = shared.writable("dense/kernel")
+    local[0, 0] = 42
+    assert shared["dense/kernel"][0, 0] == 42
+    assert set(shared.modified) == {"dense/kernel"}
+    
+    # Other attachments still see the published values
+    other = attach_weights(name)
+    assert other["dense/kernel"][0, 0] == 0
+    other.close()
+
+def test_shared_weights_broadcast_swaps_handle(ai_node, mock_model, publisher):
+    """Test that a new global model is picked up by attaching a new block."""
+    first = publisher.publish({"w": np.zeros(4)})
+    ai_node.attach_shared_weights(first)
+    second = publisher.publish({"w": np.full(4, 2.0)})
+    ai_node.attach_shared_weights(second)
+    
+    np.testing.assert_array_equal(mock_model.weights["w"], np.full(4, 2.0))
+    assert ai_node.shared_weights.version == 2
+    
+    publisher.publish({"w": np.full(4, 3.0)})
+    with pytest.raises(FileNotFoundError):
+        attach_weights(first)
+
+def test_shared_weights_empty_tensors_and_held_views(publisher):
+    """Zero-size tensors publish, and closing with a view still held is safe."""
+    name = publisher.publish({"e": np.zeros((0, 3)), "w": np.arange(3.0)})
+    shared = attach_weights(name)
+    assert shared["e"].shape == (0, 3)
+    held = shared["w"]
+    shared.close()
+    # The view stays valid until it is dropped
+    np.testing.assert_array_equal(held, np.arange(3.0))
+    del held
+    attach_weights(name).close()
+
+@pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(),
+    reason="requires fork start method"
+)
+def test_shared_weights_across_processes(publisher):
+    """Test that another process reads the same block."""
+    name = publisher.publish({"dense/kernel": np.full((100, 100), 0.5)})
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_sum_shared_kernel, args=(name, queue))
+    proc.start()
+    assert queue.get(timeout=10) == 5000.0
+    proc.join(timeout=10)
+    assert proc.exitcode == 0
+
+def test_model_update_tensor_digests():
+    """Updates expose per-tensor digests matching the checkpoint digest."""
+    weights = {"a": np.arange(6, dtype=np.float32), "b": np.zeros((2, 3))}
+    update = ModelUpdate("node", weights, 10, 0.0)
+    assert update.tensor_digests() == {name: tensor_digest(w) for name, w in weights.items()}
+    assert update.tensor_digests() is update.digests
+
+@pytest.mark.asyncio
+async def test_differential_sync_transfers_only_changed_tensors():
+    """After the first round only tensors the receiver lacks are sent."""
+    from src.qmp import QMPService
+    from src.ai_nodes.sync import ModelSync
+
+    base = {"frozen": np.random.rand(64, 64), "head": np.random.rand(64), "zeros": np.zeros((4, 2))}
+
+    class FixedModel(MockModel):
+        def __init__(self):
+            self.weights = {k: v.copy() for k, v in base.items()}
+
+    sender_qmp, receiver_qmp = QMPService("sender"), QMPService("receiver")
+    sender = ModelSync(AINode("sender", FixedModel()), sender_qmp)
+    receiver_node = AINode("receiver", FixedModel())
+    receiver = ModelSync(receiver_node, receiver_qmp)
+    host, port = (await receiver_qmp.start("127.0.0.1", 0))[:2]
+    writer = await sender_qmp.connect(host, port)
+
+    async def wait_for(count):
+        for _ in range(100):
+            if receiver.stats["updates_received"] >= count:
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError("update not received")
+
+    try:
+        # Only the head changed since the shared starting point
+        changed = dict(base, head=base["head"] + 1, zeros=np.zeros((2, 4)))
+        await sender.publish(ModelUpdate("sender", changed, 50, 1.0), writer)
+        await wait_for(1)
+        assert sender.stats["tensors_sent"] == 1
+        received = receiver_node.updates["sender"]
+        for name, value in changed.items():
+            np.testing.assert_array_equal(received.weights[name], value)
+        assert received.weights["zeros"].shape == (2, 4)
+        assert received.samples_count == 50
+
+        # Republishing the same tensors costs no tensor transfer at all
+        await sender.publish(ModelUpdate("sender", changed, 60, 2.0), writer)
+        await wait_for(2)
+        assert sender.stats["tensors_sent"] == 1
+        assert receiver_node.updates["sender"].samples_count == 60
+    finally:
+        await sender_qmp.stop()
+        await receiver_qmp.stop()
+
+@pytest.mark.asyncio
+async def test_differential_sync_survives_bad_peer_data():
+    """Unknown names and corrupt tensors neither raise nor close the connection."""
+    import base64
+    from src.qmp import QMPService
+    from src.ai_nodes.sync import MAX_REQUESTS, TENSORS, WANT, ModelSync
+
+    sender_qmp, receiver_qmp = QMPService("sender"), QMPService("receiver")
+    sender = ModelSync(AINode("sender", MockModel()), sender_qmp)
+    receiver_node = AINode("receiver", MockModel())
+    receiver = ModelSync(receiver_node, receiver_qmp)
+    corrupt = [1]
+
+    async def corrupting(message, writer):
+        if corrupt[0]:
+            corrupt[0] -= 1
+            for item in message.content["tensors"].values():
+                item["data"] = base64.b64encode(bytes(len(base64.b64decode(item["data"])))).decode()
+        await receiver._handle_tensors(message, writer)
+
+    receiver_qmp.register_handler(TENSORS, corrupting)
+    host, port = (await receiver_qmp.start("127.0.0.1", 0))[:2]
+    writer = await sender_qmp.connect(host, port)
+
+    async def received(count):
+        for _ in range(100):
+            if receiver.stats["updates_received"] + receiver.stats["updates_dropped"] >= count:
+                return
+            await asyncio.sleep(0.01)
+
+    try:
+        weights = {"w": np.arange(1.0, 5.0)}
+        await sender.publish(ModelUpdate("sender", weights, 5, 1.0), writer)
+        await received(1)
+        # The corrupt reply was rejected and the tensor asked for again
+        assert receiver.stats["replies_rejected"] == 1
+        assert sender.stats["tensors_sent"] == 2
+        np.testing.assert_array_equal(receiver_node.updates["sender"].weights["w"], weights["w"])
+
+        # A request for names the update does not have is answered without them
+        await receiver_qmp.send(receiver_qmp.create_message({"update_id": 1, "names": ["nope"]}, WANT),
+                                next(iter(receiver_qmp.connections)))
+        await asyncio.sleep(0.05)
+        assert sender.stats["tensors_sent"] == 2
+
+        # A peer that only sends corrupt tensors costs a few requests, then is dropped
+        corrupt[0] = MAX_REQUESTS
+        await sender.publish(ModelUpdate("sender", {"w": np.arange(2.0, 6.0)}, 5, 2.0), writer)
+        await received(2)
+        assert receiver.stats["updates_dropped"] == 1
+        assert sender.stats["tensors_sent"] == 2 + MAX_REQUESTS
+        assert receiver.stats["updates_received"] == 1
+        assert len(sender_qmp.connections) == 1
+    finally:
+        await sender_qmp.stop()
+        await receiver_qmp.stop()
+
+def test_tensor_store_keeps_private_verified_copies():
+    """Stored tensors are read-only copies, checked against their digest."""
+    from src.ai_nodes.checkpoint import tensor_digest
+    from src.ai_nodes.sync import TensorStore
+
+    store = TensorStore()
+    live = np.arange(4.0)
+    digest = store.add(live)
+    live[0] = 99.0
+    assert store.get(digest)[0] == 0.0
+    assert not store.get(digest).flags.writeable
+
+    manifest = {"node_id": "n", "samples_count": 1, "timestamp": 0.0,
+                "digests": {"w": digest, "b": tensor_digest(np.ones(2))}}
+    # A tensor neither stored nor received is a miss, not an error
+    assert store.assemble(manifest) is None
+    assert store.missing(manifest) == ["b"]
+
+    # A stored tensor that no longer matches its digest is dropped
+    store._tensors[digest] = np.zeros(4)
+    assert store.assemble(manifest, {"b": np.ones(2)}) is None
+    assert store.missing(manifest) == ["w"]
+    update = store.assemble(manifest, {"w": np.arange(4.0)})
+    np.testing.assert_array_equal(update.weights["w"], np.arange(4.0))
+    np.testing.assert_array_equal(update.weights["b"], np.ones(2))
+
+@pytest.mark.asyncio
+async def test_differential_sync_rerequests_evicted_tensors():
+    """A tensor evicted between request and reply is asked for again."""
+    from src.qmp import QMPService
+    from src.ai_nodes.sync import TENSORS, ModelSync
+
+    base = {"frozen": np.random.rand(8, 8), "head": np.random.rand(8)}
+
+    class FixedModel(MockModel):
+        def __init__(self):
+            self.weights = {k: v.copy() for k, v in base.items()}
+
+    sender_qmp, receiver_qmp = QMPService("sender"), QMPService("receiver")
+    sender = ModelSync(AINode("sender", FixedModel()), sender_qmp)
+    receiver_node = AINode("receiver", FixedModel())
+    receiver = ModelSync(receiver_node, receiver_qmp)
+    changed = dict(base, head=base["head"] + 1)
+    frozen_digest = receiver.store.add(base["frozen"])
+
+    async def evict_then_handle(message, writer):
+        receiver.store.discard(frozen_digest)
+        await receiver._handle_tensors(message, writer)
+
+    receiver_qmp.register_handler(TENSORS, evict_then_handle)
+    host, port = (await receiver_qmp.start("127.0.0.1", 0))[:2]
+    writer = await sender_qmp.connect(host, port)
+    try:
+        await sender.publish(ModelUpdate("sender", changed, 5, 1.0), writer)
+        for _ in range(100):
+            if receiver.stats["updates_received"]:
+                break
+            await asyncio.sleep(0.01)
+        # head first, then frozen again after its eviction
+        assert sender.stats["tensors_sent"] == 2
+        for name, value in changed.items():
+            np.testing.assert_array_equal(receiver_node.updates["sender"].weights[name], value)
+    finally:
+        await sender_qmp.stop()
+        await receiver_qmp.stop()
@@ -95,3 +95,290 @@ class TestIdentitySerialization:
         identity = Identity.from_dict(data)
         assert identity.public_key == "pub_key"
         assert identity.metadata["name"] == "Test"
+
+@pytest.mark.asyncio
+async def test_remote_resolution_coalesces_and_batches():
+    """Thousands of concurrent remote lookups cost a handful of requests."""
+    import asyncio
+    from src.qmp import QMPService
+    from src.didn.remote import RemoteResolver, ResolverService
+
+    server_didn = DIDN()
+    identity_ids = [
+        server_didn.register_identity(f"key_{i}", f"sig_{i}", {"index": i}) for i in range(100)
+    ]
+    data_id = server_didn.store_data(identity_ids[0], {"payload": 1}, "sig")
+    server = QMPService("server")
+    service = ResolverService(server_didn, server)
+    host, port = (await server.start("127.0.0.1", 0))[:2]
+
+    client = QMPService("client")
+    resolver = RemoteResolver(client, await client.connect(host, port), batch_window=0.01)
+    try:
+        lookups = [identity_ids[i % 100] for i in range(3000)] + ["missing"]
+        results = await asyncio.gather(*(resolver.resolve_identity(i) for i in lookups))
+        assert [r.metadata["index"] for r in results[:100]] == list(range(100))
+        assert results[-1] is None
+        assert service.requests <= 3
+        assert resolver.stats["coalesced"] >= 2900
+
+        # Resolved entries come from the cache without another request
+        requests = service.requests
+        assert (await resolver.resolve_identity(identity_ids[5])).public_key == "key_5"
+        assert resolver.stats["cache_hits"] == 1
+        assert (await resolver.resolve_data(data_id))["data"] == {"payload": 1}
+        assert service.requests == requests + 1
+    finally:
+        await client.stop()
+        await server.stop()
+
+@pytest.mark.asyncio
+async def test_remote_resolution_times_out():
+    """Lookups fail with a timeout when the peer never answers."""
+    import asyncio
+    from src.qmp import QMPService
+    from src.didn.remote import RemoteResolver
+
+    silent = QMPService("silent")
+    host, port = (await silent.start("127.0.0.1", 0))[:2]
+    client = QMPService("client")
+    resolver = RemoteResolver(client, await client.connect(host, port), timeout=0.05)
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.gather(resolver.resolve_identity("a"), resolver.resolve_identity("a"))
+        assert resolver._inflight == {}
+    finally:
+        await client.stop()
+        await silent.stop()
+
+@pytest.mark.asyncio
+async def test_remote_resolvers_share_one_service():
+    """Several resolvers on one QMP service each get their own replies."""
+    import asyncio
+    from src.qmp import QMPService
+    from src.didn.remote import RemoteResolver, ResolverService
+
+    servers, resolvers, owners = [], [], []
+    client = QMPService("client")
+    try:
+        for index in range(2):
+            didn = DIDN()
+            owners.append(didn.register_identity(f"key_{index}", "sig"))
+            server = QMPService(f"server_{index}")
+            ResolverService(didn, server)
+            host, port = (await server.start("127.0.0.1", 0))[:2]
+            servers.append(server)
+            resolvers.append(RemoteResolver(client, await client.connect(host, port), timeout=1.0))
+        # A second resolver on the first connection
+        resolvers.append(RemoteResolver(client, resolvers[0].writer, timeout=1.0))
+
+        results = await asyncio.gather(
+            resolvers[0].resolve_identity(owners[0]),
+            resolvers[1].resolve_identity(owners[1]),
+            resolvers[2].resolve_identity(owners[0]),
+            resolvers[1].resolve_identity(owners[0]),
+            *(resolver.refresh_summary() for resolver in resolvers)
+        )
+        assert [r.public_key for r in results[:3]] == ["key_0", "key_1", "key_0"]
+        assert results[3] is None
+        assert owners[1] not in resolvers[0].summary["identities"]
+        assert owners[1] in resolvers[1].summary["identities"]
+    finally:
+        await client.stop()
+        for server in servers:
+            await server.stop()
+
+def test_bloom_filter_accuracy_and_serialization():
+    """Bloom filters have no false negatives and stay near their FP target."""
+    from src.didn.filters import BloomFilter
+
+    bloom = BloomFilter(capacity=5000, fp_rate=0.01)
+    keys = [f"key-{i}" for i in range(5000)]
+    bloom.update(keys)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other-{i}" in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
+    assert bloom.false_positive_rate() == pytest.approx(0.01, rel=0.3)
+
+    restored = BloomFilter.from_text(bloom.to_text())
+    assert (restored.bits, restored.hashes, restored.count) == (bloom.bits, bloom.hashes, 5000)
+    assert all(key in restored for key in keys[:100])
+    with pytest.raises(ValueError):
+        BloomFilter.from_bytes(bloom.to_bytes()[:-1])
+
+def test_membership_summaries_route_lookups():
+    """DIDN keeps summaries current and peers are chosen by them."""
+    from src.didn import SUMMARY_CAPACITY
+    from src.didn.filters import PeerDirectory
+
+    nodes = {"a": DIDN(), "b": DIDN()}
+    owner = nodes["a"].register_identity("key_a", "sig")
+    # Grow past the initial capacity so the summary is rebuilt larger
+    data_ids = [nodes["a"].store_data(owner, {"i": i}, "sig") for i in range(SUMMARY_CAPACITY + 10)]
+    assert nodes["a"].summaries["data"].capacity == SUMMARY_CAPACITY * 2
+    assert len(nodes["a"].summaries["data"]) == len(data_ids)
+    nodes["b"].register_identity("key_b", "sig")
+
+    directory = PeerDirectory()
+    for peer_id, node in nodes.items():
+        directory.update(peer_id, json.loads(json.dumps(node.membership_summary())))
+    assert all(directory.peers_for("data", data_id) == ["a"] for data_id in data_ids[:200])
+    assert directory.peers_for("identities", owner) == ["a"]
+    misses = sum(bool(directory.peers_for("data", f"absent-{i}")) for i in range(1000))
+    assert misses < 30
+
+@pytest.mark.asyncio
+async def test_remote_resolver_skips_keys_ruled_out_by_summary():
+    """After fetching a summary, absent IDs cost no round trip."""
+    from src.qmp import QMPService
+    from src.didn.remote import RemoteResolver, ResolverService
+
+    server_didn = DIDN()
+    known = server_didn.register_identity("key", "sig")
+    server = QMPService("server")
+    service = ResolverService(server_didn, server)
+    host, port = (await server.start("127.0.0.1", 0))[:2]
+    client = QMPService("client")
+    resolver = RemoteResolver(client, await client.connect(host, port))
+    try:
+        await resolver.refresh_summary()
+        assert await resolver.resolve_identity("0" * 64) is None
+        assert service.requests == 0
+        assert resolver.stats["filtered"] == 1
+        assert (await resolver.resolve_identity(known)).public_key == "key"
+        assert service.requests == 1
+
+        # Once the summary expires, keys added since are found again
+        added = server_didn.register_identity("later", "sig")
+        resolver.summary_ttl = 0.0
+        assert (await resolver.resolve_identity(added)).public_key == "later"
+        assert await resolver.resolve_identity("0" * 64) is None
+        assert service.requests == 3
+    finally:
+        await client.stop()
+        await server.stop()
+
+@pytest.mark.asyncio
+async def test_peer_resolver_routes_lookups_by_summary():
+    """Lookups go only to the peers whose summary may hold the ID."""
+    from src.qmp import QMPService
+    from src.didn.remote import PeerResolver, ResolverService
+
+    client = QMPService("client")
+    resolver = PeerResolver(client, timeout=1.0)
+    servers, services, owners = [], {}, {}
+    try:
+        for peer_id in ("a", "b", "c"):
+            didn = DIDN()
+            owners[peer_id] = didn.register_identity(f"key_{peer_id}", "sig")
+            server = QMPService(peer_id)
+            services[peer_id] = ResolverService(didn, server)
+            host, port = (await server.start("127.0.0.1", 0))[:2]
+            servers.append(server)
+            resolver.add_peer(peer_id, await client.connect(host, port))
+
+        # Without summaries every peer is asked
+        assert (await resolver.resolve_identity(owners["b"])).public_key == "key_b"
+        assert all(service.requests == 1 for service in services.values())
+
+        await resolver.refresh_summaries()
+        assert (await resolver.resolve_identity(owners["c"])).public_key == "key_c"
+        assert [services[p].requests for p in "abc"] == [1, 1, 2]
+        assert await resolver.resolve_identity("0" * 64) is None
+        assert resolver.stats["filtered"] == 1
+
+        # An expired summary no longer rules its peer out
+        resolver.directory.ttl = 0.0
+        assert await resolver.resolve_identity("1" * 64) is None
+        assert [services[p].requests for p in "abc"] == [2, 2, 3]
+
+        resolver.remove_peer("c")
+        assert resolver.directory.peers_for("identities", owners["c"], resolver.peers) == ["a", "b"]
+    finally:
+        await client.stop()
+        for server in servers:
+            await server.stop()
+
+def test_version_chain_deltas_and_snapshots():
+    """Versions rebuild exactly from snapshots plus deltas and stay compact."""
+    from src.didn.versions import VersionChain, diff, patch
+
+    old = {"a": 1, "nested": {"x": 1, "y": [1, 2]}, "gone": True}
+    new = {"a": 1, "nested": {"x": 2, "y": [1, 2]}, "added": "z"}
+    assert patch(json.loads(json.dumps(old)), diff(old, new)) == new
+
+    chain = VersionChain(snapshot_interval=8)
+    record = {f"field_{i}": "x" * 100 for i in range(50)}
+    expected = []
+    for version in range(100):
+        record["counter"] = version
+        if version % 10 == 0:
+            record.pop("field_0", None)
+        expected.append(json.loads(json.dumps(record)))
+        chain.append(record, timestamp=1000.0 + version, data_id=f"id-{version}")
+
+    assert all(chain.get(v) == expected[v] for v in range(100))
+    assert chain.get(-1) == expected[-1]
+    # Mutating a returned version does not change the stored history
+    chain.get(3)["counter"] = "changed"
+    assert chain.get(3) == expected[3]
+
+    full_copies = sum(len(json.dumps(e)) for e in expected)
+    assert chain.stored_bytes() < full_copies / 5
+
+    assert chain.version_at(999.0) is None
+    assert chain.version_at(1000.0) == 0
+    assert chain.version_at(1050.5) == 50
+    assert chain.version_at(5000.0) == 99
+    with pytest.raises(ValueError):
+        chain.append({}, timestamp=1.0, data_id="old")
+
+def test_didn_versioned_records():
+    """DIDN keeps version history per identity and logical name."""
+    didn = DIDN()
+    owner = didn.register_identity("key", "sig")
+    ids = []
+    for version in range(3):
+        number, data_id = didn.put_version(owner, "profile", {"rev": version}, f"sig{version}",
+                                           timestamp=100.0 + version)
+        assert number == version
+        ids.append(data_id)
+
+    assert didn.get_version(owner, "profile") == {"rev": 2}
+    assert didn.get_version(owner, "profile", version=0) == {"rev": 0}
+    assert didn.get_version(owner, "profile", at=101.5) == {"rev": 1}
+    assert didn.get_version(owner, "profile", at=50.0) is None
+    assert didn.get_version(owner, "profile", version=7) is None
+    assert didn.get_version(owner, "missing") is None
+    assert [h["data_id"] for h in didn.history(owner, "profile")] == ids
+
+    # Version content IDs resolve like stored data and are in the summary
+    entry = didn.resolve_data(ids[1])
+    assert entry["data"] == {"rev": 1}
+    assert entry["identity"] == owner
+    assert entry["signature"] == "sig1"
+    assert ids[1] in didn.summaries["data"]
+    with pytest.raises(ValueError):
+        didn.put_version("unknown", "profile", {}, "sig")
+
+def test_versions_keep_value_types_and_tolerate_clock_steps(monkeypatch):
+    """1, 1.0 and True are distinct values, and a clock step back is absorbed."""
+    import time
+    from src.didn.versions import VersionChain, diff
+
+    assert diff({"a": 1}, {"a": 1.0}) == {"set": {"a": 1.0}}
+    assert diff({"a": [1, {"b": 1}]}, {"a": [True, {"b": 1}]}) == {"set": {"a": [True, {"b": 1}]}}
+    assert diff({"a": {"b": 1}}, {"a": {"b": 1}}) == {}
+
+    chain = VersionChain(snapshot_interval=4)
+    for version, value in enumerate([1, 1.0, True, 1, 1.0]):
+        chain.append({"v": value}, timestamp=float(version), data_id=str(version))
+    assert [type(chain.get(v)["v"]) for v in range(5)] == [int, float, bool, int, float]
+
+    didn = DIDN()
+    owner = didn.register_identity("key", "sig")
+    monkeypatch.setattr(time, "time", lambda: 2000.0)
+    didn.put_version(owner, "profile", {"rev": 0}, "sig")
+    monkeypatch.setattr(time, "time", lambda: 1990.0)
+    assert didn.put_version(owner, "profile", {"rev": 1}, "sig")[0] == 1
+    assert [h["timestamp"] for h in didn.history(owner, "profile")] == [2000.0, 2000.0]
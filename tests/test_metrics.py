@@ -0,0 +1,119 @@
+"""Tests for the runtime metrics registry."""
+
+import asyncio
+import pytest
+from src import metrics
+from src.metrics import Histogram, Registry
+
+def test_histogram_quantiles():
+    """Quantiles stay within the bucket resolution of the exact values."""
+    histogram = Histogram()
+    values = [i / 10000 for i in range(1, 10001)]
+    for value in values:
+        histogram.observe(value)
+
+    assert histogram.count == 10000
+    assert histogram.sum == pytest.approx(sum(values))
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * len(values)) - 1]
+        assert exact <= histogram.quantile(q) <= exact * 1.07
+    assert Histogram().quantile(0.5) != Histogram().quantile(0.5)  # NaN when empty
+
+def test_registry_render():
+    """Metrics render in the Prometheus text format with labels."""
+    registry = Registry()
+    registry.counter("requests_total", "Handled requests", path="/a").inc(3)
+    registry.counter("requests_total", path='/"b"').inc()
+    registry.gauge("queue_depth", "Queued jobs").set(7)
+    with registry.histogram("latency_seconds").time():
+        pass
+
+    text = registry.render()
+    assert "# HELP requests_total Handled requests" in text
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{path="/a"} 3' in text
+    assert 'requests_total{path="/\\"b\\""} 1' in text
+    assert "queue_depth 7" in text
+    assert "# TYPE latency_seconds summary" in text
+    assert 'latency_seconds{quantile="0.99"}' in text
+    assert "latency_seconds_count 1" in text
+
+    # Same name and labels return the same metric; a different kind is rejected
+    assert registry.counter("requests_total", path="/a") is registry.get("requests_total", path="/a")
+    with pytest.raises(ValueError):
+        registry.gauge("requests_total")
+
+    registry.reset()
+    assert registry.get("requests_total", path="/a").value == 0
+
+def test_instrumentation_respects_enabled_flag():
+    """Instrumented code only updates metrics while collection is enabled."""
+    from src.didn import DIDN
+    resolves = metrics.REGISTRY.get("didn_resolves_total", kind="identity", result="miss")
+    didn = DIDN()
+    before = resolves.value
+    try:
+        metrics.disable()
+        didn.resolve_identity("missing")
+        assert resolves.value == before
+        metrics.enable()
+        didn.resolve_identity("missing")
+        assert resolves.value == before + 1
+    finally:
+        metrics.enable()
+
+@pytest.mark.asyncio
+async def test_serve_metrics_endpoint():
+    """The HTTP endpoint serves /metrics and 404s everything else."""
+    registry = Registry()
+    registry.counter("served_total").inc(2)
+    server = await metrics.serve("127.0.0.1", 0, registry)
+    port = server.sockets[0].getsockname()[1]
+
+    async def get(path):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response.decode()
+
+    try:
+        response = await get("/metrics")
+        assert response.startswith("HTTP/1.1 200 OK")
+        assert "served_total 2" in response
+        assert (await get("/other")).startswith("HTTP/1.1 404")
+    finally:
+        server.close()
+        await server.wait_closed()
+
+@pytest.mark.asyncio
+async def test_received_message_types_are_bounded():
+    """Unregistered message types from peers share one "other" series."""
+    from src.qmp import QMPService
+    server = QMPService("server")
+    client = QMPService("client")
+
+    async def ping(message, writer):
+        pass
+
+    server.register_handler("ping", ping)
+    address = await server.start("127.0.0.1", 0)
+    counted = metrics.REGISTRY.get("qmp_received_messages_total", type="ping")
+    other = metrics.REGISTRY.get("qmp_received_messages_total", type="other")
+    before = counted.value, other.value
+    writer = await client.connect("127.0.0.1", address[1])
+    try:
+        await client.send(client.create_message({}, "ping"), writer)
+        for i in range(20):
+            await client.send(client.create_message({}, f"junk-{i}"), writer)
+        for _ in range(100):
+            if other.value - before[1] == 20:
+                break
+            await asyncio.sleep(0.01)
+        assert counted.value == before[0] + 1
+        assert other.value == before[1] + 20
+        assert metrics.REGISTRY.get("qmp_received_messages_total", type="junk-0") is None
+    finally:
+        await client.stop()
+        await server.stop()
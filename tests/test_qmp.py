@@ -142,3 +142,226 @@ async def test_create_message(qmp_service):
     assert message.sender_id == "test_node"
     assert isinstance(message.timestamp, float)
     assert message.signature is None
+
+@pytest.mark.asyncio
+async def test_handler_timing_and_slow_messages():
+    """Handler time is attributed per message type and slow messages reported."""
+    service = QMPService("timed_node", slow_threshold=0.02)
+    slow = []
+    service.handler_timer.on_slow = lambda message_type, elapsed: slow.append(message_type)
+
+    async def fast(message, writer):
+        pass
+
+    async def sluggish(message, writer):
+        await asyncio.sleep(0.05)
+
+    service.register_handler("fast", fast)
+    service.register_handler("sluggish", sluggish)
+    for message_type in ("fast", "fast", "sluggish"):
+        message = QMPMessage.from_dict(dict(TEST_MESSAGE, message_type=message_type))
+        await service._process_message(message, AsyncMock())
+
+    summary = service.handler_timer.summary()
+    assert list(summary) == ["sluggish", "fast"]
+    assert summary["fast"]["count"] == 2
+    assert summary["sluggish"]["max"] >= 0.05
+    assert slow == ["sluggish"]
+
+def test_sampling_profiler_collapsed_stacks(tmp_path):
+    """The profiler samples other threads into collapsed stacks."""
+    import threading
+    import time
+    from src.qmp.profiling import SamplingProfiler
+
+    def busy_loop(stop):
+        while not stop.is_set():
+            sum(range(1000))
+
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+    worker.start()
+    profiler = SamplingProfiler(interval=0.001)
+    assert profiler.toggle() is True
+    time.sleep(0.2)
+    assert profiler.toggle() is False
+    stop.set()
+    worker.join()
+
+    assert profiler.samples > 0
+    lines = profiler.collapsed().splitlines()
+    assert any(line.startswith("busy;") and "busy_loop" in line for line in lines)
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+    path = profiler.dump(str(tmp_path / "profile.folded"))
+    assert open(path).read() == profiler.collapsed()
+
+def pid_service():
+    """Service answering every "whoami" with its process id (for listener processes)."""
+    import os
+    service = QMPService(f"listener_{os.getpid()}")
+
+    async def whoami(message, writer):
+        await service.send(service.create_message({"pid": os.getpid()}, "whoami"), writer)
+
+    service.register_handler("whoami", whoami)
+    return service
+
+def test_parse_address():
+    """Addresses select TCP or Unix socket transports."""
+    from src.qmp.transports import parse_address
+    assert parse_address("tcp://10.0.0.1:7000") == {"host": "10.0.0.1", "port": 7000}
+    assert parse_address("[::1]:7000") == {"host": "::1", "port": 7000}
+    assert parse_address("unix:///run/qmp.sock") == {"path": "/run/qmp.sock"}
+    with pytest.raises(ValueError):
+        parse_address("no-port")
+
+@pytest.mark.asyncio
+async def test_unix_socket_transport(tmp_path):
+    """Services listen and connect over Unix domain sockets."""
+    import os
+    path = str(tmp_path / "qmp.sock")
+    server = pid_service()
+    assert await server.start(path=path) == path
+    client = QMPService("client")
+    replies = asyncio.Queue()
+
+    async def on_reply(message, writer):
+        await replies.put(message.content["pid"])
+
+    client.register_handler("whoami", on_reply)
+    writer = await client.connect(path=path)
+    try:
+        await client.send(client.create_message({}, "whoami"), writer)
+        assert await asyncio.wait_for(replies.get(), 5) == os.getpid()
+    finally:
+        await client.stop()
+        await server.stop()
+    assert not os.path.exists(path)
+
+@pytest.mark.asyncio
+async def test_reuse_port_group_spreads_connections():
+    """Connections to a SO_REUSEPORT group land on more than one process."""
+    from src.qmp.transports import ReusePortGroup
+    group = ReusePortGroup(pid_service, processes=2)
+    port = await asyncio.get_running_loop().run_in_executor(None, group.start)
+    client = QMPService("client")
+    replies = asyncio.Queue()
+
+    async def on_reply(message, writer):
+        await replies.put(message.content["pid"])
+
+    client.register_handler("whoami", on_reply)
+    try:
+        for _ in range(20):
+            writer = await client.connect("127.0.0.1", port)
+            await client.send(client.create_message({}, "whoami"), writer)
+        pids = {await asyncio.wait_for(replies.get(), 10) for _ in range(20)}
+        assert pids == set(group.pids)
+    finally:
+        await client.stop()
+        group.stop()
+
+def _offer(guard, frame):
+    """Check a frame and remember it if accepted, as QMPService does."""
+    dropped = guard.seen_frame(frame)
+    if dropped is None:
+        guard.remember(frame)
+    return dropped
+
+def test_replay_guard_windows():
+    """Duplicates are caught for at least one window; stale timestamps are rejected."""
+    from src.qmp.dedup import ReplayGuard
+    now = [1000.0]
+    guard = ReplayGuard(window=10, max_skew=5, clock=lambda: now[0])
+
+    assert _offer(guard, b"frame-1") is None
+    assert _offer(guard, b"frame-1") == "duplicate"
+    now[0] += 10  # rotate: frame-1 moves to the previous generation
+    assert _offer(guard, b"frame-1") == "duplicate"
+    assert _offer(guard, b"frame-2") is None
+    now[0] += 10  # rotate again: frame-1 is forgotten
+    assert _offer(guard, b"frame-1") is None
+
+    # Frames that are checked but never remembered, e.g. stale ones, are not duplicates
+    assert guard.seen_frame(b"frame-3") is None
+    assert guard.seen_frame(b"frame-3") is None
+
+    assert guard.fresh(now[0] - 4)
+    assert not guard.fresh(now[0] - 6)
+    assert not guard.fresh(now[0] + 6)
+    assert guard.stats == {"accepted": 1, "duplicate": 2, "stale": 2, "overflow": 0}
+    with pytest.raises(ValueError):
+        ReplayGuard(window=60, max_skew=31)
+
+def test_replay_guard_remembers_frames_while_fresh():
+    """A frame stays remembered for as long as its timestamp is fresh."""
+    from src.qmp.dedup import ReplayGuard
+    now = [0.0]
+    guard = ReplayGuard(window=60, max_skew=30, clock=lambda: now[0])
+
+    # Accepted late in a window with a timestamp ahead of the local clock
+    now[0] = 59.9
+    assert guard.fresh(89.0) and _offer(guard, b"frame") is None
+    # Replayed as late as it is still fresh: remembered
+    now[0] = 119.0
+    assert guard.fresh(89.0) and _offer(guard, b"frame") == "duplicate"
+    now[0] = 119.5
+    assert not guard.fresh(89.0)
+
+def test_replay_guard_full_window_drops_instead_of_forgetting():
+    """A window at capacity drops new frames but still remembers its old ones."""
+    from src.qmp.dedup import ReplayGuard
+    now = [1000.0]
+    guard = ReplayGuard(window=10, max_skew=5, capacity=100, clock=lambda: now[0])
+
+    frames = [f"frame-{i}".encode() for i in range(300)]
+    assert [_offer(guard, frame) for frame in frames[:100]] == [None] * 100
+    assert all(_offer(guard, frame) == "overflow" for frame in frames[100:])
+    assert guard.stats["overflow"] == 200
+    # Nothing accepted in this window has been forgotten
+    assert all(_offer(guard, frame) == "duplicate" for frame in frames[:100])
+
+    now[0] += 10
+    assert _offer(guard, frames[0]) == "duplicate"
+    assert _offer(guard, frames[150]) is None
+
+@pytest.mark.asyncio
+async def test_service_drops_duplicates_and_replays():
+    """A guarded service handles each message once and ignores stale ones."""
+    import json
+    import time
+    from src.qmp.dedup import ReplayGuard
+
+    service = QMPService("guarded", replay_guard=ReplayGuard())
+    handled = []
+
+    async def record(message, writer):
+        handled.append(message.content["n"])
+
+    service.register_handler("count", record)
+    host, port = (await service.start("127.0.0.1", 0))[:2]
+    reader, writer = await asyncio.open_connection(host, port)
+
+    def frame(n, timestamp):
+        message = QMPMessage({"n": n}, "sender", "count", timestamp)
+        data = json.dumps(message.to_dict()).encode()
+        return len(data).to_bytes(4, "big") + data
+
+    try:
+        now = time.time()
+        writer.write(frame(1, now) + frame(1, now) + frame(2, now) + frame(3, now - 3600) + frame(4, now))
+        await writer.drain()
+        for _ in range(50):
+            if 4 in handled:
+                break
+            await asyncio.sleep(0.02)
+        assert handled == [1, 2, 4]
+        assert service.replay_guard.stats["duplicate"] == 1
+        assert service.replay_guard.stats["stale"] == 1
+        # Stale frames use up no capacity
+        assert service.replay_guard.current.count == 3
+    finally:
+        writer.close()
+        await service.stop()
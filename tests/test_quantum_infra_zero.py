@@ -0,0 +1,149 @@
+"""Tests for the node runtime and the quantum-node CLI."""
+
+import asyncio
+import json
+import subprocess
+import sys
+import numpy as np
+import pytest
+from pathlib import Path
+from src.qmp import QMPMessage
+from src.quantum_infra_zero import NodeConfig, NodeRuntime
+from src.quantum_infra_zero.cli import config_from_args, build_parser, parse_importtime
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+class ConstantModel:
+    """Model factory target for the ai component."""
+
+    def __init__(self):
+        self.weights = {"w": np.ones(3)}
+
+    def get_weights(self):
+        return self.weights
+
+    def set_weights(self, weights):
+        self.weights = weights
+
+def frame(message: QMPMessage) -> bytes:
+    data = json.dumps(message.to_dict()).encode()
+    return len(data).to_bytes(4, "big") + data
+
+def test_config_loading(tmp_path):
+    """Config files load, flags override them and unknown keys are rejected."""
+    path = tmp_path / "node.json"
+    path.write_text(json.dumps({"node_id": "from-file", "port": 7000, "peers": ["10.0.0.1:7000"]}))
+    args = build_parser().parse_args(["--config", str(path), "--port", "7100",
+                                      "--peer", "10.0.0.2:7000", "--no-didn"])
+    config = config_from_args(args)
+    assert config.node_id == "from-file"
+    assert config.port == 7100
+    assert config.peers == ["10.0.0.1:7000", "10.0.0.2:7000"]
+    assert config.didn is False
+
+    with pytest.raises(ValueError):
+        NodeConfig.from_dict({"node_id": "x", "prot": 1})
+
+def test_relay_node_skips_heavy_imports():
+    """A relay-only node starts without importing numpy or the CI/CD runner."""
+    code = (
+        "import asyncio, sys\n"
+        "from src.quantum_infra_zero import NodeConfig, NodeRuntime\n"
+        "runtime = NodeRuntime(NodeConfig(didn=False, relay=['chat']))\n"
+        "async def run():\n"
+        "    await runtime.start()\n"
+        "    await runtime.stop()\n"
+        "asyncio.run(run())\n"
+        "print(sorted(m for m in ('numpy', 'src.ai_nodes', 'src.self_contained_cicd', 'src.didn')"
+        " if m in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+@pytest.mark.asyncio
+async def test_runtime_relays_and_applies_model_updates():
+    """Relay nodes forward messages once; ai nodes store received updates."""
+    ai = NodeRuntime(NodeConfig(node_id="ai", ai={"model": f"{__name__}:ConstantModel"}))
+    await ai.start()
+    assert ai.identity_id in ai.didn.identities
+    relay = NodeRuntime(NodeConfig(node_id="relay", didn=False, relay=["model_update"],
+                                   peers=[f"{ai.address[0]}:{ai.address[1]}"]))
+    await relay.start()
+
+    reader, writer = await asyncio.open_connection(*relay.address)
+    message = QMPMessage(
+        content={"node_id": "peer", "update": {
+            "weights": {"w": [1.0, 2.0, 3.0]}, "samples_count": 10, "timestamp": 1.0}},
+        sender_id="peer", message_type="model_update", timestamp=1.0
+    )
+    try:
+        # The duplicate is not forwarded a second time
+        writer.write(frame(message) * 2)
+        await writer.drain()
+        for _ in range(50):
+            if "peer" in ai.ai_node.updates:
+                break
+            await asyncio.sleep(0.02)
+        update = ai.ai_node.updates["peer"]
+        assert np.array_equal(update.weights["w"], [1.0, 2.0, 3.0])
+        assert update.samples_count == 10
+        assert relay.qmp.handler_timer.stats["model_update"].count == 2
+        await asyncio.sleep(0.05)
+        assert ai.qmp.handler_timer.stats["model_update"].count == 1
+    finally:
+        writer.close()
+        await relay.stop()
+        await ai.stop()
+
+def test_profile_startup_report():
+    """--profile-startup reports import times of a real startup."""
+    result = subprocess.run(
+        [sys.executable, "-m", "src.quantum_infra_zero.cli", "--no-didn", "--profile-startup"],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    assert "Startup (process start to exit)" in result.stdout
+    assert "src.quantum_infra_zero.runtime" in result.stdout
+
+    parsed = parse_importtime(
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        340 |   src.qmp\n"
+    )
+    assert parsed == [("src.qmp", 120, 340)]
+
+@pytest.mark.asyncio
+async def test_runtime_over_unix_sockets(tmp_path):
+    """Nodes listen on and connect to Unix socket peers."""
+    path = str(tmp_path / "ai.sock")
+    listener = NodeRuntime(NodeConfig(node_id="listener", didn=False, path=path))
+    assert await listener.start() == path
+    dialer = NodeRuntime(NodeConfig(node_id="dialer", didn=False, peers=[f"unix://{path}"]))
+    await dialer.start()
+    try:
+        for _ in range(50):
+            if listener.qmp.connections:
+                break
+            await asyncio.sleep(0.02)
+        assert len(listener.qmp.connections) == 1
+    finally:
+        await dialer.stop()
+        await listener.stop()
+
+def test_console_script_entry_point(tmp_path):
+    """The quantum-node script target imports and runs like an installed script."""
+    tomllib = pytest.importorskip("tomllib")
+    with open(REPO_ROOT / "pyproject.toml", "rb") as f:
+        target = tomllib.load(f)["project"]["scripts"]["quantum-node"]
+    module, _, attr = target.partition(":")
+    # What the generated script does, from outside the checkout
+    code = (
+        "import sys\n"
+        f"from {module} import {attr}\n"
+        f"sys.exit({attr}(['--node-id', 'script', '--port', '0', '--no-didn', '--exit-after-start']))\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", code], cwd=tmp_path, capture_output=True, text=True,
+        env={"PYTHONPATH": str(REPO_ROOT), "PATH": ""}, timeout=60
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert "Node script started on" in proc.stdout
@@ -0,0 +1,824 @@
+"""Tests for the Self-Contained CI/CD component."""
+
+import asyncio
+import hashlib
+import json
+import multiprocessing.forkserver
+import os
+import shutil
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+import pytest
+from src.self_contained_cicd import SelfContainedCICD
+from src.self_contained_cicd import artifacts, changes, checksum
+from src.self_contained_cicd.artifacts import clone_file
+from src.self_contained_cicd.cache import StepCache
+from src.self_contained_cicd.changes import ChangeDetector, FileManifest, path_matches
+from src.self_contained_cicd.checksum import ChecksumCache, file_sha256
+from src.self_contained_cicd.dag import build_graph, critical_path, run_dag
+from src.self_contained_cicd.distributed import QMPMessage, encode_message, read_message
+from src.self_contained_cicd.sharding import TestTimings, plan_shards
+from src.self_contained_cicd.streaming import OutputCapture, RotatingLog
+from src.self_contained_cicd.tracing import RunRecorder, chrome_trace, compare_runs, load_run, otlp_spans
+from src.self_contained_cicd.workers import ScriptWorkerPool
+
+PYTHON = sys.executable
+REPO_ROOT = Path(__file__).parent.parent
+
+@pytest.fixture
+def cicd(tmp_path):
+    """Fixture providing a SelfContainedCICD instance in a temp project."""
+    return SelfContainedCICD(str(tmp_path))
+
+def sleep_step(name, seconds, needs=None, marker=None):
+    """Build a command step that sleeps and optionally touches a marker file."""
+    code = f"import time, pathlib; time.sleep({seconds})"
+    if marker:
+        code += f"; pathlib.Path({marker!r}).touch()"
+    step = {"name": name, "command": f'"{PYTHON}" -c "{code}"'}
+    if needs is not None:
+        step["needs"] = needs
+    return step
+
+def test_build_graph_defaults_to_sequential():
+    """Test that stages without needs keep their original order."""
+    graph = build_graph([{"name": "a"}, {"name": "b"}, {"name": "c"}])
+    assert graph == {"a": [], "b": ["a"], "c": ["b"]}
+
+def test_build_graph_validation():
+    """Test that unknown dependencies, duplicates and cycles are rejected."""
+    with pytest.raises(ValueError):
+        build_graph([{"name": "a", "needs": ["missing"]}])
+    with pytest.raises(ValueError):
+        build_graph([{"name": "a"}, {"name": "a"}])
+    with pytest.raises(ValueError):
+        build_graph([{"name": "a", "needs": ["b"]}, {"name": "b", "needs": ["a"]}])
+
+@pytest.mark.asyncio
+async def test_run_dag_respects_dependencies():
+    """Test that steps start only after their dependencies finish."""
+    order = []
+
+    async def run_step(step):
+        order.append(("start", step["name"]))
+        await asyncio.sleep(step["delay"])
+        order.append(("end", step["name"]))
+        return True
+
+    steps = [
+        {"name": "compile", "delay": 0.02},
+        {"name": "lint", "delay": 0.01, "needs": []},
+        {"name": "package", "delay": 0.01, "needs": ["compile", "lint"]},
+    ]
+    results = await run_dag(steps, run_step, max_parallel=4)
+
+    assert all(r.success for r in results.values())
+    assert order.index(("start", "package")) > order.index(("end", "compile"))
+    assert order.index(("start", "lint")) < order.index(("end", "compile"))
+    assert critical_path(build_graph(steps), results) == ["compile", "package"]
+
+@pytest.mark.asyncio
+async def test_independent_steps_run_in_parallel(cicd):
+    """Test that independent steps overlap up to max_parallel."""
+    cicd.config = {
+        "max_parallel": 4,
+        "build_steps": [sleep_step(f"s{i}", 0.5, needs=[]) for i in range(4)],
+    }
+
+    started = time.monotonic()
+    assert await cicd.run_build()
+    assert time.monotonic() - started < 1.5
+    assert all(r.success for r in cicd.step_results["build"].values())
+
+@pytest.mark.asyncio
+async def test_failure_cancels_running_and_dependent_steps(cicd, tmp_path):
+    """Test fail-fast behaviour of the DAG runner."""
+    marker = tmp_path / "slow_finished"
+    cicd.config = {
+        "max_parallel": 4,
+        "build_steps": [
+            {"name": "broken", "command": f'"{PYTHON}" -c "import sys; sys.exit(3)"', "needs": []},
+            sleep_step("slow", 1, needs=[], marker=str(marker)),
+            sleep_step("after", 0, needs=["broken"]),
+        ],
+    }
+
+    assert not await cicd.run_build()
+    results = cicd.step_results["build"]
+    assert results["broken"].status == "failed"
+    assert results["slow"].status == "cancelled"
+    assert results["after"].status == "skipped"
+
+    await asyncio.sleep(1.2)
+    assert not marker.exists()
+
+@pytest.mark.asyncio
+async def test_unnamed_steps_use_dag_names(cicd):
+    """Test that unnamed steps are named step-{i} in results, logs and records."""
+    cicd.config = {
+        "build_steps": [
+            {"command": f'"{PYTHON}" -c "print(1)"'},
+            {"command": f'"{PYTHON}" -c "print(2)"'},
+        ],
+    }
+
+    assert await cicd.run_build()
+    assert list(cicd.step_results["build"]) == ["step-0", "step-1"]
+    assert [record.name for record in cicd.run_recorder.steps] == ["step-0", "step-1"]
+    assert set(cicd.step_logs) == {"step-0", "step-1"}
+    assert cicd.step_logs["step-0"] != cicd.step_logs["step-1"]
+
+def cached_step(tmp_path, counter):
+    """Build a cacheable step that counts its runs and writes an output."""
+    code = (
+        "import pathlib; "
+        f"c = pathlib.Path({str(counter)!r}); "
+        "c.write_text(str(int(c.read_text() or 0) + 1) if c.exists() else '1'); "
+        "pathlib.Path('out').mkdir(exist_ok=True); "
+        "pathlib.Path('out/result.txt').write_text(pathlib.Path('src.txt').read_text().upper())"
+    )
+    return {
+        "name": "transform",
+        "command": f'"{PYTHON}" -c "{code}"',
+        "inputs": ["*.txt"],
+        "outputs": ["out"],
+        "env": ["CICD_TEST_FLAVOUR"],
+    }
+
+@pytest.mark.asyncio
+async def test_step_cache_restores_outputs(cicd, tmp_path, monkeypatch):
+    """Test that unchanged inputs restore outputs instead of re-running."""
+    counter = tmp_path / "runs.count"
+    (tmp_path / "src.txt").write_text("hello")
+    cicd.config = {"build_steps": [cached_step(tmp_path, counter)]}
+    
+    assert await cicd.run_build()
+    assert counter.read_text() == "1"
+    
+    (tmp_path / "out" / "result.txt").unlink()
+    assert await cicd.run_build()
+    assert counter.read_text() == "1"
+    assert (tmp_path / "out" / "result.txt").read_text() == "HELLO"
+    assert cicd.step_cache.stats["hits"] == 1
+    
+    # Changing an input or a selected env var invalidates the key
+    (tmp_path / "src.txt").write_text("bye")
+    assert await cicd.run_build()
+    assert counter.read_text() == "2"
+    assert (tmp_path / "out" / "result.txt").read_text() == "BYE"
+    
+    monkeypatch.setenv("CICD_TEST_FLAVOUR", "other")
+    assert await cicd.run_build()
+    assert counter.read_text() == "3"
+    assert cicd.step_cache.stats["misses"] == 3
+
+def test_step_cache_lru_eviction(tmp_path):
+    """Test that the least recently used entries are evicted first."""
+    cache = StepCache(tmp_path / "cache", max_bytes=250)
+    project = tmp_path / "project"
+    project.mkdir()
+    
+    for i, key in enumerate(["k1", "k2", "k3"]):
+        (project / "out.bin").write_bytes(bytes([i]) * 100)
+        cache.store(key, project, ["out.bin"])
+        os.utime(cache._entry_path(key), (1000 + i, 1000 + i))
+    
+    assert cache.stats["evictions"] == 1
+    assert not cache.restore("k1", project)
+    assert cache.restore("k2", project)
+    assert (project / "out.bin").read_bytes() == bytes([1]) * 100
+    assert cache.size() <= 250
+    assert "1 hits, 1 misses" in cache.summary()
+
+def test_step_cache_eviction_spares_in_flight_objects(tmp_path):
+    """Test that garbage collection leaves temp files and pinned objects alone."""
+    cache = StepCache(tmp_path / "cache", max_bytes=150)
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "out.bin").write_bytes(b"a" * 100)
+    cache.store("k1", project, ["out.bin"])
+    
+    tmp = cache.objects_dir / "ab" / ".abcd.1.2.tmp"
+    tmp.parent.mkdir(parents=True, exist_ok=True)
+    tmp.write_bytes(b"partial")
+    cache._pinned["f" * 64] += 1
+    pinned = cache._object_path("f" * 64)
+    pinned.parent.mkdir(parents=True, exist_ok=True)
+    pinned.write_bytes(b"b" * 10)
+    
+    (project / "out.bin").write_bytes(b"c" * 100)
+    cache.store("k2", project, ["out.bin"])
+    
+    assert cache.stats["evictions"] == 1
+    assert tmp.exists() and pinned.exists()
+    assert cache.size() == 110
+
+def test_step_cache_parallel_stores(tmp_path):
+    """Test that concurrent stores with eviction all succeed."""
+    from concurrent.futures import ThreadPoolExecutor
+    cache = StepCache(tmp_path / "cache", max_bytes=1000)
+    
+    def store(i):
+        project = tmp_path / f"project{i}"
+        project.mkdir()
+        (project / "out.bin").write_bytes(bytes([i % 7]) * 300)
+        cache.store(f"k{i}", project, ["out.bin"])
+    
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(store, range(40)))
+    
+    assert cache.stats["stores"] == 40
+    assert cache.size() <= 1000
+    assert cache.size() == sum(
+        p.stat().st_size for p in cache.objects_dir.rglob("*") if p.is_file()
+    )
+
+def test_file_sha256_matches_hashlib(tmp_path, monkeypatch):
+    """Test the buffered and mmap hashing paths against hashlib."""
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    path = tmp_path / "blob.bin"
+    path.write_bytes(data)
+    expected = hashlib.sha256(data).hexdigest()
+    
+    assert file_sha256(path) == expected
+    monkeypatch.setattr(checksum, "MMAP_THRESHOLD", 1024)
+    assert file_sha256(path) == expected
+
+def test_checksum_cache_skips_unchanged_files(tmp_path):
+    """Test that digests are reused until size, mtime or inode change."""
+    cache = ChecksumCache(tmp_path / "checksums.json")
+    paths = []
+    for i in range(8):
+        path = tmp_path / f"artifact{i}.bin"
+        path.write_bytes(os.urandom(1000 + i))
+        paths.append(path)
+    
+    digests = cache.digest_many(paths)
+    assert digests[paths[3]] == hashlib.sha256(paths[3].read_bytes()).hexdigest()
+    assert cache.stats == {"hits": 0, "misses": 8}
+    cache.save()
+    
+    reloaded = ChecksumCache(tmp_path / "checksums.json")
+    assert reloaded.digest_many(paths) == digests
+    assert reloaded.stats == {"hits": 8, "misses": 0}
+    # Warm lookups never start hashing threads
+    assert reloaded._pool is None
+    
+    paths[0].write_bytes(b"changed")
+    assert reloaded.digest(paths[0]) == hashlib.sha256(b"changed").hexdigest()
+    assert reloaded.stats["misses"] == 1
+
+    # Only changed files are hashed, on one pool reused across calls
+    for path in paths[2:4]:
+        path.write_bytes(os.urandom(10))
+    reloaded.digest_many(paths)
+    pool = reloaded._pool
+    assert reloaded.stats == {"hits": 14, "misses": 3}
+    paths[4].write_bytes(b"a")
+    paths[5].write_bytes(b"b")
+    assert list(reloaded.digest_many(paths)) == paths
+    assert reloaded._pool is pool
+    reloaded.close()
+    cache.close()
+
+def test_calculate_checksum_uses_cache(cicd, tmp_path):
+    """Test that SelfContainedCICD hashes through its checksum cache."""
+    path = tmp_path / "file.txt"
+    path.write_text("data")
+    
+    assert cicd._calculate_checksum(path) == hashlib.sha256(b"data").hexdigest()
+    cicd._calculate_checksum(path)
+    assert cicd.checksums.stats == {"hits": 1, "misses": 1}
+
+def test_create_artifact_deduplicates(cicd, tmp_path):
+    """Test that identical artifacts share one object in the store."""
+    data = os.urandom(50_000)
+    first = tmp_path / "first.bin"
+    second = tmp_path / "second.bin"
+    first.write_bytes(data)
+    second.write_bytes(data)
+    
+    a = cicd.create_artifact(str(first), "build-1.bin", {"build": 1})
+    b = cicd.create_artifact(str(second), "build-2.bin", {"build": 2})
+    
+    assert a.checksum == b.checksum == hashlib.sha256(data).hexdigest()
+    assert a.size == len(data)
+    assert Path(a.path).read_bytes() == data
+    assert cicd.artifact_store.stats == {"stored": 1, "deduplicated": 1}
+    assert len([p for p in (cicd.artifacts_dir / ".store").rglob("*") if p.is_file()]) == 1
+    
+    meta = json.loads((cicd.artifacts_dir / "build-2.bin.meta.json").read_text())
+    assert meta["checksum"] == b.checksum
+    assert meta["metadata"] == {"build": 2}
+    
+    # Rewriting the source in place must not alter the stored artifact
+    with open(first, "r+b") as f:
+        f.write(b"corrupt")
+    assert Path(a.path).read_bytes() == data
+
+def test_clone_file_fallbacks(tmp_path, monkeypatch):
+    """Test every placement mechanism down to the hashing copy."""
+    data = os.urandom(10_000)
+    source = tmp_path / "src.bin"
+    source.write_bytes(data)
+    
+    method, _ = clone_file(source, tmp_path / "linked.bin")
+    assert method in ("reflink", "hardlink")
+    assert (tmp_path / "linked.bin").read_bytes() == data
+    
+    monkeypatch.setattr(artifacts, "_reflink", lambda src, dst: False)
+    method, digest = clone_file(source, tmp_path / "kernel.bin", allow_hardlink=False)
+    assert method in ("copy_file_range", "sendfile", "copy")
+    assert (tmp_path / "kernel.bin").read_bytes() == data
+    
+    monkeypatch.setattr(artifacts, "_kernel_copy", lambda src, dst, size: None)
+    method, digest = clone_file(source, tmp_path / "copied.bin", allow_hardlink=False)
+    assert method == "copy"
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert (tmp_path / "copied.bin").read_bytes() == data
+
+@pytest.mark.asyncio
+async def test_step_output_is_streamed_to_logs(cicd, tmp_path):
+    """Test streaming capture with log files, callback and bounded tail."""
+    seen = []
+    cicd.output_callback = lambda step, stream, line: seen.append((stream, line))
+    code = "import sys; [print(i) for i in range(5000)]; print('boom', file=sys.stderr); sys.exit(1)"
+    cicd.config = {
+        "logs": {"tail_lines": 10},
+        "build_steps": [{"name": "noisy step", "command": f'"{PYTHON}" -c "{code}"'}],
+    }
+    
+    assert not await cicd.run_build()
+    
+    log_path = cicd.step_logs["noisy step"]
+    assert log_path == tmp_path / "build" / "logs" / "build" / "noisy_step.log"
+    content = log_path.read_text()
+    assert "4999" in content and "boom" in content
+    assert ("stdout", "0") in seen and ("stderr", "boom") in seen
+    assert len([s for s in seen if s[0] == "stdout"]) == 5000
+
+@pytest.mark.asyncio
+async def test_output_capture_tail_rotation_and_iteration(tmp_path):
+    """Test the bounded tail, log rotation and async line iteration."""
+    capture = OutputCapture("step", tmp_path, tail_lines=3)
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"".join(b"line %d\n" % i for i in range(50)) + b"no newline")
+    reader.feed_eof()
+    empty = asyncio.StreamReader()
+    empty.feed_eof()
+    
+    lines = capture.lines()
+    consumed = []
+    
+    async def consume():
+        async for item in lines:
+            consumed.append(item)
+    
+    consumer = asyncio.ensure_future(consume())
+    await capture.capture(reader, empty)
+    await consumer
+    capture.close()
+    
+    assert capture.tail("stdout") == "line 48\nline 49\nno newline"
+    assert len(consumed) == 51
+    assert consumed[0] == ("stdout", "line 0")
+    
+    log = RotatingLog(tmp_path / "rotating.log", max_bytes=100, backup_count=2)
+    for i in range(50):
+        log.write(b"line %d\n" % i)
+    # Written chunks reach the file before it is closed
+    assert (tmp_path / "rotating.log").read_bytes().endswith(b"line 49\n")
+    log.close()
+    assert (tmp_path / "rotating.log.1").exists() and (tmp_path / "rotating.log.2").exists()
+    assert not (tmp_path / "rotating.log.3").exists()
+    assert (tmp_path / "rotating.log").stat().st_size <= 100
+
+def test_path_matches():
+    """Test directory prefixes and globs in step path filters."""
+    assert path_matches("src/app/main.py", ["src"])
+    assert path_matches("src/app/main.py", ["src/"])
+    assert not path_matches("srcs/main.py", ["src"])
+    assert path_matches("src/app/main.py", ["src/**/*.py"])
+    assert path_matches("src/main.py", ["src/**/*.py"])
+    assert not path_matches("src/app/main.txt", ["src/**/*.py"])
+    assert not path_matches("src/app/main.py", ["src/*.py"])
+    assert path_matches("README.md", ["docs", "*.md"])
+    assert path_matches(".cicd/config.json", ["./.cicd/config.json"])
+    assert path_matches(".github/workflows/ci.yml", ["./.github"])
+
+def test_manifest_rehashes_only_touched_files(tmp_path, monkeypatch):
+    """Test that a rescan hashes only files whose size or mtime changed."""
+    for i in range(5):
+        (tmp_path / "pkg" / f"d{i}").mkdir(parents=True)
+        (tmp_path / "pkg" / f"d{i}" / "f.txt").write_text(str(i))
+    (tmp_path / "skip").mkdir()
+    (tmp_path / "skip" / "ignored.txt").write_text("x")
+
+    manifest = FileManifest(tmp_path, exclude=["skip"])
+    first = manifest.scan()
+    assert set(first) == {f"pkg/d{i}/f.txt" for i in range(5)}
+
+    hashed = []
+    monkeypatch.setattr(changes, "file_sha256", lambda p: hashed.append(p) or file_sha256(p))
+    (tmp_path / "pkg" / "d3" / "f.txt").write_text("changed")
+    (tmp_path / "pkg" / "new.txt").write_text("new")
+    (tmp_path / "pkg" / "d0" / "f.txt").unlink()
+    second = manifest.scan(first)
+
+    assert len(hashed) == 2
+    assert FileManifest.diff(first, second) == {"pkg/d0/f.txt", "pkg/d3/f.txt", "pkg/new.txt"}
+
+def incremental_config(tmp_path):
+    """Two build steps filtered on different parts of the tree."""
+    def step(name, paths):
+        marker = tmp_path / "build" / f"{name}.runs"
+        code = f"import pathlib; p = pathlib.Path({str(marker)!r}); p.write_text(p.read_text() + 'x' if p.exists() else 'x')"
+        return {"name": name, "command": f'"{PYTHON}" -c "{code}"', "paths": paths}
+    return {"build_steps": [step("code", ["src/**/*.py"]), step("docs", ["docs"])]}
+
+def runs(tmp_path, name):
+    marker = tmp_path / "build" / f"{name}.runs"
+    return len(marker.read_text()) if marker.exists() else 0
+
+@pytest.mark.asyncio
+async def test_pipeline_skips_steps_without_changes(cicd, tmp_path):
+    """Test that only steps whose paths changed run again."""
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "app.py").write_text("print(1)")
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "index.md").write_text("# Docs")
+    cicd.config = incremental_config(tmp_path)
+    cicd.config["incremental"] = {"strategy": "manifest"}
+
+    assert await cicd.run_pipeline()
+    assert (runs(tmp_path, "code"), runs(tmp_path, "docs")) == (1, 1)
+
+    # Nothing changed; step markers under build/ don't count
+    assert await cicd.run_pipeline()
+    assert (runs(tmp_path, "code"), runs(tmp_path, "docs")) == (1, 1)
+
+    (tmp_path / "docs" / "index.md").write_text("# More docs")
+    assert await cicd.run_pipeline()
+    assert (runs(tmp_path, "code"), runs(tmp_path, "docs")) == (1, 2)
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not available")
+async def test_pipeline_uses_git_diff(cicd, tmp_path):
+    """Test change detection against the last successful commit."""
+    def git(*args):
+        subprocess.run(["git", *args], cwd=tmp_path, check=True, capture_output=True)
+
+    git("init", "-q")
+    git("config", "user.email", "ci@example.com")
+    git("config", "user.name", "CI")
+    (tmp_path / ".gitignore").write_text("build/\nartifacts/\n")
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "app.py").write_text("print(1)")
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "index.md").write_text("# Docs")
+    git("add", ".")
+    git("commit", "-q", "-m", "initial")
+    cicd.config = incremental_config(tmp_path)
+
+    assert await cicd.run_pipeline()
+    assert await cicd.run_pipeline()
+    assert (runs(tmp_path, "code"), runs(tmp_path, "docs")) == (1, 1)
+
+    (tmp_path / "src" / "app.py").write_text("print(2)")
+    git("commit", "-q", "-am", "change code")
+    assert await cicd.run_pipeline()
+    assert (runs(tmp_path, "code"), runs(tmp_path, "docs")) == (2, 1)
+
+    detector = ChangeDetector(tmp_path, tmp_path / "build" / "incremental", exclude=["build"])
+    assert detector.detect() == set()
+
+    # An uncommitted edit is built once, and building it again is skipped
+    (tmp_path / "src" / "app.py").write_text("print(3)")
+    assert await cicd.run_pipeline()
+    assert await cicd.run_pipeline()
+    assert (runs(tmp_path, "code"), runs(tmp_path, "docs")) == (3, 1)
+
+    # Reverting it matches the commit again, but not what was last built
+    (tmp_path / "src" / "app.py").write_text("print(2)")
+    assert await cicd.run_pipeline()
+    assert (runs(tmp_path, "code"), runs(tmp_path, "docs")) == (4, 1)
+
+async def start_worker(address, workspace, worker_id):
+    """Launch a step worker process connected to the coordinator."""
+    return await asyncio.create_subprocess_exec(
+        PYTHON, "-m", "src.self_contained_cicd.distributed",
+        "--connect", f"{address[0]}:{address[1]}", "--workspace", str(workspace),
+        "--id", worker_id, "--heartbeat", "0.2",
+        cwd=REPO_ROOT, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+    )
+
+def transform_step(name, seconds=0.0):
+    """A step that reads an input file and writes an output next to it."""
+    code = (
+        f"import pathlib, time; time.sleep({seconds}); "
+        f"pathlib.Path('out').mkdir(exist_ok=True); "
+        f"pathlib.Path('out/{name}.txt').write_text(pathlib.Path('src/{name}.txt').read_text().upper())"
+    )
+    return {
+        "name": name, "needs": [], "command": f'"{PYTHON}" -c "{code}"',
+        "inputs": [f"src/{name}.txt"], "outputs": [f"out/{name}.txt"], "cache": False,
+    }
+
+@pytest.mark.asyncio
+async def test_steps_run_on_worker_processes(cicd, tmp_path):
+    """Test dispatch to several workers with input and output transfer."""
+    (tmp_path / "src").mkdir()
+    names = [f"s{i}" for i in range(6)]
+    for name in names:
+        (tmp_path / "src" / f"{name}.txt").write_text(f"data {name}")
+    cicd.config = {"build_steps": [transform_step(name, 0.3) for name in names]}
+
+    address = await cicd.start_coordinator()
+    workers = [await start_worker(address, tmp_path / f"w{i}", f"w{i}") for i in range(3)]
+    try:
+        await cicd.coordinator.wait_for_workers(3, timeout=30)
+        assert await cicd.run_build()
+        for name in names:
+            assert (tmp_path / "out" / f"{name}.txt").read_text() == f"DATA {name.upper()}"
+        summary = cicd.coordinator.summary()
+        assert sum(stats["steps"] for stats in summary.values()) == len(names)
+        assert len(summary) > 1
+        assert (tmp_path / "w0" / "src").exists() or (tmp_path / "w1" / "src").exists()
+    finally:
+        await cicd.stop_coordinator()
+        for worker in workers:
+            await asyncio.wait_for(worker.wait(), 10)
+
+@pytest.mark.asyncio
+async def test_step_is_retried_when_worker_dies(cicd, tmp_path):
+    """Test that a step running on a killed worker is rerun elsewhere."""
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "job.txt").write_text("retry me")
+    address = await cicd.start_coordinator()
+    workers = {f"w{i}": await start_worker(address, tmp_path / f"w{i}", f"w{i}") for i in range(2)}
+    try:
+        coordinator = cicd.coordinator
+        await coordinator.wait_for_workers(2, timeout=30)
+        task = asyncio.create_task(coordinator.submit(transform_step("job", 1.0)))
+        while not any(worker.running for worker in coordinator.workers.values()):
+            await asyncio.sleep(0.01)
+        busy = next(w for w in coordinator.workers.values() if w.running).worker_id
+        workers[busy].kill()
+
+        result = await asyncio.wait_for(task, 30)
+        assert result.success
+        assert result.attempts == 2
+        assert result.worker_id != busy
+        assert (tmp_path / "out" / "job.txt").read_text() == "RETRY ME"
+    finally:
+        await cicd.stop_coordinator()
+        for worker in workers.values():
+            await asyncio.wait_for(worker.wait(), 10)
+
+@pytest.mark.asyncio
+async def test_silent_worker_is_dropped_after_heartbeat_timeout(cicd, tmp_path):
+    """Test that a worker that stops heartbeating loses its steps."""
+    cicd.config["distributed"] = {"heartbeat_interval": 0.1, "heartbeat_timeout": 0.5}
+    address = await cicd.start_coordinator()
+    reader, writer = await asyncio.open_connection(*address[:2])
+    register = QMPMessage({"worker_id": "silent", "slots": 1}, "silent", "register", time.time())
+    writer.write(encode_message(register))
+    await writer.drain()
+    try:
+        coordinator = cicd.coordinator
+        await coordinator.wait_for_workers(1, timeout=10)
+        task = asyncio.create_task(coordinator.submit({"name": "echo", "command": "echo hi"}))
+        message = await asyncio.wait_for(read_message(reader), 10)
+        assert message.message_type == "run_step"
+
+        # Never answer: the coordinator should drop us and requeue the step
+        real = await start_worker(address, tmp_path / "real", "real")
+        result = await asyncio.wait_for(task, 30)
+        assert result.success
+        assert result.worker_id == "real"
+        assert "silent" not in coordinator.workers
+    finally:
+        writer.close()
+        await cicd.stop_coordinator()
+        await asyncio.wait_for(real.wait(), 10)
+
+@pytest.mark.asyncio
+async def test_duplicate_worker_registration_is_rejected(cicd, tmp_path):
+    """Test that a second connection cannot take over a live worker id."""
+    address = await cicd.start_coordinator()
+    first_reader, first = await asyncio.open_connection(*address[:2])
+    second_reader, second = await asyncio.open_connection(*address[:2])
+    register = QMPMessage({"worker_id": "w", "slots": 1}, "w", "register", time.time())
+    try:
+        coordinator = cicd.coordinator
+        first.write(encode_message(register))
+        await first.drain()
+        await coordinator.wait_for_workers(1, timeout=10)
+        task = asyncio.create_task(coordinator.submit({"name": "echo", "command": "echo hi"}))
+        job = await asyncio.wait_for(read_message(first_reader), 10)
+        
+        second.write(encode_message(register))
+        await second.drain()
+        rejected = await asyncio.wait_for(read_message(second_reader), 10)
+        assert rejected.message_type == "register_rejected"
+        assert not coordinator.workers["w"].writer.is_closing()
+        assert job.content["job_id"] in coordinator.workers["w"].running
+        
+        # The original connection still completes its step
+        result = QMPMessage({"job_id": job.content["job_id"], "returncode": 0}, "w", "result", time.time())
+        first.write(encode_message(result))
+        await first.drain()
+        assert (await asyncio.wait_for(task, 10)).success
+    finally:
+        first.close()
+        second.close()
+        await cicd.stop_coordinator()
+
+def test_plan_shards_balances_by_duration(tmp_path):
+    """Test longest-first balancing with historical and unknown durations."""
+    timings = TestTimings(tmp_path / "timings.json")
+    timings.update({"a": 8.0, "b": 5.0, "c": 4.0, "d": 3.0})
+    plan = plan_shards(["a", "b", "c", "d", "new"], 2, timings)
+    loads = [sum(timings.estimate(t) for t in shard) for shard in plan]
+    assert sorted(t for shard in plan for t in shard) == ["a", "b", "c", "d", "new"]
+    assert abs(loads[0] - loads[1]) <= 3.0
+
+    timings.update({"a": 2.0}, collected=["a", "b"])
+    assert timings.durations == {"a": 5.0, "b": 5.0}
+
+@pytest.mark.asyncio
+async def test_sharded_test_step(cicd, tmp_path):
+    """Test that shards run every test once, merge reports and record timings."""
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "tests" / "test_sample.py").write_text(
+        "import time\n"
+        + "".join(f"def test_{i}():\n    time.sleep({i / 100})\n" for i in range(6))
+    )
+    step = {"name": "Unit tests", "command": f'"{PYTHON}" -m pytest -q tests', "shards": 3}
+    cicd.config = {"test_steps": [step]}
+
+    assert await cicd.run_tests()
+    report = tmp_path / "build" / "reports" / "Unit_tests.xml"
+    cases = [case.get("name") for case in ET.parse(report).iter("testcase")]
+    assert sorted(cases) == [f"test_{i}" for i in range(6)]
+    durations = json.loads((tmp_path / "build" / "test_timings" / "Unit_tests.json").read_text())
+    assert len(durations) == 6
+    assert durations["tests/test_sample.py::test_5"] > durations["tests/test_sample.py::test_0"]
+
+    # A second sharded step over other tests keeps its own history
+    (tmp_path / "other").mkdir()
+    (tmp_path / "other" / "test_other.py").write_text("def test_x():\n    pass\n")
+    other = {"name": "Other tests", "command": f'"{PYTHON}" -m pytest -q other', "shards": 2}
+    cicd.config = {"test_steps": [step, other]}
+    assert await cicd.run_tests()
+    durations = json.loads((tmp_path / "build" / "test_timings" / "Unit_tests.json").read_text())
+    assert len(durations) == 6
+    cicd.config = {"test_steps": [step]}
+
+    # Commands that are not a bare pytest call are left intact
+    wrapped = {"name": "Wrapped tests", "shards": 2,
+               "command": f'cd other && "{PYTHON}" -m pytest -q . | tee out.log'}
+    cicd.config = {"test_steps": [wrapped]}
+    assert await cicd.run_tests()
+    report = tmp_path / "build" / "reports" / "Wrapped_tests.xml"
+    assert [case.get("name") for case in ET.parse(report).iter("testcase")] == ["test_x"]
+    assert "1 passed" in (tmp_path / "other" / "out.log").read_text()
+    cicd.config = {"test_steps": [step]}
+
+    (tmp_path / "tests" / "test_sample.py").write_text(
+        (tmp_path / "tests" / "test_sample.py").read_text() + "def test_fail():\n    assert False\n"
+    )
+    assert not await cicd.run_tests()
+
+@pytest.mark.asyncio
+async def test_pipeline_writes_run_record_and_traces(cicd, tmp_path):
+    """Test per-step timing, exit code, cache status and trace exports."""
+    (tmp_path / "src.txt").write_text("hello")
+    burn = f'"{PYTHON}" -c "sum(i * i for i in range(300000))"'
+    cicd.config = {
+        "build_steps": [cached_step(tmp_path, tmp_path / "counter"), {"name": "burn", "command": burn}],
+        "test_steps": [{"name": "fails", "command": f'"{PYTHON}" -c "raise SystemExit(3)"'}],
+        "tracing": {"formats": ["chrome", "otlp"]},
+    }
+
+    assert not await cicd.run_pipeline()
+    runs_dir = tmp_path / "build" / "runs"
+    first = load_run(runs_dir / f"{cicd.run_recorder.run_id}.json")
+    steps = {step["name"]: step for step in first["steps"]}
+    assert first["status"] == "failed"
+    assert steps["transform"]["cache"] == "miss"
+    assert steps["burn"]["exit_code"] == 0
+    assert steps["burn"]["cpu_user"] + steps["burn"]["cpu_system"] > 0
+    assert steps["burn"]["max_rss_kb"] > 0
+    assert steps["fails"]["status"] == "failed" and steps["fails"]["exit_code"] == 3
+    assert all(step["end"] >= step["start"] for step in first["steps"])
+
+    trace = json.loads((runs_dir / f"{cicd.run_recorder.run_id}.trace.json").read_text())
+    complete = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+    assert {e["name"] for e in complete} == {"pipeline", "transform", "burn", "fails"}
+    otlp = json.loads((runs_dir / f"{cicd.run_recorder.run_id}.otlp.json").read_text())
+    spans = otlp["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert len({span["traceId"] for span in spans}) == 1
+    assert sum(1 for span in spans if "parentSpanId" in span) == 3
+
+    cicd.config["test_steps"] = []
+    assert await cicd.run_pipeline()
+    second = cicd.run_recorder.to_dict()
+    assert {s["name"]: s["cache"] for s in second["steps"]}["transform"] == "hit"
+
+def test_run_records_are_pruned(tmp_path):
+    """Test that only the newest run records and their exports are kept."""
+    runs_dir = tmp_path / "runs"
+    ids = []
+    for _ in range(4):
+        recorder = RunRecorder(runs_dir)
+        recorder.finish("success")
+        recorder.save(["chrome", "otlp"], keep=2)
+        ids.append(recorder.run_id)
+        time.sleep(0.01)
+    assert sorted(p.name for p in runs_dir.iterdir()) == sorted(
+        f"{run_id}{suffix}" for run_id in ids[2:]
+        for suffix in (".json", ".trace.json", ".otlp.json")
+    )
+
+def test_chrome_trace_lanes_and_compare_runs():
+    """Test that overlapping steps get separate lanes and regressions are found."""
+    def step(name, start, end, cache=None):
+        return {"name": name, "stage": "build", "start": start, "end": end,
+                "duration": end - start, "status": "success", "exit_code": 0,
+                "cache": cache, "worker": None, "cpu_user": 0.0, "cpu_system": 0.0,
+                "max_rss_kb": 0}
+    baseline = {"run_id": "a", "start": 0.0, "end": 4.0, "status": "success",
+                "steps": [step("a", 0.0, 2.0), step("b", 1.0, 2.0), step("c", 2.0, 4.0)]}
+    current = {"run_id": "b", "start": 0.0, "end": 6.0, "status": "success",
+               "steps": [step("a", 0.0, 3.0), step("b", 1.0, 2.05), step("c", 2.0, 2.1, "hit")]}
+
+    lanes = {e["name"]: e["tid"] for e in chrome_trace(baseline)["traceEvents"] if e["ph"] == "X"}
+    assert lanes["a"] != lanes["b"] and lanes["c"] == lanes["a"]
+    assert otlp_spans(baseline)["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["name"] == "pipeline"
+
+    regressions = compare_runs(baseline, current)
+    assert [r["name"] for r in regressions] == ["a"]
+    assert regressions[0]["change"] == pytest.approx(0.5)
+
+@pytest.mark.asyncio
+async def test_script_worker_pool_isolation_and_recycling(tmp_path):
+    """Test fresh namespaces, restored state, recycling and crash recovery."""
+    (tmp_path / "helper.py").write_text("counter = 0\n")
+    (tmp_path / "step.py").write_text(
+        "import os, sys, helper\n"
+        "helper.counter += 1\n"
+        "print('args', sys.argv[1:], 'counter', helper.counter, 'cwd', os.getcwd())\n"
+        "os.environ['LEAKED'] = '1'\n"
+        "sys.exit(int(sys.argv[1]))\n"
+    )
+    (tmp_path / "crash.py").write_text("import os\nos._exit(7)\n")
+    forkserver = multiprocessing.forkserver._forkserver
+    preload = getattr(forkserver, "_preload_modules", None)
+    pool = ScriptWorkerPool(size=1, preload=["json"], max_jobs=2)
+    # Process-wide forkserver settings stay untouched
+    assert getattr(forkserver, "_preload_modules", None) == preload
+    try:
+        log = tmp_path / "logs" / "step.log"
+        first = await pool.run(tmp_path / "step.py", ["0"], cwd=tmp_path, log_path=log)
+        assert first.success
+        assert f"args ['0'] counter 1 cwd {tmp_path}" in first.tail()
+
+        second = await pool.run(tmp_path / "step.py", ["3"], cwd=tmp_path, log_path=log)
+        assert second.exit_code == 3
+        assert "counter 1" in second.tail()  # helper was re-imported
+        assert second.worker_pid == first.worker_pid
+        assert "LEAKED" not in os.environ
+
+        third = await pool.run(tmp_path / "step.py", ["0"], cwd=tmp_path)
+        assert third.worker_pid != first.worker_pid
+        assert pool.stats["recycled"] == 1
+
+        crashed = await pool.run(tmp_path / "crash.py", cwd=tmp_path)
+        assert crashed.exit_code == 7
+        assert (await pool.run(tmp_path / "step.py", ["0"], cwd=tmp_path)).success
+        assert pool.stats["crashed"] == 1
+    finally:
+        await pool.close()
+
+@pytest.mark.asyncio
+async def test_script_steps_run_in_worker_pool(cicd, tmp_path):
+    """Test that script steps really run and report failures."""
+    (tmp_path / "ok.py").write_text(
+        "import pathlib\npathlib.Path('made.txt').write_text('yes')\n"
+        "sum(i * i for i in range(300000))\n"
+    )
+    (tmp_path / "bad.py").write_text("raise RuntimeError('boom')\n")
+    cicd.config = {"build_steps": [{"name": "ok", "script": "ok.py"}],
+                   "deploy_steps": [{"name": "bad", "script": "bad.py"}]}
+
+    assert not await cicd.run_pipeline()
+    assert (tmp_path / "made.txt").read_text() == "yes"
+    # Measured inside the pooled worker, which is never reaped
+    ok = next(s for s in cicd.run_recorder.to_dict()["steps"] if s["name"] == "ok")
+    assert ok["cpu_user"] + ok["cpu_system"] > 0
+    assert "RuntimeError: boom" in cicd.step_logs["bad"].read_text()
+    assert cicd.script_pool is None